@@ -4,7 +4,22 @@ from pathlib import Path
 import json
 import os
 import tempfile
-from load_data import DEFAULT_CLASSES, load_and_normalize, load_tail_and_normalize
+from pandas.tseries.frequencies import to_offset
+from load_data import (DEFAULT_CLASSES, BinaryStatsCursor, StatsCursor, find_offset_since, is_binary_stats,
+                       last_timestamp, load_and_normalize, load_binary_and_normalize,
+                       load_tail_and_normalize)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow / Parquet cần pyarrow, thiếu thì chỉ ghi được CSV / JSON
+    pa = pq = None
+
+# "arrow": Arrow IPC stream, backend memory-map đọc thẳng (app/services/traffic_services/processed.py)
+EXPORT_FORMATS = ("arrow",) if pa is not None else ("csv", "json")
+# File arrow được nối thêm batch ở chế độ append; quá số batch này thì ghi lại nguyên file
+ARROW_MAX_APPENDS = 256
+_arrow_appends = {}
 
 def load_recent_stats(stats_path, minutes=60, classes=None, tail_lines: int = None):
     classes = classes or DEFAULT_CLASSES
@@ -12,6 +27,11 @@ def load_recent_stats(stats_path, minutes=60, classes=None, tail_lines: int = No
     try:
         if tail_lines is not None:
             df = load_tail_and_normalize(stats_path, n=tail_lines, classes=classes)
+        elif is_binary_stats(stats_path):
+            # Log nhị phân: chỉ copy phần record trong cửa sổ ra khỏi memmap
+            last_ts = last_timestamp(stats_path)
+            since_ts = last_ts - buffer_minutes * 60 if last_ts is not None else None
+            df = load_binary_and_normalize(stats_path, classes=classes, since_ts=since_ts)
         else:
             df = load_and_normalize(stats_path, classes=classes)
     except Exception as e:
@@ -73,27 +93,126 @@ def detect_peaks(agg_df: pd.DataFrame, window: int = 5, threshold: int = None):
         df["is_peak_thr"] = False
     return df
 
-def export_for_backend(agg_df: pd.DataFrame, out_dir: str = "data/processed"):
-    p = Path(out_dir)
-    p.mkdir(parents=True, exist_ok=True)
-    csv_path = p / "traffic_data.csv"
-    json_path = p / "traffic_data.json"
-    
-    df = agg_df.copy().reset_index()
-    if "timestamp" in df.columns:
-        df["time"] = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-        df = df.drop(columns=["timestamp"])
-    df.to_csv(csv_path, index=False)
-    records = df.to_dict(orient="records")
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=str(p))
+def export_schema(classes: list = None):
+    """Schema cố định của traffic_data.arrow / .parquet: thiếu cột thì ghi 0 / False, không đổi kiểu."""
+    classes = classes or DEFAULT_CLASSES
+    fields = [pa.field("timestamp", pa.timestamp("ns", tz="UTC"), nullable=False)]
+    fields += [pa.field(c, pa.int64()) for c in classes + ["total"]]
+    fields += [pa.field(c + "_pct", pa.float64()) for c in classes]
+    fields += [pa.field("is_peak_auto", pa.bool_()), pa.field("is_peak_thr", pa.bool_())]
+    return pa.schema(fields, metadata={"classes": ",".join(classes), "version": "1"})
+
+def _arrow_table(df: pd.DataFrame, classes: list):
+    schema = export_schema(classes)
+    ts = pd.DatetimeIndex(df["timestamp"] if "timestamp" in df.columns else df.index)
+    ts = (ts.tz_localize("UTC") if ts.tz is None else ts.tz_convert("UTC")).as_unit("ns")
+    arrays = [pa.array(ts, type=schema.field("timestamp").type)]
+    for field in list(schema)[1:]:
+        dtype = field.type.to_pandas_dtype()
+        if field.name in df.columns:
+            values = df[field.name].fillna(0).to_numpy(dtype=dtype)
+        else:
+            values = np.zeros(len(df), dtype=dtype)
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def _atomic_write(path: Path, write):
+    tmp_fd, tmp_path = tempfile.mkstemp(suffix=path.suffix + ".tmp", dir=str(path.parent))
+    os.close(tmp_fd)
     try:
-        with os.fdopen(tmp_fd, "w", encoding="utf-8") as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
-        os.replace(tmp_path, str(json_path))
+        write(tmp_path)
+        os.replace(tmp_path, str(path))
     except Exception:
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
-    return str(csv_path), str(json_path)
+        raise
+
+def _write_ipc_messages(f, table, schema: bool):
+    # Ghi từng message IPC, không ghi EOS để lần sau nối thêm batch vào cuối file được
+    if schema:
+        f.write(table.schema.serialize())
+    for batch in table.to_batches():
+        f.write(batch.serialize())
+
+def _arrow_schema_of(path: Path):
+    try:
+        with pa.OSFile(str(path), "rb") as f:
+            return pa.ipc.open_stream(f).schema
+    except Exception:
+        return None
+
+def write_arrow(table, path: Path, append: bool = False):
+    """
+    Ghi traffic_data.arrow (Arrow IPC stream, không nén để memory-map được).
+    append=False: ghi cả bảng ra file tạm rồi os.replace (atomic).
+    append=True : chỉ nối các batch của `table` vào cuối file (dòng trùng timestamp thì dòng sau thắng,
+    bên đọc giữ bản cuối); file lạ schema / nối quá ARROW_MAX_APPENDS lần thì phải ghi lại cả bảng.
+    """
+    key = str(path)
+    if append and path.exists() and _arrow_appends.get(key, ARROW_MAX_APPENDS) < ARROW_MAX_APPENDS \
+            and _arrow_schema_of(path) == table.schema:
+        with open(path, "ab") as f:
+            _write_ipc_messages(f, table, schema=False)
+        _arrow_appends[key] += 1
+        return True
+    if append:
+        return False
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            _write_ipc_messages(f, table, schema=True)
+    _atomic_write(path, write)
+    _arrow_appends[key] = 0
+    return True
+
+def export_for_backend(agg_df: pd.DataFrame, out_dir: str = "data/processed", formats: tuple = None,
+                       classes: list = None, changed: list = None) -> dict:
+    """
+    Ghi kết quả phân tích cho backend -> {format: path}. Mọi file đều ghi atomic (file tạm + os.replace).
+    - arrow  : traffic_data.arrow; `changed` (vị trí các dòng mới / vừa tính lại) -> chỉ nối các dòng đó.
+    - parquet: traffic_data.parquet (zstd), luôn ghi lại cả bảng.
+    - csv / json: như cũ (JSON không còn indent).
+    """
+    formats = formats or EXPORT_FORMATS
+    classes = classes or [c[:-4] for c in agg_df.columns if c.endswith("_pct")] or DEFAULT_CLASSES
+    p = Path(out_dir)
+    p.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    if pa is None and {"arrow", "parquet"} & set(formats):
+        raise ImportError("Cần pyarrow để ghi arrow / parquet")
+
+    if "arrow" in formats:
+        path = p / "traffic_data.arrow"
+        appended = False
+        if changed is not None:
+            appended = write_arrow(_arrow_table(agg_df.iloc[list(changed)], classes), path, append=True)
+        if not appended:
+            write_arrow(_arrow_table(agg_df, classes), path)
+        paths["arrow"] = str(path)
+    if "parquet" in formats:
+        path = p / "traffic_data.parquet"
+        table = _arrow_table(agg_df, classes)
+        _atomic_write(path, lambda tmp: pq.write_table(table, tmp, compression="zstd"))
+        paths["parquet"] = str(path)
+    if "csv" in formats or "json" in formats:
+        df = agg_df.copy().reset_index()
+        if "timestamp" in df.columns:
+            df["time"] = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+            df = df.drop(columns=["timestamp"])
+        if "csv" in formats:
+            path = p / "traffic_data.csv"
+            _atomic_write(path, lambda tmp: df.to_csv(tmp, index=False))
+            paths["csv"] = str(path)
+        if "json" in formats:
+            path = p / "traffic_data.json"
+            records = df.to_dict(orient="records")
+
+            def write_json(tmp):
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(records, f, ensure_ascii=False)
+            _atomic_write(path, write_json)
+            paths["json"] = str(path)
+    return paths
 
 def to_json_records(df: pd.DataFrame) -> list:
     if df is None or df.empty:
@@ -110,7 +229,8 @@ def analyze_pipeline_realtime(stats_path: str,
                               agg_freq: str = "5min",
                               peak_window: int = 5,
                               peak_threshold: int = None,
-                              minutes_window: int = 60):
+                              minutes_window: int = 60,
+                              export_formats: tuple = None):
     classes = classes or DEFAULT_CLASSES
     
     df = load_recent_stats(stats_path, minutes=minutes_window, classes=classes)
@@ -123,17 +243,188 @@ def analyze_pipeline_realtime(stats_path: str,
     perc = compute_percentages(agg, classes=classes)
     peak_df = detect_peaks(agg, window=peak_window, threshold=peak_threshold)
     merged = perc.join(peak_df[["is_peak_auto", "is_peak_thr"]], how="left")
-    export_for_backend(merged, out_dir=out_dir)
+    export_for_backend(merged, out_dir=out_dir, formats=export_formats, classes=classes)
     return merged
 
+class IncrementalAnalyzer:
+    """
+    Bản tăng dần của analyze_pipeline_realtime cho vòng lặp realtime.
+    Nhớ offset đã đọc của file stats và max/min theo bucket trong cửa sổ; mỗi chu kỳ chỉ parse dòng
+    mới, cập nhật bucket bị chạm, tính lại flow / % / cờ peak từ bucket sớm nhất bị đổi.
+    Chi phí mỗi chu kỳ theo số dòng mới + số bucket trong cửa sổ, không theo độ dài file.
+    Kết quả giống analyze_pipeline_realtime, trừ dòng đầu cửa sổ: bản đầy đủ ước lượng flow x1.25
+    khi bucket trước bị cắt, ở đây dùng max thật của bucket trước.
+    Export arrow: lần đầu ghi cả cửa sổ, sau đó chỉ nối các bucket vừa tính lại (export_for_backend(changed=...)).
+    """
+
+    def __init__(self, stats_path: str,
+                 out_dir: str = "data/processed",
+                 classes: list = None,
+                 agg_freq: str = "5min",
+                 peak_window: int = 5,
+                 peak_threshold: int = None,
+                 minutes_window: int = 60,
+                 export: bool = True,
+                 export_formats: tuple = None):
+        self.stats_path = stats_path
+        self.out_dir = out_dir
+        self.classes = classes or DEFAULT_CLASSES
+        self.step = int(to_offset(agg_freq).nanos // 1_000_000_000)
+        self.peak_window = peak_window
+        self.peak_threshold = peak_threshold
+        self.minutes_window = minutes_window
+        self.export = export
+        self.export_formats = export_formats
+        self.cursor = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self.buckets = {}  # epoch bucket -> np.array([max theo lớp, min theo lớp])
+        self.origin = None  # bucket đầu tiên đọc được (flow ước lượng như aggregate_timeseries)
+        self.dirty_from = None
+        self.agg = pd.DataFrame()
+        self.changed = None  # vị trí các dòng vừa tính lại ở lần _refresh gần nhất
+        self.exported = False
+
+    def _open_cursor(self):
+        # Lần đầu: bỏ qua phần file cũ hơn cửa sổ (+5 phút như load_recent_stats)
+        last_ts = last_timestamp(self.stats_path)
+        since_ts = last_ts - (self.minutes_window + 5) * 60 if last_ts is not None else None
+        if is_binary_stats(self.stats_path):
+            self.cursor = BinaryStatsCursor(self.stats_path, since_ts=since_ts)
+            return
+        offset = find_offset_since(self.stats_path, since_ts) if since_ts is not None else 0
+        self.cursor = StatsCursor(self.stats_path, offset=offset)
+
+    def _ingest(self, df):
+        df = df[df["ts"].notna()] if "ts" in df.columns else df.iloc[0:0]
+        if df.empty:
+            return
+        keys = (np.floor(df["ts"].to_numpy(dtype=float) / self.step) * self.step).astype(np.int64)
+        grouped = df[self.classes].groupby(keys)
+        maxs, mins = grouped.max(), grouped.min()
+        for b, hi, lo in zip(maxs.index.tolist(), maxs.to_numpy(), mins.to_numpy()):
+            cur = self.buckets.get(b)
+            if cur is None:
+                self.buckets[b] = np.vstack([hi, lo])
+            else:
+                np.maximum(cur[0], hi, out=cur[0])
+                np.minimum(cur[1], lo, out=cur[1])
+        first = int(maxs.index.min())
+        if self.origin is None or first < self.origin:
+            self.origin = first
+        self.dirty_from = first if self.dirty_from is None else min(self.dirty_from, first)
+
+    def _evict(self, cutoff):
+        # Giữ bucket từ cutoff - step, cộng 1 bucket thật trước đó để ffill / tính diff
+        keys = sorted(self.buckets)
+        older = [k for k in keys if k < cutoff - self.step]
+        for k in older[:-1]:
+            del self.buckets[k]
+
+    def _flows(self, index):
+        """Flow theo lớp cho các bucket `index` (bucket trống = ffill như resample().max().ffill())."""
+        keys = sorted(self.buckets)
+        pos = np.searchsorted(keys, index, side="right") - 1
+        maxs = np.stack([self.buckets[keys[p]][0] for p in pos])
+        prev_pos = np.searchsorted(keys, np.asarray(index) - self.step, side="right") - 1
+        flows = np.zeros_like(maxs)
+        for i, (b, pp) in enumerate(zip(index, prev_pos)):
+            if pp >= 0:
+                flows[i] = maxs[i] - self.buckets[keys[pp]][0]
+            elif b == self.origin:
+                hi, lo = self.buckets[b]
+                flows[i] = np.rint((hi - lo) * 1.25)
+        return np.clip(flows, 0, None)
+
+    def _peak_flags(self, total, rows):
+        auto = np.zeros(len(rows), dtype=bool)
+        for j, i in enumerate(rows):
+            prev = total[max(0, i - self.peak_window):i]
+            if len(prev) >= 2:
+                auto[j] = total[i] > prev.mean() + 3 * prev.std(ddof=1)
+        return auto
+
+    def _refresh(self):
+        last = max(self.buckets)
+        cutoff = last - self.minutes_window * 60
+        self._evict(cutoff)
+        # Giống analyze_pipeline_realtime: bắt đầu từ bucket dữ liệu đầu tiên, cắt ở cutoff
+        start = max(cutoff, self.origin)
+        epochs = np.arange(start, last + self.step, self.step, dtype=np.int64)
+        index = pd.DatetimeIndex(pd.to_datetime(epochs * 1_000_000_000, unit="ns", utc=True), name="timestamp")
+
+        old = self.agg
+        old_start = int(old.index[0].timestamp()) if not old.empty else None
+        old_last = int(old.index[-1].timestamp()) if not old.empty else None
+        recompute_from = self.dirty_from if self.dirty_from is not None else last
+        if old_last is not None:
+            recompute_from = min(recompute_from, old_last + self.step)
+
+        pct_cols = [c + "_pct" for c in self.classes]
+        columns = self.classes + ["total"] + pct_cols + ["is_peak_auto", "is_peak_thr"]
+        agg = old.reindex(index) if not old.empty else pd.DataFrame(index=index, columns=columns)
+        rows = np.flatnonzero(epochs >= recompute_from)
+        if len(rows):
+            flows = self._flows(epochs[rows]).astype(np.int64)
+            total = flows.sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                pct = np.where(total[:, None] > 0, flows / total[:, None] * 100, 0.0).round(2)
+            agg.iloc[rows, :len(self.classes)] = flows
+            agg.iloc[rows, len(self.classes)] = total
+            agg.iloc[rows, len(self.classes) + 1:len(self.classes) + 1 + len(pct_cols)] = pct
+
+        agg[self.classes + ["total"]] = agg[self.classes + ["total"]].astype(np.int64)
+        agg[pct_cols] = agg[pct_cols].astype(float)
+        # Cờ peak: dòng từ recompute_from, và các dòng đầu nếu cửa sổ trượt (rolling bắt đầu lại)
+        peak_rows = set(rows.tolist())
+        if old_start is None or start != old_start:
+            peak_rows.update(range(min(self.peak_window, len(epochs))))
+        peak_rows = sorted(peak_rows)
+        if peak_rows:
+            total_all = agg["total"].to_numpy(dtype=float)
+            agg.iloc[peak_rows, agg.columns.get_loc("is_peak_auto")] = self._peak_flags(total_all, peak_rows)
+            thr = (total_all[peak_rows] > self.peak_threshold) if self.peak_threshold is not None else False
+            agg.iloc[peak_rows, agg.columns.get_loc("is_peak_thr")] = thr
+        agg[["is_peak_auto", "is_peak_thr"]] = agg[["is_peak_auto", "is_peak_thr"]].astype(bool)
+        self.agg = agg
+        self.changed = peak_rows
+        self.dirty_from = None
+
+    def update(self) -> pd.DataFrame:
+        try:
+            if self.cursor is None:
+                self._open_cursor()
+            new = self.cursor.read_frame(classes=self.classes)
+        except Exception as e:
+            print(f"[Load] error reading stats: {e}")
+            return self.agg
+        if self.cursor.reset:
+            self._reset_state()
+        if not new.empty:
+            self._ingest(new)
+        if not self.buckets:
+            return pd.DataFrame()
+        if self.dirty_from is not None or self.agg.empty:
+            self._refresh()
+            if self.export:
+                export_for_backend(self.agg, out_dir=self.out_dir, formats=self.export_formats,
+                                   classes=self.classes, changed=self.changed if self.exported else None)
+                self.exported = True
+        return self.agg
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", default="data/runtime/stats.json")
+    parser.add_argument("--input", default="data/runtime/stats")
     parser.add_argument("--out", default="data/processed")
     parser.add_argument("--freq", default="5min")
     parser.add_argument("--threshold", type=int, default=None)
+    parser.add_argument("--formats", nargs="+", default=None, choices=["arrow", "parquet", "csv", "json"],
+                        help=f"mặc định: {' '.join(EXPORT_FORMATS)}")
     args = parser.parse_args()
     df = analyze_pipeline_realtime(args.input, out_dir=args.out, agg_freq=args.freq, 
-                                   peak_threshold=args.threshold, minutes_window=60)
+                                   peak_threshold=args.threshold, minutes_window=60,
+                                   export_formats=tuple(args.formats) if args.formats else None)
     print(df)
\ No newline at end of file
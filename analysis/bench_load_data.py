@@ -0,0 +1,147 @@
+"""
+Benchmark đọc stats NDJSON: cách cũ (json.loads từng dòng + normalize_records từng record)
+so với parse_stats_lines (orjson theo chunk) + normalize_records dựng theo cột.
+
+Dữ liệu sinh ngẫu nhiên trộn các biến thể: timestamp / time / ts, timestamp dạng chuỗi ISO,
+số đếm trong `counts` hoặc phẳng ở gốc, và một ít dòng hỏng.
+
+    cd analysis
+    python bench_load_data.py --lines 1000000
+"""
+import io
+import os
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from load_data import DEFAULT_CLASSES, _parse_timestamp, normalize_records, read_stats_lines
+
+
+def generate(path, n, iso_ratio, flat_ratio, bad_ratio, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = 1.7e9 + np.cumsum(rng.uniform(0.5, 2.0, size=n))
+    counts = rng.poisson(0.3, size=(n, len(DEFAULT_CLASSES))).cumsum(axis=0)
+    kind = rng.random(n)
+    key = rng.choice(["timestamp", "time", "ts"], size=n, p=[0.8, 0.1, 0.1])
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            if kind[i] < bad_ratio:
+                f.write('{"timestamp": 1700000000, "counts": {"car": \n')
+                continue
+            t = ts[i]
+            rec: Dict[str, Any] = {key[i]: pd.Timestamp(t, unit="s", tz="UTC").isoformat()
+                                   if kind[i] < bad_ratio + iso_ratio else round(float(t), 3)}
+            cnt = {c: int(v) for c, v in zip(DEFAULT_CLASSES, counts[i])}
+            if kind[i] > 1 - flat_ratio:
+                rec.update(cnt)
+            else:
+                rec["counts"] = cnt
+            rec["fps"] = 25.0
+            rec["total"] = int(counts[i].sum())
+            f.write(json.dumps(rec) + "\n")
+
+
+# ---- Cách cũ (trước khi vector hoá), giữ lại để so sánh ----
+
+def read_stats_lines_rowwise(path: str) -> List[Dict[str, Any]]:
+    raws = []
+    with open(path, "r", encoding="utf-8") as f:
+        for ln in f:
+            ln = ln.strip()
+            if not ln:
+                continue
+            try:
+                raws.append(json.loads(ln))
+            except Exception:
+                pass
+    return raws
+
+
+def normalize_records_rowwise(raws: List[Dict[str, Any]], classes: List[str] = None) -> pd.DataFrame:
+    classes = classes or DEFAULT_CLASSES
+    rows = []
+    for r in raws:
+        candidate = r.get('timestamp', r.get('time', r.get('ts', None)))
+        ts_val = _parse_timestamp(candidate)
+        counts = r.get('counts') or {}
+        total = r.get('total')
+        row: Dict[str, Any] = {"ts": ts_val}
+        for c in classes:
+            try:
+                row[c] = int(counts.get(c, 0))
+            except Exception:
+                try:
+                    row[c] = int(r.get(c, 0))
+                except Exception:
+                    row[c] = 0
+        if total is None:
+            try:
+                row['total'] = sum(int(row[c]) for c in classes)
+            except Exception:
+                row['total'] = None
+        else:
+            try:
+                row['total'] = int(total)
+            except Exception:
+                row['total'] = None
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    if 'ts' in df.columns:
+        df = df.sort_values(by='ts', na_position='last').reset_index(drop=True)
+    for c in classes:
+        if c not in df.columns:
+            df[c] = 0
+        df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0).astype(int)
+    df['timestamp'] = pd.to_datetime(df['ts'], unit='s', utc=True)
+    df['total'] = pd.to_numeric(df['total'], errors='coerce').fillna(0).astype(int)
+    return df
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--iso", type=float, default=0.05, help="tỉ lệ dòng có timestamp dạng chuỗi ISO")
+    parser.add_argument("--flat", type=float, default=0.1, help="tỉ lệ dòng có số đếm phẳng (không có `counts`)")
+    parser.add_argument("--bad", type=float, default=0.001, help="tỉ lệ dòng hỏng")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "stats.json")
+    print(f"Sinh {args.lines} dòng vào {path}")
+    generate(path, args.lines, args.iso, args.flat, args.bad)
+    print(f"  {os.path.getsize(path) / 1e6:.1f} MB")
+
+    raws_old, t_parse_old = timed(read_stats_lines_rowwise, path)
+    df_old, t_norm_old = timed(normalize_records_rowwise, raws_old)
+    del raws_old
+    with contextlib.redirect_stdout(io.StringIO()):  # bỏ các dòng Warning của dòng hỏng
+        raws_new, t_parse_new = timed(read_stats_lines, path)
+    df_new, t_norm_new = timed(normalize_records, raws_new)
+
+    print(f"{'':>10} {'parse (s)':>10} {'normalize (s)':>14} {'tổng (s)':>10} {'dòng':>9}")
+    print(f"{'cũ':>10} {t_parse_old:10.2f} {t_norm_old:14.2f} {t_parse_old + t_norm_old:10.2f} {len(df_old):9d}")
+    print(f"{'mới':>10} {t_parse_new:10.2f} {t_norm_new:14.2f} {t_parse_new + t_norm_new:10.2f} {len(df_new):9d}")
+    print(f"Nhanh hơn {(t_parse_old + t_norm_old) / (t_parse_new + t_norm_new):.1f}x")
+
+    # Cách cũ bỏ qua số đếm phẳng (đọc ra 0), nên chỉ so ts / total và các dòng có `counts`
+    same_ts = np.allclose(df_old["ts"], df_new["ts"], equal_nan=True)
+    same_total = df_old["total"].equals(df_new["total"])
+    nested = (df_old[DEFAULT_CLASSES].sum(axis=1) > 0).to_numpy()
+    same_counts = df_old.loc[nested, DEFAULT_CLASSES].equals(df_new.loc[nested, DEFAULT_CLASSES])
+    print(f"Khớp cách cũ: ts={same_ts} total={same_total} counts={same_counts}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+live_dashboard.py: 9 biểu đồ của visualize.py trên 1 figure cho chế độ realtime, vẽ lại bằng blitting.
+
+Artist (line, bar, wedge, scatter, boxplot) được tạo 1 lần với animated=True; mỗi chu kỳ chỉ đổi dữ liệu
+(set_data / set_height / set_offsets ...), rồi với từng biểu đồ có dữ liệu đổi: dán lại nền đã cache,
+vẽ các artist của nó và blit riêng vùng axes đó.
+Chỉ vẽ lại toàn bộ figure (và cache lại nền) khi trục phải đổi: nhãn thời gian trượt sang bucket mới
+hoặc giá trị vượt giới hạn trục y (giới hạn nới thêm HEADROOM để không phải đổi thường xuyên).
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.cbook import boxplot_stats
+from matplotlib.patches import Wedge
+
+from visualize import prepare_time_index
+
+CHARTS = ["line", "grouped", "area", "pie", "hist", "box", "roll", "peak", "stack"]
+HEADROOM = 1.3
+BOX_HALF_WIDTH = 0.25
+
+
+def _nice_top(value):
+    return max(1.0, float(value) * HEADROOM)
+
+
+class LiveDashboard:
+    def __init__(self, classes, rolling_window=5, hist_bins=20, pie_percent_threshold=3.0):
+        self.classes = list(classes)
+        self.rolling_window = rolling_window
+        self.hist_bins = hist_bins
+        self.pie_percent_threshold = pie_percent_threshold
+        self.fig, axes = plt.subplots(3, 3, figsize=(20, 12))
+        self.axes = dict(zip(CHARTS, axes.ravel()))
+        self.colors = [plt.rcParams["axes.prop_cycle"].by_key()["color"][i % 10] for i in range(len(self.classes))]
+        self.capacity = 0      # số bucket tối đa artist đã tạo
+        self.layout = None     # (nhãn trục x, giới hạn trục) của lần vẽ toàn bộ gần nhất
+        self.limits = {}
+        self.artists = {}
+        self.backgrounds = {}
+        self.signatures = {}
+        self.full_draws = 0
+        self.blits = 0
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+
+    # ---- Tạo artist ----
+    def _build(self, capacity):
+        self.capacity = capacity
+        x = np.arange(capacity)
+        zeros = np.zeros(capacity)
+        k = len(self.classes)
+        for ax in self.axes.values():
+            ax.clear()
+        art = {key: [] for key in CHARTS}
+
+        ax = self.axes["line"]
+        self.lines = [ax.plot(x, zeros, label=c, color=col, animated=True)[0] for c, col in zip(self.classes, self.colors)]
+        art["line"] = list(self.lines)
+        ax.legend(loc="upper left")
+
+        ax = self.axes["grouped"]
+        width = 0.8 / k
+        self.grouped = [ax.bar(x + (i - (k - 1) / 2) * width, zeros, width, color=col, label=c, animated=True)
+                        for i, (c, col) in enumerate(zip(self.classes, self.colors))]
+        art["grouped"] = [p for bars in self.grouped for p in bars]
+        ax.legend(loc="upper left")
+
+        ax = self.axes["area"]
+        self.area = [ax.fill_between(x, zeros, zeros, color=col, alpha=0.7, linewidth=0, label=c, animated=True)
+                     for c, col in zip(self.classes, self.colors)]
+        art["area"] = list(self.area)
+        ax.legend(loc="upper left")
+
+        ax = self.axes["pie"]
+        self.wedges = [ax.add_patch(Wedge((0, 0), 1, 0, 0, facecolor=col, edgecolor="white", linewidth=1, animated=True))
+                       for col in self.colors]
+        self.pie_texts = [ax.text(0, 0, "", ha="center", va="center", color="white", weight="bold", animated=True)
+                          for _ in self.classes]
+        self.pie_legend = ax.legend(self.wedges, self.classes, title="Loại xe", loc="center right")
+        self.pie_legend.set_animated(True)
+        ax.set_xlim(-1.1, 2.9)
+        ax.set_ylim(-1.1, 1.1)
+        ax.set_aspect("equal")
+        ax.axis("off")
+        art["pie"] = self.wedges + self.pie_texts + [self.pie_legend]
+
+        ax = self.axes["hist"]
+        self.hist = ax.bar(np.arange(self.hist_bins), np.zeros(self.hist_bins), width=1.0, align="edge",
+                           edgecolor="white", linewidth=0.5, alpha=0.95, animated=True)
+        art["hist"] = list(self.hist)
+
+        ax = self.axes["box"]
+        self.box = ax.boxplot([np.zeros(1)] * k, tick_labels=self.classes, widths=2 * BOX_HALF_WIDTH)
+        for lines in self.box.values():
+            for ln in lines:
+                ln.set_animated(True)
+        art["box"] = [ln for lines in self.box.values() for ln in lines]
+
+        ax = self.axes["roll"]
+        self.roll = [ax.plot(x, zeros, label=c, color=col, animated=True)[0] for c, col in zip(self.classes, self.colors)]
+        art["roll"] = list(self.roll)
+        ax.legend(loc="upper left")
+
+        ax = self.axes["peak"]
+        self.peak_line = ax.plot(x, zeros, label="Total Traffic", animated=True)[0]
+        self.peak_scatter = ax.scatter([], [], color="red", s=50, zorder=5, label="Auto Peak Detected", animated=True)
+        art["peak"] = [self.peak_line, self.peak_scatter]
+        ax.legend(loc="upper left")
+
+        ax = self.axes["stack"]
+        self.stack = [ax.bar(x, zeros, 0.8, color=col, label=c, animated=True) for c, col in zip(self.classes, self.colors)]
+        art["stack"] = [p for bars in self.stack for p in bars]
+        ax.legend(loc="upper left")
+
+        # Legend vẽ sau cùng, nếu để trong nền thì bị bar / vùng area đè lên
+        for key, ax in self.axes.items():
+            legend = ax.get_legend()
+            if legend is not None and legend not in art[key]:
+                legend.set_animated(True)
+                art[key].append(legend)
+        self.artists = art
+        self.layout = None
+
+    def _apply_layout(self, labels, limits):
+        n = len(labels)
+        step = max(1, n // 12)
+        ticks = np.arange(0, n, step)
+        for key in ("line", "grouped", "area", "roll", "peak", "stack"):
+            ax = self.axes[key]
+            ax.set_xlim(-0.5, n - 0.5)
+            ax.set_xticks(ticks)
+            ax.set_xticklabels([labels[i] for i in ticks], rotation=45, ha="right")
+            ax.set_ylim(0, limits.get(key, 100.0))
+        self.axes["hist"].set_xlim(0, self.hist_bins)
+        edges = np.linspace(0, limits["hist_x"], self.hist_bins + 1)
+        hticks = np.arange(0, self.hist_bins + 1, 4)
+        self.axes["hist"].set_xticks(hticks)
+        self.axes["hist"].set_xticklabels([f"{edges[i]:.0f}" for i in hticks])
+        self.axes["hist"].set_ylim(0, limits["hist"])
+        self.axes["box"].set_ylim(0, limits["box"])
+        titles = {
+            "line": ("Line Chart - Vehicle counts over time", "Time", "Count"),
+            "grouped": ("Grouped Bar - Per 5 Minutes", "Time", "Count"),
+            "area": ("Area Chart - Vehicle counts", "", ""),
+            "pie": ("Vehicle Type Distribution", "", ""),
+            "hist": ("Histogram - Total vehicle counts", "Total", ""),
+            "box": ("Boxplot - Distribution per vehicle type", "Vehicle", "Count"),
+            "roll": (f"Rolling average (window={self.rolling_window})", "", ""),
+            "peak": ("Total Traffic Over Time with Peak Detection", "Time", "Total Count"),
+            "stack": ("100% Stacked Bar - Percentage Composition Over Time", "Time", "Percentage (%)"),
+        }
+        for key, (title, xlabel, ylabel) in titles.items():
+            self.axes[key].set_title(title)
+            self.axes[key].set_xlabel(xlabel)
+            self.axes[key].set_ylabel(ylabel)
+        self.fig.tight_layout()
+        self.layout = (labels, tuple(sorted(limits.items())))
+        self.limits = limits
+
+    # ---- Cập nhật dữ liệu ----
+    def _set_data(self, counts, total, pct, rolling, peaks, hist_x):
+        n, cap = len(total), self.capacity
+        x = np.arange(n)
+        hide = np.zeros(cap - n)
+        for i, ln in enumerate(self.lines):
+            ln.set_data(x, counts[:, i])
+        for i, bars in enumerate(self.grouped):
+            for bar, h in zip(bars, np.concatenate([counts[:, i], hide])):
+                bar.set_height(h)
+        bottom = np.zeros(n)
+        for i, poly in enumerate(self.area):
+            top = bottom + counts[:, i]
+            poly.set_verts([np.column_stack([np.concatenate([x, x[::-1]]), np.concatenate([top, bottom[::-1]])])])
+            bottom = top
+        for i, ln in enumerate(self.roll):
+            ln.set_data(x, rolling[:, i])
+        self.peak_line.set_data(x, total)
+        self.peak_scatter.set_offsets(np.column_stack([x[peaks], total[peaks]]) if peaks.any() else np.empty((0, 2)))
+        bottom = np.zeros(cap)
+        for i, bars in enumerate(self.stack):
+            heights = np.concatenate([pct[:, i], hide])
+            for bar, h, b in zip(bars, heights, bottom):
+                bar.set_height(h)
+                bar.set_y(b)
+            bottom = bottom + heights
+
+        hist, _ = np.histogram(total, bins=self.hist_bins, range=(0, hist_x))
+        for bar, h in zip(self.hist, hist):
+            bar.set_height(h)
+
+        sums = counts.sum(axis=0)
+        grand = sums.sum()
+        theta = 90.0
+        for i, (wedge, text) in enumerate(zip(self.wedges, self.pie_texts)):
+            share = sums[i] / grand if grand > 0 else 0.0
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + 360.0 * share)
+            mid = np.deg2rad(theta + 180.0 * share)
+            text.set_position((0.6 * np.cos(mid), 0.6 * np.sin(mid)))
+            text.set_text(f"{share * 100:.1f}%" if share * 100 >= self.pie_percent_threshold else "")
+            self.pie_legend.get_texts()[i].set_text(f"{self.classes[i]}: {int(sums[i])} ({share * 100:.1f}%)")
+            theta += 360.0 * share
+
+        for i in range(len(self.classes)):
+            st = boxplot_stats(counts[:, i])[0]
+            pos = i + 1
+            w = BOX_HALF_WIDTH
+            self.box["boxes"][i].set_data([pos - w, pos + w, pos + w, pos - w, pos - w],
+                                          [st["q1"], st["q1"], st["q3"], st["q3"], st["q1"]])
+            self.box["medians"][i].set_data([pos - w, pos + w], [st["med"], st["med"]])
+            self.box["whiskers"][2 * i].set_data([pos, pos], [st["q1"], st["whislo"]])
+            self.box["whiskers"][2 * i + 1].set_data([pos, pos], [st["q3"], st["whishi"]])
+            self.box["caps"][2 * i].set_data([pos - w / 2, pos + w / 2], [st["whislo"]] * 2)
+            self.box["caps"][2 * i + 1].set_data([pos - w / 2, pos + w / 2], [st["whishi"]] * 2)
+            self.box["fliers"][i].set_data([pos] * len(st["fliers"]), st["fliers"])
+
+    def _limits(self, counts, total, rolling, fresh):
+        """Giới hạn trục hiện tại nếu còn đủ, không thì nới thêm HEADROOM; `fresh`: tính lại từ đầu (cho trục co lại)."""
+        need = {
+            "line": counts.max(initial=0),
+            "grouped": counts.max(initial=0),
+            "area": total.max(initial=0),
+            "box": counts.max(initial=0),
+            "roll": np.nanmax(rolling, initial=0),
+            "peak": total.max(initial=0),
+            "hist_x": total.max(initial=0) + 1,
+            "hist": len(total),
+        }
+        limits = {} if fresh else dict(self.limits)
+        for key, value in need.items():
+            if key not in limits or value > limits[key]:
+                limits[key] = _nice_top(value)
+        limits["stack"] = 100.0
+        return limits
+
+    def update(self, df):
+        """Vẽ DataFrame kết quả phân tích (như analyze_pipeline_realtime / IncrementalAnalyzer.update)."""
+        d = prepare_time_index(df)
+        n = len(d)
+        if n == 0:
+            return
+        if n > self.capacity:
+            self._build(max(n, 2 * self.capacity))
+        counts = d[self.classes].to_numpy(dtype=float)
+        total = d["total"].to_numpy(dtype=float) if "total" in d.columns else counts.sum(axis=1)
+        pct_cols = [c + "_pct" for c in self.classes]
+        pct = d[pct_cols].to_numpy(dtype=float) if all(c in d.columns for c in pct_cols) else np.zeros_like(counts)
+        rolling = d[self.classes].rolling(window=self.rolling_window).mean().to_numpy(dtype=float)
+        peaks = d["is_peak_auto"].to_numpy(dtype=bool) if "is_peak_auto" in d.columns else np.zeros(n, dtype=bool)
+
+        labels = tuple(d.index.strftime("%H:%M"))
+        # Cửa sổ trượt sang bucket mới thì dù sao cũng vẽ lại toàn bộ: tính lại giới hạn để trục co lại được
+        fresh = self.layout is None or self.layout[0] != labels
+        limits = self._limits(counts, total, rolling, fresh)
+        self._set_data(counts, total, pct, rolling, peaks, limits["hist_x"])
+
+        inputs = {
+            "line": (counts,), "grouped": (counts,), "area": (counts,), "pie": (counts,),
+            "hist": (total,), "box": (counts,), "roll": (rolling,), "peak": (total, peaks), "stack": (pct,),
+        }
+        signatures = {k: hash(tuple(a.tobytes() for a in v)) for k, v in inputs.items()}
+        changed = [k for k in CHARTS if signatures[k] != self.signatures.get(k)]
+        self.signatures = signatures
+
+        canvas = self.fig.canvas
+        if self.layout != (labels, tuple(sorted(limits.items()))) or not self.backgrounds:
+            # Trục đổi: vẽ lại toàn bộ, _on_draw cache nền mới và vẽ artist lên
+            self._apply_layout(labels, limits)
+            canvas.draw()
+            self.full_draws += 1
+        elif changed:
+            for key in changed:
+                canvas.restore_region(self.backgrounds[key])
+                self._draw_artists(key)
+                canvas.blit(self.axes[key].bbox)
+            self.blits += 1
+        canvas.flush_events()
+
+    # ---- Blitting ----
+    def _draw_artists(self, key):
+        ax = self.axes[key]
+        for artist in self.artists[key]:
+            ax.draw_artist(artist)
+
+    def _on_draw(self, event):
+        if not self.artists:
+            return
+        canvas = self.fig.canvas
+        # Nền = axes không có artist animated (trục, lưới, legend tĩnh)
+        self.backgrounds = {key: canvas.copy_from_bbox(ax.bbox) for key, ax in self.axes.items()}
+        for key in CHARTS:
+            self._draw_artists(key)
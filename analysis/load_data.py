@@ -1,27 +1,65 @@
 # load_data.py
+import gc
 import json
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone
 DEFAULT_CLASSES = ["car", "motor", "bus", "truck"]
 
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn, thiếu thì dùng json chuẩn
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+PARSE_CHUNK_LINES = 8192
+
+def _parse_chunk(chunk: List[bytes], warn: bool) -> List[Any]:
+    try:
+        parsed = _json_loads(b"[" + b",".join(chunk) + b"]")
+        if len(parsed) == len(chunk):
+            return parsed
+    except Exception:
+        pass
+    # Chunk có dòng hỏng: chia đôi đến khi đủ nhỏ rồi mới parse từng dòng
+    if len(chunk) > 64:
+        mid = len(chunk) // 2
+        return _parse_chunk(chunk[:mid], warn) + _parse_chunk(chunk[mid:], warn)
+    parsed = []
+    for ln in chunk:
+        try:
+            parsed.append(_json_loads(ln.decode("utf-8", errors="ignore")))
+        except Exception:
+            if warn:
+                print("Warning: không thể parse line:", ln[:200].decode("utf-8", errors="ignore"))
+    return parsed
+
+def parse_stats_lines(lines: List[bytes], warn: bool = False) -> List[Dict[str, Any]]:
+    """
+    Các dòng NDJSON (bytes) -> list dict. Mỗi chunk PARSE_CHUNK_LINES dòng được ghép thành 1 mảng JSON
+    và parse 1 lần; chỉ phần nhỏ chứa dòng hỏng mới parse lại từng dòng (bỏ qua dòng hỏng).
+    """
+    lines = [ln for ln in (ln.strip() for ln in lines) if ln]
+    objs: List[Dict[str, Any]] = []
+    # Tạo hàng triệu dict nhỏ làm GC chạy liên tục (~1/2 thời gian parse), tắt trong lúc parse
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(0, len(lines), PARSE_CHUNK_LINES):
+            parsed = _parse_chunk(lines[i:i + PARSE_CHUNK_LINES], warn)
+            objs.extend(o for o in parsed if isinstance(o, dict))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return objs
+
 def read_stats_lines(path: str) -> List[Dict[str, Any]]:
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"{path} không tồn tại")
-    raws: List[Dict[str, Any]] = []
-    with p.open("r", encoding="utf-8") as f:
-        for ln in f:
-            ln = ln.strip()
-            if not ln:
-                continue
-            try:
-                obj = json.loads(ln)
-                raws.append(obj)
-            except Exception:
-                print("Warning: không thể parse line:", ln[:200])
-    return raws
+    return parse_stats_lines(p.read_bytes().splitlines(), warn=True)
 
 def read_stats_tail(path: str, n: int = 500) -> List[Dict[str, Any]]:
     p = Path(path)
@@ -43,17 +81,103 @@ def read_stats_tail(path: str, n: int = 500) -> List[Dict[str, Any]]:
             lines = data.splitlines()
             if pos == 0:
                 break
-    str_lines = [ln.decode("utf-8", errors="ignore") for ln in lines[-n:]]
-    objs: List[Dict[str, Any]] = []
-    for ln in str_lines:
-        ln = ln.strip()
+    return parse_stats_lines(lines[-n:])
+
+class StatsCursor:
+    """
+    Đọc tăng dần file stats (line-delimited): nhớ byte offset đã đọc, mỗi lần chỉ parse các dòng
+    mới ghi thêm. Dòng cuối chưa có '\n' (đang ghi dở) để lại cho lần sau.
+    File bị cắt ngắn hoặc ghi đè (đầu file khác lần trước) thì đọc lại từ đầu, `reset` = True.
+    """
+
+    HEAD_BYTES = 64
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        self.head = b""
+        self.reset = False
+
+    def _check_rewritten(self, f, size: int) -> bool:
+        if size < self.offset:
+            return True
+        if not self.head:
+            return False
+        f.seek(0)
+        return f.read(len(self.head)) != self.head
+
+    def read_new(self) -> List[Dict[str, Any]]:
+        p = Path(self.path)
+        if not p.exists():
+            raise FileNotFoundError(f"{self.path} không tồn tại")
+        self.reset = False
+        with p.open("rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            if self._check_rewritten(f, size):
+                self.offset = 0
+                self.reset = True
+            if self.offset == 0 or not self.head:
+                f.seek(0)
+                self.head = f.read(min(size, self.HEAD_BYTES))
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = data.rfind(b"\n")
+        if end < 0:
+            return []
+        self.offset += end + 1
+        return parse_stats_lines(data[:end].splitlines())
+
+    def read_frame(self, classes: List[str] = None) -> pd.DataFrame:
+        return normalize_records(self.read_new(), classes=classes)
+
+
+def _line_timestamp(f, pos: int):
+    """(offset đầu dòng, timestamp) của dòng đầu tiên bắt đầu từ `pos` trở đi; (None, None) nếu hết file."""
+    f.seek(pos)
+    if pos > 0:
+        f.readline()
+    while True:
+        start = f.tell()
+        ln = f.readline()
         if not ln:
-            continue
+            return None, None
         try:
-            objs.append(json.loads(ln))
+            obj = json.loads(ln)
         except Exception:
             continue
-    return objs
+        ts = _parse_timestamp(obj.get('timestamp', obj.get('time', obj.get('ts', None))))
+        if ts is not None:
+            return start, ts
+
+
+def find_offset_since(path: str, since_ts: float) -> int:
+    """Offset của dòng đầu tiên có timestamp >= since_ts (file ghi theo thời gian), tìm nhị phân."""
+    with Path(path).open("rb") as f:
+        f.seek(0, 2)
+        size = f.tell()
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, ts = _line_timestamp(f, mid)
+            if start is None or ts >= since_ts:
+                hi = mid
+            else:
+                lo = mid + 1
+        start, _ = _line_timestamp(f, lo)
+        # Không dòng nào >= since_ts: trả về cuối file (lo lúc này có thể nằm giữa dòng cuối)
+        return start if start is not None else size
+
+
+def last_timestamp(path: str) -> Optional[float]:
+    if is_binary_stats(path):
+        return last_binary_timestamp(path)
+    for obj in reversed(read_stats_tail(path, n=5)):
+        ts = _parse_timestamp(obj.get('timestamp', obj.get('time', obj.get('ts', None))))
+        if ts is not None:
+            return ts
+    return None
+
 
 def _parse_timestamp(candidate) -> Optional[float]:
     if candidate is None:
@@ -80,68 +204,245 @@ def _parse_timestamp(candidate) -> Optional[float]:
                 return None
     return None
 
+# Log nhị phân của src/infer.py (định dạng: src/stats_log.py)
+STATS_MAGIC = b"TSTATS01"
+
+def is_binary_stats(path: str) -> bool:
+    p = Path(path)
+    return p.is_dir() or p.suffix == ".bin"
+
+def list_stats_files(path: str) -> List[Path]:
+    """Thư mục log -> các file stats-*.bin theo thứ tự thời gian; 1 file .bin -> [file]."""
+    p = Path(path)
+    if p.is_dir():
+        return sorted(p.glob("stats-*.bin"))
+    if not p.exists():
+        raise FileNotFoundError(f"{path} không tồn tại")
+    return [p]
+
+def _record_dtype(n_classes: int) -> np.dtype:
+    return np.dtype([("ts", "<f8"), ("fps", "<f4"), ("total", "<u4"), ("counts", "<u4", (n_classes,))])
+
+def read_stats_binary(path) -> Tuple[np.ndarray, List[str]]:
+    """
+    (records, classes) của 1 file log nhị phân. `records` là numpy.memmap chỉ đọc (không copy),
+    chỉ gồm các record đủ byte (record đang ghi dở ở cuối bị bỏ qua).
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+        if len(head) < 16 or head[:8] != STATS_MAGIC:
+            raise ValueError(f"{path} không phải stats log nhị phân")
+        header_size, record_size = np.frombuffer(head[8:16], dtype="<u4").tolist()
+        meta = json.loads(f.read(header_size - 16).rstrip(b"\0").decode("utf-8"))
+        f.seek(0, 2)
+        size = f.tell()
+    classes = meta["classes"]
+    dtype = _record_dtype(len(classes))
+    if dtype.itemsize != record_size:
+        raise ValueError(f"{path}: kích thước record không khớp ({record_size} != {dtype.itemsize})")
+    n = max(0, (size - header_size) // record_size)
+    if n == 0:
+        return np.empty(0, dtype=dtype), classes
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(n,)), classes
+
+def binary_records_to_frame(recs: np.ndarray, file_classes: List[str], classes: List[str] = None) -> pd.DataFrame:
+    """Record nhị phân -> DataFrame cùng dạng normalize_records (ts, các lớp, total, timestamp)."""
+    classes = classes or DEFAULT_CLASSES
+    df = pd.DataFrame({"ts": np.asarray(recs["ts"], dtype=float)})
+    counts = recs["counts"]
+    for c in classes:
+        df[c] = counts[:, file_classes.index(c)].astype(int) if c in file_classes else 0
+    df["total"] = np.asarray(recs["total"]).astype(int)
+    df["timestamp"] = pd.to_datetime(df["ts"], unit="s", utc=True)
+    return df
+
+def load_binary_and_normalize(path: str, classes: List[str] = None, since_ts: float = None,
+                              tail: int = None) -> pd.DataFrame:
+    """Đọc log nhị phân (1 file hoặc cả thư mục xoay vòng); chỉ copy phần record >= since_ts / `tail` cuối."""
+    parts = []
+    remaining = tail
+    for f in reversed(list_stats_files(path)):
+        recs, file_classes = read_stats_binary(f)
+        cut = int(np.searchsorted(recs["ts"], since_ts)) if since_ts is not None else 0
+        recs = recs[cut:]
+        if remaining is not None:
+            recs = recs[-remaining:] if remaining > 0 else recs[:0]
+            remaining -= len(recs)
+        if len(recs):
+            parts.append(binary_records_to_frame(recs, file_classes, classes))
+        # File có record cũ hơn since_ts thì các file trước đó cũng cũ hơn
+        if remaining == 0 or cut > 0:
+            break
+    if not parts:
+        return binary_records_to_frame(np.empty(0, dtype=_record_dtype(0)), [], classes)
+    return pd.concat(parts[::-1], ignore_index=True)
+
+def last_binary_timestamp(path: str) -> Optional[float]:
+    for f in reversed(list_stats_files(path)):
+        recs, _ = read_stats_binary(f)
+        if len(recs):
+            return float(recs["ts"][-1])
+    return None
+
+class BinaryStatsCursor:
+    """
+    Tương tự StatsCursor cho log nhị phân: nhớ (file, số record đã đọc), mỗi lần chỉ lấy record mới,
+    tự sang file kế tiếp khi writer xoay file. File bị cắt ngắn thì đọc lại từ đầu, `reset` = True.
+    """
+
+    def __init__(self, path: str, since_ts: float = None):
+        self.path = path
+        self.since_ts = since_ts
+        self.file = None
+        self.index = 0
+        self.reset = False
+
+    def read_frame(self, classes: List[str] = None) -> pd.DataFrame:
+        self.reset = False
+        files = list_stats_files(self.path)
+        if self.file is not None and self.file in files:
+            recs, _ = read_stats_binary(self.file)
+            if len(recs) < self.index:
+                # Đọc lại file này từ đầu (giống StatsCursor), không lọc theo since_ts cũ
+                self.index, self.reset = 0, True
+        if self.file is not None:
+            files = [f for f in files if f >= self.file]
+        parts = []
+        for f in files:
+            recs, file_classes = read_stats_binary(f)
+            if f == self.file:
+                start = self.index
+            elif self.since_ts is not None:
+                start = int(np.searchsorted(recs["ts"], self.since_ts))
+            else:
+                start = 0
+            if len(recs) > start:
+                parts.append(binary_records_to_frame(recs[start:], file_classes, classes))
+            self.file, self.index = f, len(recs)
+        if not parts:
+            return binary_records_to_frame(np.empty(0, dtype=_record_dtype(0)), [], classes)
+        return pd.concat(parts, ignore_index=True)
+
+def _int_or_nan(value) -> float:
+    try:
+        return float(int(value))
+    except (TypeError, ValueError, OverflowError):
+        return np.nan
+
+def _to_int_array(values: List[Any]) -> np.ndarray:
+    """
+    Giống int(v) từng giá trị (float cắt phần lẻ, chuỗi phải là số nguyên), không đọc được -> NaN.
+    Cột toàn số đi đường vector hoá; chỉ cột có chuỗi / None mới xét từng giá trị.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind in "biuf":
+        arr = arr.astype(float)
+        arr[~np.isfinite(arr)] = np.nan
+        return np.trunc(arr)
+    return np.array([_int_or_nan(v) for v in values], dtype=float)
+
+def _timestamps_to_epoch(values: List[Any]) -> np.ndarray:
+    """timestamp số / chuỗi số / chuỗi ngày giờ / pd.Timestamp -> epoch giây (NaN nếu không đọc được)."""
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+    s = pd.Series(values, dtype=object)
+    ts = np.array(pd.to_numeric(s, errors="coerce"), dtype=float)
+    rest = np.isnan(ts) & s.notna().to_numpy()
+    if rest.any():
+        dt = pd.to_datetime(s[rest], utc=True, errors="coerce", format="mixed")
+        ts[rest] = ((dt - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+    return ts
+
 def normalize_records(raws: List[Dict[str, Any]], classes: List[str] = None) -> pd.DataFrame:
+    """
+    list dict -> DataFrame (ts, các lớp, total, timestamp), dựng theo cột.
+    Hỗ trợ các biến thể: timestamp / time / ts; số đếm trong `counts` hoặc phẳng ở gốc record.
+    """
     classes = classes or DEFAULT_CLASSES
-    rows: List[Dict[str, Any]] = []
-    for r in raws:
-        candidate = r.get('timestamp', r.get('time', r.get('ts', None)))
-        ts_val = _parse_timestamp(candidate)
-        counts = r.get('counts') or {}
-        total = r.get('total')
-        row: Dict[str, Any] = {"ts": ts_val}
-        for c in classes:
-            try:
-                row[c] = int(counts.get(c, 0))
-            except Exception:
-                try:
-                    row[c] = int(r.get(c, 0))
-                except Exception:
-                    row[c] = 0
-        if total is None:
-            try:
-                row['total'] = sum(int(row[c]) for c in classes)
-            except Exception:
-                row['total'] = None
-        else:
-            try:
-                row['total'] = int(total)
-            except Exception:
-                row['total'] = None
-        rows.append(row)
-    df = pd.DataFrame(rows)
-    if 'ts' in df.columns:
-        df = df.sort_values(by='ts', na_position='last').reset_index(drop=True)
+    raws = [r for r in raws if isinstance(r, dict)]
+    ts = _timestamps_to_epoch([r.get('timestamp', r.get('time', r.get('ts'))) for r in raws])
+    # Không có `counts` thì số đếm nằm phẳng ở gốc record
+    counts = [r.get('counts') for r in raws]
+    counts = [cnt if isinstance(cnt, dict) else r for cnt, r in zip(counts, raws)]
+    data: Dict[str, Any] = {"ts": ts}
     for c in classes:
-        if c not in df.columns:
-            df[c] = 0
-        df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0).astype(int)
-    if 'ts' in df.columns:
-        try:
-            df['timestamp'] = pd.to_datetime(df['ts'], unit='s', utc=True)
-        except Exception:
-            df['timestamp'] = pd.NaT
-    else:
-        df['timestamp'] = pd.NaT
-    if 'total' in df.columns:
-        df['total'] = pd.to_numeric(df['total'], errors='coerce').fillna(0).astype(int)
-    else:
-        df['total'] = df[classes].sum(axis=1).astype(int)
+        vals = _to_int_array([cnt.get(c, 0) for cnt in counts])
+        bad = np.flatnonzero(np.isnan(vals))
+        if len(bad):
+            # Giá trị trong `counts` không đọc được: dùng trường phẳng cùng tên ở gốc record
+            vals[bad] = _to_int_array([raws[i].get(c, 0) for i in bad])
+        data[c] = np.nan_to_num(vals, nan=0.0).astype(np.int64)
+    class_sum = np.sum([data[c] for c in classes], axis=0, dtype=np.int64) if raws else np.zeros(0, dtype=np.int64)
+    totals = [r.get('total') for r in raws]
+    missing = np.array([t is None for t in totals], dtype=bool)
+    total = np.nan_to_num(_to_int_array(totals), nan=0.0).astype(np.int64)
+    data['total'] = np.where(missing, class_sum, total)
+    df = pd.DataFrame(data)
+    df = df.sort_values(by='ts', na_position='last', kind='stable').reset_index(drop=True)
+    df['timestamp'] = pd.to_datetime(df['ts'], unit='s', utc=True)
     return df
 
 def load_and_normalize(path: str, classes: List[str] = None) -> pd.DataFrame:
+    if is_binary_stats(path):
+        return load_binary_and_normalize(path, classes=classes)
     raws = read_stats_lines(path)
     df = normalize_records(raws, classes=classes)
     return df
 
 def load_tail_and_normalize(path: str, n: int = 500, classes: List[str] = None) -> pd.DataFrame:
+    if is_binary_stats(path):
+        return load_binary_and_normalize(path, classes=classes, tail=n)
     raws = read_stats_tail(path, n=n)
     df = normalize_records(raws, classes=classes)
     return df
 
+def stats_time_range(path: str) -> Tuple[Optional[float], Optional[float]]:
+    """(timestamp đầu, timestamp cuối) của 1 file stats NDJSON / log nhị phân; (None, None) nếu rỗng."""
+    if is_binary_stats(path):
+        first = last = None
+        for f in list_stats_files(path):
+            recs, _ = read_stats_binary(f)
+            if len(recs):
+                first = float(recs["ts"][0]) if first is None else first
+                last = float(recs["ts"][-1])
+        return first, last
+    with Path(path).open("rb") as f:
+        _, first = _line_timestamp(f, 0)
+    return first, last_timestamp(path)
+
+def load_range_and_normalize(path: str, start_ts: float, end_ts: float, classes: List[str] = None) -> pd.DataFrame:
+    """
+    Chỉ đọc các record start_ts <= ts < end_ts (file ghi theo thời gian): log nhị phân cắt bằng
+    searchsorted trên memmap, NDJSON tìm nhị phân byte offset 2 đầu rồi chỉ parse đoạn giữa.
+    """
+    if is_binary_stats(path):
+        parts = []
+        for f in list_stats_files(path):
+            recs, file_classes = read_stats_binary(f)
+            if not len(recs) or recs["ts"][-1] < start_ts or recs["ts"][0] >= end_ts:
+                continue
+            lo, hi = np.searchsorted(recs["ts"], [start_ts, end_ts])
+            if hi > lo:
+                parts.append(binary_records_to_frame(recs[lo:hi], file_classes, classes))
+        if not parts:
+            return binary_records_to_frame(np.empty(0, dtype=_record_dtype(0)), [], classes)
+        return pd.concat(parts, ignore_index=True)
+    lo = find_offset_since(path, start_ts)
+    hi = find_offset_since(path, end_ts)
+    with Path(path).open("rb") as f:
+        f.seek(lo)
+        data = f.read(max(0, hi - lo))
+    df = normalize_records(parse_stats_lines(data.splitlines()), classes=classes)
+    if df.empty:
+        return df
+    return df[(df["ts"] >= start_ts) & (df["ts"] < end_ts)].reset_index(drop=True)
+
 if __name__ == '__main__':
     import argparse
-    parser = argparse.ArgumentParser(description='Load stats.json (line-delimited) -> sample')
-    parser.add_argument('--input', default='data/runtime/stats.json')
+    parser = argparse.ArgumentParser(description='Load stats.json (line-delimited) hoặc log nhị phân (.bin / thư mục) -> sample')
+    parser.add_argument('--input', default='data/runtime/stats')
     parser.add_argument('--tail', type=int, default=None, help='read only last N lines')
     args = parser.parse_args()
     if args.tail:
@@ -1,130 +1,176 @@
 import time
+import hashlib
 import argparse
+from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from load_data import DEFAULT_CLASSES
-from analyze import analyze_pipeline_realtime
+from analyze import IncrementalAnalyzer
 
-def interactive_loop(stats_path, classes, interval=300, agg_freq="5T", minutes_window=60):
+def interactive_loop(stats_path, classes, interval=5, agg_freq="5min", minutes_window=60):
+    """
+    Dashboard realtime: artist tạo 1 lần, mỗi chu kỳ chỉ đổi dữ liệu và blit các biểu đồ thay đổi
+    (live_dashboard.LiveDashboard), nên chu kỳ vài giây vẫn nhẹ.
+    """
     plt.ion()
-    from visualize import (
-        plot_line_chart,
-        plot_grouped_bar_minute,
-        plot_area_chart,
-        plot_pie_chart,
-        plot_hist_total,
-        plot_boxplot,
-        plot_rolling_avg,
-        plot_peak_detection,
-        plot_stacked_bar_percentage,
-    )
-    figs = {}
-    inited = False
+    from live_dashboard import LiveDashboard
+    analyzer = IncrementalAnalyzer(stats_path, out_dir="data/processed", agg_freq=agg_freq,
+                                   minutes_window=minutes_window)
+    dashboard = LiveDashboard(classes, rolling_window=5)
+    plt.show(block=False)
     try:
-        while True:
-            df = analyze_pipeline_realtime(stats_path, out_dir="data/processed", agg_freq=agg_freq,
-                                           minutes_window=minutes_window)
+        while plt.fignum_exists(dashboard.fig.number):
+            df = analyzer.update()
             if df is None or df.empty:
                 print(f"[{datetime.now()}] No data, sleeping {interval}s...")
-                time.sleep(interval)
-                continue
-            try:
-                if not inited:
-                    figs['line'] = plot_line_chart(df, classes, save=False)
-                    figs['grouped'] = plot_grouped_bar_minute(df, classes, save=False)
-                    figs['area'] = plot_area_chart(df, classes, save=False)
-                    figs['pie'] = plot_pie_chart(df, classes, save=False)
-                    figs['hist'] = plot_hist_total(df, save=False)
-                    figs['box'] = plot_boxplot(df, classes, save=False)
-                    figs['roll'] = plot_rolling_avg(df, classes, window=5, save=False)
-                    figs['peak'] = plot_peak_detection(df, save=False)
-                    figs['stack'] = plot_stacked_bar_percentage(df, classes, save=False)
-                    inited = True
-                else:
-                    for key, fn in [
-                        ('line', plot_line_chart),
-                        ('grouped', plot_grouped_bar_minute),
-                        ('area', plot_area_chart),
-                        ('pie', plot_pie_chart),
-                        ('hist', plot_hist_total),
-                        ('box', plot_boxplot),
-                        ('roll', plot_rolling_avg),
-                        ('peak', plot_peak_detection),
-                        ('stack', plot_stacked_bar_percentage),
-                    ]:
-                        fig_ax = figs.get(key)
-                        if not fig_ax:
-                            continue
-                        fig_obj, ax_obj = fig_ax
-                        if key == 'roll':
-                            fn(df, classes, window=5, fig=fig_obj, ax=ax_obj, save=False)
-                        elif key in ('line','grouped','area','box','stack'):
-                            fn(df, classes, fig=fig_obj, ax=ax_obj, save=False)
-                        elif key in ('hist','peak'):
-                            fn(df, fig=fig_obj, ax=ax_obj, save=False)
-                        elif key == 'pie':
-                            fn(df, classes, fig=fig_obj, ax=ax_obj, save=False)
-                for fig_obj, ax_obj in figs.values():
-                    fig_obj.canvas.draw()
-                    fig_obj.canvas.flush_events()
-            except Exception as e:
-                print(f"Error updating charts: {e}")
+            else:
+                try:
+                    dashboard.update(df)
+                except Exception as e:
+                    print(f"Error updating charts: {e}")
+            # Chờ trong event loop của GUI để cửa sổ vẫn phản hồi (zoom, resize)
+            dashboard.fig.canvas.start_event_loop(interval)
     except KeyboardInterrupt:
         print("Stopped by user")
     finally:
         plt.ioff()
 
 
-def headless_loop(stats_path, classes, interval=300, agg_freq="5T", minutes_window=60):
-    from visualize import (
-        plot_line_chart,
-        plot_grouped_bar_minute,
-        plot_area_chart,
-        plot_pie_chart,
-        plot_hist_total,
-        plot_boxplot,
-        plot_rolling_avg,
-        plot_peak_detection,
-        plot_stacked_bar_percentage,
-    )
+# Biểu đồ của chế độ headless: tên -> (hàm trong visualize, có nhận classes, tham số thêm)
+HEADLESS_CHARTS = {
+    "line": ("plot_line_chart", True, {}),
+    "grouped": ("plot_grouped_bar_minute", True, {}),
+    "area": ("plot_area_chart", True, {}),
+    "pie": ("plot_pie_chart", True, {}),
+    "hist": ("plot_hist_total", False, {}),
+    "box": ("plot_boxplot", True, {}),
+    "roll": ("plot_rolling_avg", True, {"window": 5}),
+    "peak": ("plot_peak_detection", False, {}),
+    "stack": ("plot_stacked_bar_percentage", True, {}),
+}
+
+
+def _init_render_worker():
+    plt.switch_backend("Agg")
+
+
+def render_chart(name, df, classes, out_path):
+    """Vẽ 1 biểu đồ ra PNG (chạy trong process worker) -> (tên, đường dẫn, số giây)."""
+    import visualize
+    t0 = time.perf_counter()
+    fn_name, with_classes, kwargs = HEADLESS_CHARTS[name]
+    fn = getattr(visualize, fn_name)
+    args = (df, classes) if with_classes else (df,)
+    path = fn(*args, out_path=out_path, **kwargs)
+    return name, path, time.perf_counter() - t0
+
+
+def frame_hash(df, classes):
+    """Hash nội dung DataFrame (cả index) để bỏ qua chu kỳ không có dữ liệu mới."""
+    h = hashlib.sha1(",".join(classes).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(",".join(map(str, df.columns)).encode())
+    return h.hexdigest()
+
+
+def prune_snapshots(out_dir, keep):
+    """Chỉ giữ `keep` bộ ảnh realtime_<thời điểm>_*.png mới nhất."""
+    if keep is None or keep <= 0:
+        return 0
+    groups = {}
+    for p in Path(out_dir).glob("realtime_*_*.png"):
+        stamp = "_".join(p.stem.split("_")[1:3])  # realtime_YYYYmmdd_HHMMSS_<chart>
+        groups.setdefault(stamp, []).append(p)
+    removed = 0
+    for stamp in sorted(groups)[:-keep]:
+        for p in groups[stamp]:
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def headless_loop(stats_path, classes, interval=300, agg_freq="5min", minutes_window=60,
+                  workers=3, keep=48, out_dir="data/figures"):
+    """
+    Ghi 9 PNG mỗi chu kỳ bằng process pool (backend Agg); bỏ qua khi dữ liệu không đổi (frame_hash),
+    chỉ giữ `keep` bộ ảnh gần nhất, log thời gian vẽ từng biểu đồ.
+    """
+    plt.switch_backend("Agg")
+    analyzer = IncrementalAnalyzer(stats_path, out_dir="data/processed", agg_freq=agg_freq,
+                                   minutes_window=minutes_window)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) if workers > 1 else None
+    last_hash = None
     try:
         while True:
-            df = analyze_pipeline_realtime(stats_path, out_dir="data/processed", agg_freq=agg_freq,
-                                           minutes_window=minutes_window)
+            df = analyzer.update()
             if df is None or df.empty:
                 print(f"[{datetime.now()}] No data, sleeping {interval}s...")
                 time.sleep(interval)
                 continue
+            digest = frame_hash(df, classes)
+            if digest == last_hash:
+                print(f"[{datetime.now()}] Dữ liệu không đổi, bỏ qua vẽ lại")
+                time.sleep(interval)
+                continue
+            t0 = time.perf_counter()
             ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-            out_prefix = f"data/figures/realtime_{ts}"
-            plot_line_chart(df, classes, out_path=out_prefix + "_line.png")
-            plot_grouped_bar_minute(df, classes, out_path=out_prefix + "_grouped.png")
-            plot_area_chart(df, classes, out_path=out_prefix + "_area.png")
-            plot_pie_chart(df, classes, out_path=out_prefix + "_pie.png")
-            plot_hist_total(df, out_path=out_prefix + "_hist.png")
-            plot_boxplot(df, classes, out_path=out_prefix + "_box.png")
-            plot_rolling_avg(df, classes, window=5, out_path=out_prefix + "_roll.png")
-            plot_peak_detection(df, out_path=out_prefix + "_peak.png")
-            plot_stacked_bar_percentage(df, classes, out_path=out_prefix + "_stack.png")
-            print(f"[{datetime.now()}] Saved snapshots with prefix {out_prefix}")
+            out_prefix = str(Path(out_dir) / f"realtime_{ts}")
+            jobs = [(name, df, classes, f"{out_prefix}_{name}.png") for name in HEADLESS_CHARTS]
+            results, failed = [], []
+            if pool is not None:
+                futures = {pool.submit(render_chart, *job): job[0] for job in jobs}
+                for fut in as_completed(futures):
+                    try:
+                        results.append(fut.result())
+                    except Exception as e:
+                        failed.append(futures[fut])
+                        print(f"Error rendering {futures[fut]}: {e}")
+            else:
+                for job in jobs:
+                    try:
+                        results.append(render_chart(*job))
+                    except Exception as e:
+                        failed.append(job[0])
+                        print(f"Error rendering {job[0]}: {e}")
+            # Vẽ lỗi thì chu kỳ sau thử lại dù dữ liệu không đổi
+            last_hash = digest if not failed else None
+            removed = prune_snapshots(out_dir, keep)
+            timings = ", ".join(f"{name} {sec:.2f}s" for name, _, sec in sorted(results, key=lambda r: -r[2]))
+            print(f"[{datetime.now()}] Saved {len(results)} charts with prefix {out_prefix} "
+                  f"in {time.perf_counter() - t0:.2f}s ({timings})"
+                  + (f", xoá {removed} ảnh cũ" if removed else ""))
             time.sleep(interval)
     except KeyboardInterrupt:
         print("Stopped by user")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", default="data/runtime/stats.json", help="path to stats.json")
-    parser.add_argument("--interval", type=int, default=300, help="seconds between updates")
+    parser.add_argument("--input", default="data/runtime/stats", help="thư mục log nhị phân (hoặc file .bin / stats.json line-delimited)")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="seconds between updates (mặc định: 5 khi xem trực tiếp, 300 khi --headless)")
     parser.add_argument("--headless", action="store_true", help="run in headless mode (save PNGs)")
-    parser.add_argument("--freq", default="5T", help="aggregation freq passed to pipeline")
+    parser.add_argument("--freq", default="5min", help="aggregation freq passed to pipeline")
     parser.add_argument("--minutes", type=int, default=60, help="how many minutes of data to load")
     parser.add_argument("--classes", nargs="+", default=DEFAULT_CLASSES)
+    parser.add_argument("--workers", type=int, default=3, help="headless: số process vẽ song song (1 = vẽ tuần tự)")
+    parser.add_argument("--keep", type=int, default=48, help="headless: số bộ ảnh giữ lại (0 = giữ tất cả)")
     args = parser.parse_args()
     if args.headless:
-        headless_loop(args.input, args.classes, interval=args.interval, agg_freq=args.freq, minutes_window=args.minutes)
+        interval = args.interval if args.interval is not None else 300
+        headless_loop(args.input, args.classes, interval=interval, agg_freq=args.freq, minutes_window=args.minutes,
+                      workers=args.workers, keep=args.keep)
     else:
-        interactive_loop(args.input, args.classes, interval=args.interval, agg_freq=args.freq, minutes_window=args.minutes)
+        interval = args.interval if args.interval is not None else 5
+        interactive_loop(args.input, args.classes, interval=interval, agg_freq=args.freq, minutes_window=args.minutes)
 
 
 if __name__ == "__main__":
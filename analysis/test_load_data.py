@@ -0,0 +1,41 @@
+"""
+normalize_records (dựng theo cột) phải cho cùng kết quả với cách cũ từng record
+(bench_load_data.normalize_records_rowwise) trên các record có `counts`.
+
+    cd analysis
+    python -m pytest -q test_load_data.py
+"""
+import pandas as pd
+
+from bench_load_data import normalize_records_rowwise
+from load_data import DEFAULT_CLASSES, normalize_records
+
+RECORDS = [
+    {"timestamp": 1700000000, "counts": {"car": 3, "motor": 5, "bus": 0, "truck": 1}, "total": 9},
+    # counts không phải số nguyên -> dùng trường phẳng cùng tên
+    {"timestamp": 1700000001, "counts": {"car": "x", "motor": 6}, "car": 4},
+    {"timestamp": 1700000002, "counts": {"car": "3.7", "motor": None, "bus": "2"}, "car": 5, "motor": "7"},
+    {"timestamp": 1700000003, "counts": {"car": "bad"}, "car": "also bad", "total": "10"},
+    {"timestamp": 1700000004, "counts": {"car": 6.9, "motor": True, "truck": float("nan")}, "truck": 2,
+     "total": 12.5},
+    {"timestamp": 1700000005, "counts": {"car": 7}, "total": "3.7"},
+    {"timestamp": 1700000006, "counts": {"car": 8, "bus": float("inf")}, "bus": 1, "total": None},
+]
+
+
+def _columns(df):
+    return df[["ts", *DEFAULT_CLASSES, "total"]].reset_index(drop=True)
+
+
+def test_matches_rowwise_normalize_on_messy_counts():
+    got = normalize_records(RECORDS)
+    want = normalize_records_rowwise(RECORDS)
+    pd.testing.assert_frame_equal(_columns(got), _columns(want), check_dtype=False)
+    assert got.loc[1, "car"] == 4 and got.loc[2, "car"] == 5 and got.loc[2, "motor"] == 7
+
+
+def test_matches_rowwise_normalize_on_clean_counts():
+    records = [{"timestamp": 1700000000 + i, "counts": {c: i * (k + 1) for k, c in enumerate(DEFAULT_CLASSES)}}
+               for i in range(50)]
+    pd.testing.assert_frame_equal(_columns(normalize_records(records)),
+                                  _columns(normalize_records_rowwise(records)), check_dtype=False)
@@ -300,7 +300,7 @@ if __name__ == "__main__":
     from analyze import analyze_pipeline_realtime
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", default="data/runtime/stats.json")
+    parser.add_argument("--input", default="data/runtime/stats")
     parser.add_argument("--freq", default="1min")
     parser.add_argument("--classes", nargs="+", default=["car","motor","bus","truck"])
     args = parser.parse_args()
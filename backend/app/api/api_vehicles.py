@@ -1,24 +1,45 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, Depends, Header, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import asyncio
+import hmac
 import time
-from multiprocessing import Manager, Process, Queue
+from typing import Literal, Optional
+from multiprocessing import Manager, Queue
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-from sqlalchemy import desc, func, cast, Date
-import pandas as pd
+from sqlalchemy import desc, func
 
 # Import Config & Service
-from app.core.config import settings_metric_transport
-from app.services.road_services.AnalyzeOnRoad import run_analyzer 
+from app.core.config import settings_metric_transport, settings_server
+from app.services.road_services.CameraSupervisor import CameraSupervisor
+from app.services.road_services.SharedWeights import ensure_shared_weights
+from app.services.traffic_services.log_writer import TrafficLogWriter
+from app.services.traffic_services.chart_cache import chart_cache
+from app.services.traffic_services.rollups import backfill_rollups, bucket_start
+from app.services.traffic_services.queries import (
+    METRIC_COLUMNS, QUERY_RESOLUTIONS, chart_series, count_buckets, freq_seconds,
+    multi_camera_series, pick_resolution, rollup_table,
+)
+from app.services.traffic_services.retention import run_maintenance
+from app.services.traffic_services.forecast import forecast_payload, load_forecast, run_forecasts
+from app.services.traffic_services.baselines import anomaly_payload, seasonal_baselines
+from app.services.traffic_services.export import EXPORT_FORMATS, pa, stream_export
+from app.services.traffic_services.peaks import PeakEventHub, load_peaks, peak_mask, peak_row
+from app.services.traffic_services.processed import processed_payload, processed_store, tail_minutes, to_ipc_bytes
+from app.services.traffic_services.charts import (
+    CHART_BUILDERS, build_bundle, time_series_payload, grouped_bar_payload, area_payload,
+    hist_total_payload, boxplot_payload, rolling_avg_payload, peaks_payload, range_payload,
+)
+from app.schemas.CameraConfig import CameraCreate
+from app.utils.json_response import FastJSONResponse
 from app.api import state
 
 # Import Database Modules
 from app.db.base import SessionLocal  
+from app.db.executor import db_executor
 from app.models.traffic_logs import TrafficLog 
 
 from sqlalchemy.orm import Session
-import numpy as np
 
 router = APIRouter()
 
@@ -28,24 +49,32 @@ class SystemState:
         self.manager = None
         self.info_dict = None   
         self.frame_dict = None  
-        self.processes = []     
         self.result_queue = None
+        self.log_queue = None
+        self.log_writer = None
+        self.peak_queue = None
+        self.peak_hub = None
+        self.supervisor = None
+        self.retention_task = None
+        self.forecast_task = None
+        self.baseline_task = None
 
 sys_state = SystemState()
 
 LOCAL_TZ = ZoneInfo("Asia/Bangkok")
+# points: [{label, value(s)}] | columnar: {labels: [...], values: ...}
+ChartLayout = Literal["points", "columnar"]
 VEHICLE_CLASSES = ["count_car", "count_motor", "count_bus", "count_truck"]
+ROLLUP_TO_LOG_COLUMNS = {
+    "max_car": "count_car",
+    "max_motor": "count_motor",
+    "max_bus": "count_bus",
+    "max_truck": "count_truck",
+    "max_total": "total_vehicles",
+}
 
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 def load_traffic_df(
     db: Session,
     camera_id: int,
@@ -53,93 +82,68 @@ def load_traffic_df(
     freq: str = "1min",
 ):
     """
-    Query TrafficLog từ DB, chuẩn hóa về UTC+7, resample theo freq.
-    Trả về (df_resampled, classes_thực_tế)
+    Đọc chuỗi theo bucket `freq` của camera (gom nhóm / max / tổng làm trong DB
+    từ bảng rollup), chuẩn hóa về UTC+7.
+    Trả về (df, classes_thực_tế):
+    - count_* / total_vehicles / total: giá trị cộng dồn lớn nhất trong bucket
+    - flow_*: số xe đi qua trong bucket
     """
-    now_utc = datetime.now(timezone.utc)
-    threshold_utc = now_utc - timedelta(hours=hours)
-
-    query = (
-        db.query(TrafficLog)
-        .filter(
-            TrafficLog.camera_id == camera_id,
-            TrafficLog.timestamp >= threshold_utc,
-        )
-        .order_by(TrafficLog.timestamp.asc())
-    )
-
-    df = pd.read_sql(query.statement, db.bind)
+    threshold_utc = datetime.now(timezone.utc) - timedelta(hours=hours)
+    df = chart_series(db, camera_id, threshold_utc, freq=freq)
 
     if df.empty:
         return df, []
 
-    # timestamp -> UTC -> local (UTC+7)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    df["timestamp_local"] = df["timestamp"].dt.tz_convert(LOCAL_TZ)
-    df = df.set_index("timestamp_local")
+    df = df.rename(columns=ROLLUP_TO_LOG_COLUMNS)
+    df["total"] = df["total_vehicles"]
+    df.index.name = "time"
 
-    # Chỉ lấy những cột class đang tồn tại
-    classes = [c for c in VEHICLE_CLASSES if c in df.columns]
+    return df, list(VEHICLE_CLASSES)
 
-    # Chuẩn hóa cột total
-    if "total_vehicles" in df.columns:
-        df["total"] = df["total_vehicles"]
-    elif "total" not in df.columns and classes:
-        df["total"] = df[classes].sum(axis=1)
 
-    # Resample
-    df_resampled = df.resample(freq).max().ffill()
-    df_resampled.index.name = "time"
-
-    return df_resampled, classes
 
+# ========================== LIFECYCLE ==========================
+async def retention_loop():
+    """Bảo trì traffic_logs định kỳ (rollup log cũ, xoá theo batch, VACUUM / ANALYZE)."""
+    while True:
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception as e:
+            print(f"Lỗi bảo trì traffic_logs: {e}")
+        await asyncio.sleep(settings_metric_transport.RETENTION_INTERVAL_SECONDS)
 
 
+async def forecast_loop():
+    """Tính lại dự báo ngắn hạn của các camera định kỳ, ghi vào bảng traffic_forecasts."""
+    while True:
+        try:
+            await asyncio.to_thread(run_forecasts)
+        except Exception as e:
+            print(f"Lỗi dự báo traffic: {e}")
+        await asyncio.sleep(settings_metric_transport.FORECAST_INTERVAL_SECONDS)
 
 
-# BACKGROUND WORKER
-async def save_stats_to_db_worker():
-    print("Background Worker: Đã kích hoạt chế độ ghi log giao thông...")
+async def baseline_loop():
+    """Cộng các phút mới vào baseline theo (thứ, khung giờ) của từng camera, chấm điểm phút gần nhất."""
     while True:
         try:
-            await asyncio.sleep(10)
-            if sys_state.info_dict:
-                db = SessionLocal()
-                try:
-                    current_snapshot = dict(sys_state.info_dict)
-                    for key, data in current_snapshot.items():
-                        try:
-                            if "_" not in key: continue 
-                            cam_id = int(key.split("_")[1])
-                        except: continue
-
-                        details = data.get('details', {})
-                        log = TrafficLog(
-                            camera_id=cam_id,
-                            total_vehicles=data.get('total_entered', 0),
-                            fps=data.get('fps', 0),
-                            count_car=details.get('car', {}).get('entered', 0),
-                            count_motor=(
-                                details.get('motorcycle', {}).get('entered', 0) + 
-                                details.get('motorbike', {}).get('entered', 0) + 
-                                details.get('motor', {}).get('entered', 0)
-                            ),
-                            count_bus=details.get('bus', {}).get('entered', 0),
-                            count_truck=details.get('truck', {}).get('entered', 0),
-                            timestamp=datetime.now()
-                        )
-                        db.add(log)
-                    db.commit()
-                except Exception as e:
-                    print(f"Lỗi worker lưu DB: {e}")
-                    db.rollback() 
-                finally:
-                    db.close()
+            await asyncio.to_thread(seasonal_baselines.update)
         except Exception as e:
-            print(f"Lỗi vòng lặp Worker: {e}")
-            await asyncio.sleep(5) 
+            print(f"Lỗi cập nhật baseline traffic: {e}")
+        await asyncio.sleep(settings_metric_transport.BASELINE_INTERVAL_SECONDS)
+
+
+def _backfill_rollups():
+    db = SessionLocal()
+    try:
+        backfill_rollups(db, hours=24)
+    except Exception as e:
+        print(f"Lỗi backfill rollup: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
 
-# ========================== LIFECYCLE ==========================
 @router.on_event("startup")
 async def startup_event():
     if sys_state.manager is not None:
@@ -152,21 +156,40 @@ async def startup_event():
         sys_state.info_dict = sys_state.manager.dict()
         sys_state.frame_dict = sys_state.manager.dict()
         sys_state.result_queue = Queue()
-
-        num_cameras = 2 
-        print(f"Kích hoạt {num_cameras} cameras tối ưu...")
-
-        for i in range(num_cameras):
-            p = Process(
-                target=run_analyzer,
-                args=(i, sys_state.info_dict, sys_state.result_queue, sys_state.frame_dict, False)
+        sys_state.log_queue = Queue(maxsize=settings_metric_transport.TRAFFIC_LOG_MAX_BUFFER)
+
+        # Dựng rollup từ log cũ (nếu có) trước khi writer bắt đầu cập nhật tăng dần
+        await asyncio.to_thread(_backfill_rollups)
+
+        # Writer duy nhất của traffic_logs: camera chỉ đẩy bản ghi vào log_queue
+        sys_state.log_writer = TrafficLogWriter(sys_state.log_queue, on_commit=chart_cache.invalidate)
+        sys_state.log_writer.start()
+
+        # Sự kiện cao điểm từ detector streaming trong process camera: lưu DB + phát qua /ws/peaks
+        sys_state.peak_queue = Queue(maxsize=settings_metric_transport.PEAK_EVENT_MAX_BUFFER)
+        sys_state.peak_hub = PeakEventHub(sys_state.peak_queue, on_event=chart_cache.invalidate)
+        await asyncio.to_thread(sys_state.peak_hub.start)
+        sys_state.retention_task = asyncio.create_task(retention_loop())
+        sys_state.forecast_task = asyncio.create_task(forecast_loop())
+        sys_state.baseline_task = asyncio.create_task(baseline_loop())
+
+        camera_specs = settings_metric_transport.get_camera_specs()
+        print(f"Kích hoạt {len(camera_specs)} cameras tối ưu...")
+
+        shared_weights = None
+        if settings_metric_transport.SHARED_WEIGHTS:
+            shared_weights = await asyncio.to_thread(
+                ensure_shared_weights, settings_metric_transport.MODELS_PATH
             )
-            p.start()
-            sys_state.processes.append(p)
-            print(f"Camera {i} started (PID: {p.pid})")
-            time.sleep(1)
-            
-        asyncio.create_task(save_stats_to_db_worker())
+
+        sys_state.supervisor = CameraSupervisor(
+            sys_state.info_dict, sys_state.frame_dict, sys_state.result_queue,
+            shared_weights=shared_weights,
+            log_queue=sys_state.log_queue,
+            peak_queue=sys_state.peak_queue,
+        )
+        await asyncio.to_thread(sys_state.supervisor.start_all, camera_specs)
+        asyncio.create_task(sys_state.supervisor.run())
 
     except Exception as e:
         print(f"Lỗi khởi động: {e}")
@@ -174,11 +197,69 @@ async def startup_event():
 @router.on_event("shutdown")
 async def shutdown_event():
     print("Đang tắt hệ thống Traffic AI...")
-    for p in sys_state.processes:
-        if p.is_alive():
-            p.terminate()
-            p.join()
+    if sys_state.retention_task is not None:
+        sys_state.retention_task.cancel()
+    if sys_state.forecast_task is not None:
+        sys_state.forecast_task.cancel()
+    if sys_state.baseline_task is not None:
+        sys_state.baseline_task.cancel()
+    if sys_state.supervisor is not None:
+        sys_state.supervisor.shutdown()
     print("Đã tắt toàn bộ processes.")
+    if sys_state.peak_hub is not None:
+        sys_state.peak_hub.stop()
+        print(f"PeakEventHub: {sys_state.peak_hub.stats()}")
+    if sys_state.log_writer is not None:
+        sys_state.log_writer.stop()
+        print(f"TrafficLogWriter: {sys_state.log_writer.stats()}")
+    db_executor.shutdown()
+
+
+# ========================== ADMIN: CAMERAS ==========================
+
+def _get_supervisor():
+    if sys_state.supervisor is None:
+        raise HTTPException(status_code=500, detail="System not initialized")
+    return sys_state.supervisor
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Chặn /admin/* nếu chưa đặt ADMIN_TOKEN hoặc header X-Admin-Token không khớp."""
+    expected = settings_server.ADMIN_TOKEN
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN chưa được thiết lập)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/admin/cameras", dependencies=[Depends(require_admin)])
+def list_cameras():
+    """Trạng thái các process camera (pid, alive, số lần restart, lỗi gần nhất)"""
+    return JSONResponse({"cameras": _get_supervisor().status()})
+
+
+@router.post("/admin/cameras", status_code=201, dependencies=[Depends(require_admin)])
+def add_camera(payload: CameraCreate):
+    """Thêm camera mới và khởi động process ngay, không cần restart server"""
+    supervisor = _get_supervisor()
+    camera_id = payload.camera_id
+    if camera_id is None:
+        camera_id = max(supervisor.workers.keys(), default=-1) + 1
+    try:
+        status = supervisor.add_camera(camera_id, payload.url, payload.region)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status, status_code=201)
+
+
+@router.delete("/admin/cameras/{camera_id}", dependencies=[Depends(require_admin)])
+def remove_camera(camera_id: int):
+    """Dừng process camera và xoá dữ liệu realtime của nó"""
+    try:
+        status = _get_supervisor().remove_camera(camera_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Camera {camera_id} not found")
+    return JSONResponse(status)
 
 
 # ========================== API ENDPOINTS ==========================
@@ -190,7 +271,11 @@ async def get_info_road(camera_id: int):
         return JSONResponse({"error": "System not initialized"}, status_code=500)
     key = f"camera_{camera_id}"
     data = sys_state.info_dict.get(key)
-    if data: return JSONResponse(dict(data))
+    if data:
+        # Cùng dạng với tin nhắn WS /ws/info
+        data = dict(data)
+        data["anomaly"] = seasonal_baselines.snapshot(camera_id)
+        return JSONResponse(data)
     return JSONResponse({"status": "waiting"}, status_code=404)
 
 
@@ -204,440 +289,369 @@ async def get_frame_road(camera_id: int):
     return JSONResponse({"error": "No frame"}, status_code=404)
 
 
-@router.get("/charts/vehicle-distribution")
-async def get_vehicle_distribution():
-    """Pie Chart Data"""
-    db = SessionLocal()
-    try:
-        today = datetime.now().date()
-        subquery = db.query(func.max(TrafficLog.id))\
-            .filter(cast(TrafficLog.timestamp, Date) == today)\
-            .group_by(TrafficLog.camera_id)
-        latest_logs = db.query(TrafficLog).filter(TrafficLog.id.in_(subquery)).all()
-        
-        total_car = sum(log.count_car for log in latest_logs)
-        total_motor = sum(log.count_motor for log in latest_logs)
-        total_bus = sum(log.count_bus for log in latest_logs)
-        total_truck = sum(log.count_truck for log in latest_logs)
-        total_all = sum(log.total_vehicles for log in latest_logs)
-        
-        def _pct(val, total): return float(val)/total if total > 0 else 0.0
-
-        return JSONResponse({
-            "date": today.isoformat(),
-            "totals": {
-                "car": total_car, "motor": total_motor,
-                "bus": total_bus, "truck": total_truck,
-                "total_vehicles": total_all
-            },
-            "percentages": {
-                "car": _pct(total_car, total_all),
-                "motor": _pct(total_motor, total_all),
-                "bus": _pct(total_bus, total_all),
-                "truck": _pct(total_truck, total_all)
-            }
-        })
-    finally:
-        db.close()
+def _render_chart(db: Session, camera_id: int, builder, **params):
+    """Chạy trong db_executor: đọc DB + dựng payload + serialize, không đụng tới event loop."""
+    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
+    return FastJSONResponse(builder(camera_id, df, classes, **params))
 
-@router.get("/charts/time-series/{camera_id}")
-async def get_time_series_data(camera_id: int, minutes: int = 60):
-    """
-    Lấy time-series cho camera, chuyển timestamp về Asia/Bangkok (UTC+7)
-    -> GIÁ TRỊ THEO TỪNG PHÚT (không cộng dồn)
-    """
-    db: Session = SessionLocal()
-    try:
-        tz_local = ZoneInfo("Asia/Bangkok")
 
-        # Lấy thời gian hiện tại theo UTC
-        now_utc = datetime.now(timezone.utc)
-        # Lấy rộng 24h cho an toàn (đủ dữ liệu để resample + diff)
-        time_threshold_utc = now_utc - timedelta(hours=24)
+def _mark_peaks(db: Session, camera_id: int, df):
+    """is_peak_auto theo các đợt cao điểm detector streaming đã lưu (thay cho ngưỡng quantile 0.9)."""
+    if df.empty:
+        return df
+    peaks = load_peaks(db, camera_id, df.index[0], df.index[-1] + timedelta(minutes=1))
+    df["is_peak_auto"] = peak_mask(df.index, peaks, bucket_seconds=60)
+    return df
 
-        print(f"[DEBUG] Current Time UTC: {now_utc}")
-        print(f"[DEBUG] Threshold UTC:    {time_threshold_utc}")
 
-        query = (
-            db.query(TrafficLog)
-            .filter(
-                TrafficLog.camera_id == camera_id,
-                TrafficLog.timestamp >= time_threshold_utc,
-            )
-            .order_by(TrafficLog.timestamp.asc())
-        )
+def _render_peaks(db: Session, camera_id: int, **params):
+    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
+    return FastJSONResponse(peaks_payload(camera_id, _mark_peaks(db, camera_id, df), classes, **params))
+
+
+def _list_peaks(db: Session, camera_id: int, hours: float):
+    start = datetime.now(timezone.utc) - timedelta(hours=hours)
+    return [peak_row(p) for p in load_peaks(db, camera_id, start)]
+
+
+def _forecast(db: Session, camera_id: int, minutes: int, layout: str):
+    rows = load_forecast(db, camera_id, minutes)
+    if not rows:
+        return None
+    return FastJSONResponse(forecast_payload(camera_id, rows, layout))
+
+
+def _anomaly_history(db: Session, camera_id: int, hours: float, layout: str):
+    start = datetime.now(timezone.utc) - timedelta(hours=hours)
+    frame = seasonal_baselines.history(db, camera_id, start)
+    current = seasonal_baselines.snapshot(camera_id)
+    return FastJSONResponse(anomaly_payload(camera_id, frame, current, layout))
+
+
+def _vehicle_distribution(db: Session):
+    # Tổng số xe trong ngày = tổng delta từ 00:00 giờ địa phương (đã xử lý reset bộ đếm)
+    today_start = bucket_start(datetime.now(timezone.utc), "1d")
+    today = today_start.astimezone(LOCAL_TZ).date()
+    sums = db.query(
+        func.coalesce(func.sum(TrafficLog.delta_car), 0),
+        func.coalesce(func.sum(TrafficLog.delta_motor), 0),
+        func.coalesce(func.sum(TrafficLog.delta_bus), 0),
+        func.coalesce(func.sum(TrafficLog.delta_truck), 0),
+        func.coalesce(func.sum(TrafficLog.delta_total), 0),
+    ).filter(TrafficLog.timestamp >= today_start).one()
+    total_car, total_motor, total_bus, total_truck, total_all = (int(v) for v in sums)
+
+    def _pct(val, total): return float(val)/total if total > 0 else 0.0
+
+    return FastJSONResponse({
+        "date": today.isoformat(),
+        "totals": {
+            "car": total_car, "motor": total_motor,
+            "bus": total_bus, "truck": total_truck,
+            "total_vehicles": total_all
+        },
+        "percentages": {
+            "car": _pct(total_car, total_all),
+            "motor": _pct(total_motor, total_all),
+            "bus": _pct(total_bus, total_all),
+            "truck": _pct(total_truck, total_all)
+        }
+    })
 
-        df = pd.read_sql(query.statement, db.bind)
-        print(f"[DEBUG] Found {len(df)} records in last 24h (UTC).")
-        if df.empty:
-            return JSONResponse(
-                {
-                    "camera_id": camera_id,
-                    "points": [],
-                    "message": "DB Empty in last 24h",
-                }
-            )
 
-        # --- CHUYỂN MÚI GIỜ ---
-        # Giả sử DB lưu UTC
-        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-        df["timestamp"] = df["timestamp"].dt.tz_convert(tz_local)
+def _render_range(db: Session, camera_ids, start, end, resolution, metrics):
+    index, frames = multi_camera_series(db, camera_ids, start, end, resolution)
+    source = rollup_table(freq_seconds(resolution))[0].__tablename__
+    payload = range_payload(index, frames, metrics, resolution, source)
+    payload.update(start=start.astimezone(LOCAL_TZ).isoformat(), end=end.astimezone(LOCAL_TZ).isoformat())
+    return FastJSONResponse(payload)
 
-        print(f"[DEBUG] First record (local): {df['timestamp'].iloc[0]}")
-        print(f"[DEBUG] Last  record (local): {df['timestamp'].iloc[-1]}")
 
-        df.set_index("timestamp", inplace=True)
+def _split_param(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
 
-        # Resample theo phút: lấy max (vì total_vehicles là tích lũy), rồi ffill
-        df_resampled = df.resample("1min").max().ffill()
 
-        # ===== TÍNH SỐ XE MỖI PHÚT (KHÔNG CỘNG DỒN) =====
-        # total_vehicles(t) - total_vehicles(t-1)
-        df_resampled["vehicles_per_min"] = (
-            df_resampled["total_vehicles"]
-            .diff()          # hiệu giữa 2 phút
-            .fillna(0)       # phút đầu tiên -> 0
-            .clip(lower=0)   # tránh âm nếu counter reset
-            .astype(int)
-        )
+def _with_local_tz(ts: datetime):
+    """Thời điểm không ghi múi giờ trong query param được hiểu là giờ địa phương."""
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=LOCAL_TZ)
 
-        # Lấy N phút gần nhất (theo tham số minutes)
-        # Mỗi dòng = 1 phút → lấy tail(minutes) là được
-        tail_df = df_resampled.tail(minutes)
-
-        data_points = []
-        for idx, row in tail_df.iterrows():
-            val = int(row["vehicles_per_min"])
-            data_points.append(
-                {
-                    "label": idx.strftime("%H:%M"),  # đã là giờ UTC+7
-                    "value": val,                    # số xe trong phút đó
-                }
-            )
 
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": data_points,
-                "period": f"{minutes}m",
-                "timezone": "Asia/Bangkok (UTC+7)",
-                "aggregation": "per_minute",  # optional: gửi thêm meta cho frontend
-            }
-        )
+def _render_bundle(db: Session, camera_id: int, selected, **params):
+    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
+    if selected is None or "peaks" in selected:
+        _mark_peaks(db, camera_id, df)
+    return FastJSONResponse({
+        "camera_id": camera_id,
+        "charts": build_bundle(camera_id, df, classes, selected, **params),
+    })
+
+
+# Các endpoint chart chỉ await db_executor: truy vấn + pandas chạy trong thread pool riêng,
+# event loop vẫn đẩy frame / info qua WebSocket trong lúc đó.
 
+@router.get("/charts/vehicle-distribution")
+@chart_cache.cached()
+async def get_vehicle_distribution():
+    """Pie Chart Data"""
+    return await db_executor.run(_vehicle_distribution)
+
+@router.get("/charts/time-series/{camera_id}")
+@chart_cache.cached()
+async def get_time_series_data(camera_id: int, minutes: int = 60, layout: ChartLayout = "points"):
+    """
+    Lấy time-series cho camera, chuyển timestamp về Asia/Bangkok (UTC+7)
+    -> GIÁ TRỊ THEO TỪNG PHÚT (không cộng dồn)
+    """
+    try:
+        return await db_executor.run(
+            _render_chart, camera_id, time_series_payload, minutes=minutes, layout=layout
+        )
     except Exception as e:
         print(f"ERROR: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
-    finally:
-        db.close()
+        return FastJSONResponse({"error": str(e)}, status_code=500)
 
 @router.get("/charts/grouped-bar/{camera_id}")
+@chart_cache.cached()
 async def grouped_bar_chart(
     camera_id: int,
     minutes: int = 60,
-    db: Session = Depends(get_db),
+    layout: ChartLayout = "points",
 ):
-    
     # Dùng lại helper đọc DB + convert UTC -> UTC+7
-    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
-
-    if df.empty or not classes:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": [],
-                "message": "No data in last 24h",
-            }
-        )
-
-    # Lấy minutes điểm cuối (giống time-series)
-    tail = df.tail(minutes)
-
-    points = []
-    for idx, row in tail.iterrows():
-        values = {}
-        for c in classes:
-            v = row.get(c, 0)
-            # đảm bảo là int
-            values[c] = int(v) if pd.notna(v) else 0
-
-        points.append(
-            {
-                "label": idx.strftime("%H:%M"),  # đã là giờ UTC+7 trong load_traffic_df
-                "values": values,
-            }
-        )
-
-    return JSONResponse(
-        {
-            "camera_id": camera_id,
-            "points": points,
-            "classes": classes,  # để frontend biết thứ tự / legend
-            "period": f"{minutes}m",
-            "timezone": "Asia/Bangkok (UTC+7)",
-        }
+    return await db_executor.run(
+        _render_chart, camera_id, grouped_bar_payload, minutes=minutes, layout=layout
     )
 
 
 @router.get("/charts/area/{camera_id}")
+@chart_cache.cached()
 async def area_chart(
     camera_id: int,
     minutes: int = 60,
-    db: Session = Depends(get_db),
+    layout: ChartLayout = "points",
 ):
-    
-    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
-
-    if df.empty or not classes:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": [],
-                "message": "No data in last 24h",
-            }
-        )
-
-    tail = df.tail(minutes)
-
-    points = []
-    for idx, row in tail.iterrows():
-        values = {}
-        for c in classes:
-            v = row.get(c, 0)
-            values[c] = int(v) if pd.notna(v) else 0
-
-        points.append(
-            {
-                "label": idx.strftime("%H:%M"),  
-                "values": values,
-            }
-        )
-
-    return JSONResponse(
-        {
-            "camera_id": camera_id,
-            "points": points,
-            "classes": classes,
-            "period": f"{minutes}m",
-            "timezone": "Asia/Bangkok (UTC+7)",
-            "chart_type": "stacked_area",
-        }
-    )
-
-
+    return await db_executor.run(_render_chart, camera_id, area_payload, minutes=minutes, layout=layout)
 
 
 @router.get("/charts/hist-total/{camera_id}")
+@chart_cache.cached()
 async def hist_total(
     camera_id: int,
     bins: int = 20,
-    db: Session = Depends(get_db),
+    layout: ChartLayout = "points",
 ):
-   
-    df, _ = load_traffic_df(db, camera_id, hours=24, freq="1min")
-
-    if df.empty or "total" not in df.columns:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": [],
-                "bins": bins,
-                "message": "No data or 'total' column missing",
-            }
-        )
-
-    values = df["total"].dropna().astype(int).to_numpy()
-    if len(values) == 0:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": [],
-                "bins": bins,
-                "message": "No total values",
-            }
-        )
-
-    counts, bin_edges = np.histogram(values, bins=bins)
-    bin_centers = ((bin_edges[:-1] + bin_edges[1:]) / 2.0)
-
-    # Chuẩn hoá về dạng points: [{label, value}]
-    points = [
-        {
-            "label": f"{center:.1f}",      # nhãn là mid-point của bin
-            "value": int(count),           # số lượng điểm rơi vào bin
-        }
-        for center, count in zip(bin_centers, counts)
-    ]
-
-    return JSONResponse(
-        {
-            "camera_id": camera_id,
-            "points": points,
-            "bins": bins,
-            "metric": "total_vehicles",
-        }
-    )
-
+    return await db_executor.run(_render_chart, camera_id, hist_total_payload, bins=bins, layout=layout)
 
 
 @router.get("/charts/boxplot/{camera_id}")
+@chart_cache.cached()
 async def boxplot_chart(
     camera_id: int,
-    db: Session = Depends(get_db),
 ):
-    
-    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
-
-    if df.empty or not classes:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "items": [],
-                "classes": [],
-                "message": "No data in last 24h",
-            }
-        )
-
-    items = []
-    for c in classes:
-        s = df[c].dropna().astype(float)
-        if s.empty:
-            continue
-        desc = s.describe()  # count, mean, std, min, 25%, 50%, 75%, max
-        items.append(
-            {
-                "name": c,
-                "min": float(desc["min"]),
-                "q1": float(desc["25%"]),
-                "median": float(desc["50%"]),
-                "q3": float(desc["75%"]),
-                "max": float(desc["max"]),
-            }
-        )
-
-    return JSONResponse(
-        {
-            "camera_id": camera_id,
-            "items": items,
-            "classes": classes,
-        }
-    )
+    return await db_executor.run(_render_chart, camera_id, boxplot_payload)
 
 
 @router.get("/charts/rolling-avg/{camera_id}")
+@chart_cache.cached()
 async def rolling_avg_chart(
     camera_id: int,
     minutes: int = 60,
     window: int = 5,
-    db: Session = Depends(get_db),
+    layout: ChartLayout = "points",
 ):
-   
-    df, classes = load_traffic_df(db, camera_id, hours=24, freq="1min")
-
-    if df.empty or not classes:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": [],
-                "classes": [],
-                "window": window,
-                "message": "No data in last 24h",
-            }
-        )
-
-    # Tính rolling mean theo window
-    df_ra = df[classes].rolling(window=window).mean()
-    tail = df_ra.tail(minutes)
-
-    points = []
-    for idx, row in tail.iterrows():
-        values = {}
-        for c in classes:
-            v = row.get(c, None)
-            values[c] = float(v) if pd.notna(v) else 0.0
-
-        points.append(
-            {
-                "label": idx.strftime("%H:%M"),  # đã là giờ UTC+7 trong load_traffic_df
-                "values": values,
-            }
-        )
-
-    return JSONResponse(
-        {
-            "camera_id": camera_id,
-            "points": points,
-            "classes": classes,
-            "window": window,
-            "period": f"{minutes}m",
-            "timezone": "Asia/Bangkok (UTC+7)",
-        }
+    return await db_executor.run(
+        _render_chart, camera_id, rolling_avg_payload, minutes=minutes, window=window, layout=layout
     )
 
 
 @router.get("/charts/peaks/{camera_id}")
+@chart_cache.cached()
 async def peak_detection_chart(
     camera_id: int,
     minutes: int = 60,
-    db: Session = Depends(get_db),
+    layout: ChartLayout = "points",
 ):
-    
-    df, _ = load_traffic_df(db, camera_id, hours=24, freq="1min")
-
-    if df.empty or "total" not in df.columns:
-        return JSONResponse(
-            {
-                "camera_id": camera_id,
-                "points": [],
-                "peaks": [],
-                "message": "No data or 'total' missing",
-            }
-        )
+    return await db_executor.run(_render_peaks, camera_id, minutes=minutes, layout=layout)
+
+
+@router.get("/charts/forecast/{camera_id}")
+async def forecast_chart(
+    camera_id: int,
+    minutes: int = 60,
+    layout: ChartLayout = "points",
+):
+    """Dự báo flow các phút tới, đọc thẳng bảng traffic_forecasts do forecast_loop tính sẵn."""
+    response = await db_executor.run(_forecast, camera_id, minutes, layout)
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"Chưa có dự báo cho camera {camera_id}")
+    return response
+
 
-    # Nếu DB chưa có cột is_peak_auto, có thể tự tính như sau:
-    if "is_peak_auto" not in df.columns:
-        # ví dụ: peak = những điểm >= quantile 0.9
-        thr = df["total"].quantile(0.9)
-        df["is_peak_auto"] = df["total"] >= thr
+@router.get("/anomaly/{camera_id}")
+@chart_cache.cached()
+async def anomaly_history(
+    camera_id: int,
+    hours: float = 24,
+    layout: ChartLayout = "points",
+):
+    """Điểm bất thường theo phút trong `hours` giờ gần nhất so với baseline cùng thứ / khung giờ."""
+    return await db_executor.run(_anomaly_history, camera_id, hours, layout)
+
+
+@router.get("/peaks/{camera_id}")
+async def list_peaks(camera_id: int, hours: float = 24):
+    """Các đợt cao điểm đã lưu trong `hours` giờ gần nhất + đợt đang diễn ra (nếu có)."""
+    peaks = await db_executor.run(_list_peaks, camera_id, hours)
+    active = sys_state.peak_hub.snapshot(camera_id) if sys_state.peak_hub is not None else []
+    return FastJSONResponse({
+        "camera_id": camera_id,
+        "active": active[0] if active else None,
+        "peaks": peaks,
+        "timezone": "Asia/Bangkok (UTC+7)",
+    })
+
+
+@router.get("/charts/bundle/{camera_id}")
+@chart_cache.cached()
+async def chart_bundle(
+    camera_id: int,
+    charts: Optional[str] = None,
+    minutes: int = 60,
+    bins: int = 20,
+    window: int = 5,
+    layout: ChartLayout = "points",
+):
+    """
+    Tất cả chart của 1 camera trong 1 response, chỉ đọc DB 1 lần.
+    `charts`: danh sách tên cách nhau bởi dấu phẩy (vd: `area,peaks`), bỏ trống = tất cả.
+    """
+    selected = _split_param(charts) if charts else None
+    unknown = [c for c in (selected or []) if c not in CHART_BUILDERS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chart không hợp lệ: {', '.join(unknown)}. Hỗ trợ: {', '.join(CHART_BUILDERS)}",
+        )
 
-    tail = df.tail(minutes)
+    return await db_executor.run(
+        _render_bundle, camera_id, selected, minutes=minutes, bins=bins, window=window, layout=layout
+    )
 
-    points = []
-    peaks = []
 
-    for idx, row in tail.iterrows():
-        val = int(row["total"]) if pd.notna(row["total"]) else 0
-        is_peak = bool(row.get("is_peak_auto", False))
-        ts_iso = idx.isoformat()
+@router.get("/charts/query")
+@chart_cache.cached()
+async def traffic_query(
+    cameras: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    resolution: str = "auto",
+    metrics: Optional[str] = None,
+):
+    """
+    Chuỗi của nhiều camera trong khoảng [start, end) bất kỳ, dạng cột, đọc từ bảng rollup thô nhất
+    phù hợp với `resolution`.
+    `cameras`: `0,1,2`; `start` / `end`: ISO 8601 (không có múi giờ = giờ địa phương, bỏ trống end = hiện tại);
+    `resolution`: `auto` (mịn nhất không vượt giới hạn điểm) hoặc 1 trong QUERY_RESOLUTIONS;
+    `metrics`: cột flow_* / max_* / samples, mặc định flow_*.
+    """
+    try:
+        camera_ids = list(dict.fromkeys(int(c) for c in _split_param(cameras)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cameras phải là danh sách số nguyên, vd: 0,1,2")
+    if not camera_ids:
+        raise HTTPException(status_code=400, detail="Cần ít nhất 1 camera")
+
+    selected = _split_param(metrics) if metrics else [m for m in METRIC_COLUMNS if m.startswith("flow_")]
+    unknown = [m for m in selected if m not in METRIC_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Metric không hợp lệ: {', '.join(unknown)}. Hỗ trợ: {', '.join(METRIC_COLUMNS)}",
+        )
 
-        point = {
-            "label": idx.strftime("%H:%M"),  # đã là UTC+7 trong load_traffic_df
-            "value": val,
-            "is_peak": is_peak,
-            "timestamp": ts_iso,
-        }
-        points.append(point)
-
-        if is_peak:
-            peaks.append(
-                {
-                    "label": point["label"],
-                    "value": val,
-                    "timestamp": ts_iso,
-                }
+    start = _with_local_tz(start)
+    end = datetime.now(timezone.utc) if end is None else _with_local_tz(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end phải sau start")
+
+    max_points = settings_metric_transport.TRAFFIC_QUERY_MAX_POINTS
+    if resolution == "auto":
+        resolution = pick_resolution(start, end, len(camera_ids), max_points)
+        if resolution is None:
+            raise HTTPException(
+                status_code=400, detail=f"Khoảng thời gian quá dài: vượt {max_points} điểm kể cả theo ngày"
+            )
+    elif resolution not in QUERY_RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"resolution không hợp lệ: {resolution}. Hỗ trợ: auto, {', '.join(QUERY_RESOLUTIONS)}",
+        )
+    else:
+        points = count_buckets(start, end, resolution) * len(camera_ids)
+        if points > max_points:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{points} điểm vượt giới hạn {max_points}: chọn resolution thô hơn hoặc resolution=auto",
             )
 
-    return JSONResponse(
-        {
-            "camera_id": camera_id,
-            "points": points,
-            "peaks": peaks,
-            "period": f"{minutes}m",
-            "timezone": "Asia/Bangkok (UTC+7)",
-        }
+    return await db_executor.run(_render_range, camera_ids, start, end, resolution, selected)
+
+
+# ========================== EXPORT ==========================
+
+@router.get("/export/traffic-logs")
+async def export_traffic_logs(
+    start: datetime,
+    end: Optional[datetime] = None,
+    cameras: Optional[str] = None,
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+):
+    """
+    Tải log thô trong [start, end) dạng stream (chunked): đọc bằng server-side cursor,
+    ghi từng chunk nên bộ nhớ không tăng theo khoảng thời gian.
+    """
+    try:
+        camera_ids = [int(c) for c in _split_param(cameras)] if cameras else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cameras phải là danh sách số nguyên, vd: 0,1,2")
+    if format == "parquet" and pa is None:
+        raise HTTPException(status_code=400, detail="Server chưa cài pyarrow, không export được Parquet")
+
+    start = _with_local_tz(start)
+    end = datetime.now(timezone.utc) if end is None else _with_local_tz(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end phải sau start")
+
+    filename = f"traffic_logs_{start.astimezone(LOCAL_TZ):%Y%m%d%H%M}_{end.astimezone(LOCAL_TZ):%Y%m%d%H%M}.{format}"
+    # Generator đồng bộ: Starlette chạy từng bước trong threadpool, không chặn event loop
+    return StreamingResponse(
+        stream_export(start, end, camera_ids, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+@router.get("/analysis/processed")
+async def get_processed(
+    minutes: Optional[float] = None,
+    format: Literal["json", "arrow"] = "json",
+    layout: Literal["points", "columnar"] = "points",
+):
+    """
+    Kết quả phân tích theo bucket do analysis/ ghi (traffic_data.arrow), đọc bằng memory-map.
+    format=arrow trả nguyên Arrow IPC stream cho client đọc được Arrow (pyarrow, apache-arrow JS).
+    """
+    if pa is None:
+        raise HTTPException(status_code=400, detail="Server chưa cài pyarrow, không đọc được file Arrow")
+    table = await asyncio.to_thread(processed_store.load)
+    if table is None:
+        raise HTTPException(status_code=404, detail="Chưa có kết quả phân tích (chạy analysis/realtime_loop.py)")
+    table = tail_minutes(table, minutes)
+    if format == "arrow":
+        return Response(content=to_ipc_bytes(table), media_type="application/vnd.apache.arrow.stream")
+    return FastJSONResponse(processed_payload(table, processed_store.updated_at(), layout=layout))
+
+
 # ========================== WEBSOCKETS ==========================
 
 @router.websocket("/ws/frames/{camera_id}")
@@ -655,6 +669,26 @@ async def ws_frames(websocket: WebSocket, camera_id: int):
             await asyncio.sleep(0.05) 
     except Exception: pass
 
+@router.websocket("/ws/peaks")
+async def ws_peaks(websocket: WebSocket, camera_id: Optional[int] = None):
+    """
+    Sự kiện peak_start / peak_end ngay khi detector trong process camera phát hiện.
+    Tin nhắn đầu tiên là snapshot các đợt đang diễn ra; `camera_id` bỏ trống = mọi camera.
+    """
+    await websocket.accept()
+    hub = sys_state.peak_hub
+    if hub is None:
+        await websocket.close(code=1011)
+        return
+    events = hub.subscribe(camera_id)
+    try:
+        await websocket.send_json({"event": "snapshot", "active": hub.snapshot(camera_id)})
+        while True:
+            await websocket.send_json(await events.get())
+    except Exception: pass
+    finally:
+        hub.unsubscribe(events)
+
 @router.websocket("/ws/info/{camera_id}")
 async def ws_info(websocket: WebSocket, camera_id: int):
     await websocket.accept()
@@ -666,6 +700,7 @@ async def ws_info(websocket: WebSocket, camera_id: int):
                 current_data = dict(sys_state.info_dict[key])
                 current_ts = current_data.get('timestamp', 0)
                 if current_ts != last_ts:
+                    current_data["anomaly"] = seasonal_baselines.snapshot(camera_id)
                     await websocket.send_json(current_data)
                     last_ts = current_ts
             await asyncio.sleep(0.5)
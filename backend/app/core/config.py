@@ -18,14 +18,16 @@ print(f".env exists: {env_path.exists()}")
 class SettingServer:
     PROJECT_NAME = "Smart Traffic Monitoring"
     DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{BASE_DIR}/data/chat.db")
+    # Token cho /admin/* (header X-Admin-Token); bỏ trống = tắt hẳn các endpoint admin
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 class SettingMetricTransport:
     """
     Traffic monitoring configuration
     """
     
-    #SỐ CAMERAS
-    NUM_CAMERAS = 2 
+    #SỐ CAMERAS (None = chạy tất cả camera có trong PATH_VIDEOS/REGIONS)
+    NUM_CAMERAS = int(os.getenv("NUM_CAMERAS")) if os.getenv("NUM_CAMERAS") else None
     
     # ROI REGIONS
     REGIONS = [
@@ -43,8 +45,113 @@ class SettingMetricTransport:
     ]
     
     
+    # MÚI GIỜ hiển thị / chia bucket ngày
+    LOCAL_TIMEZONE = os.getenv("LOCAL_TIMEZONE", "Asia/Bangkok")
+    
+    # GHI LOG GIAO THÔNG (TrafficLog)
+    # Camera đẩy 1 bản ghi/chu kỳ vào queue, 1 writer duy nhất gom batch ghi DB
+    TRAFFIC_LOG_INTERVAL_SECONDS = float(os.getenv("TRAFFIC_LOG_INTERVAL_SECONDS", "10"))
+    TRAFFIC_LOG_FLUSH_SECONDS = float(os.getenv("TRAFFIC_LOG_FLUSH_SECONDS", "5"))
+    TRAFFIC_LOG_BATCH_SIZE = int(os.getenv("TRAFFIC_LOG_BATCH_SIZE", "500"))
+    # Số bản ghi tối đa giữ trong RAM khi DB lỗi, quá thì bỏ bản ghi cũ nhất
+    TRAFFIC_LOG_MAX_BUFFER = int(os.getenv("TRAFFIC_LOG_MAX_BUFFER", "100000"))
+
+    # CACHE RESPONSE /charts: dùng chung cho mọi viewer, bị xoá khi có batch log mới của camera
+    CHART_CACHE_TTL_SECONDS = float(os.getenv("CHART_CACHE_TTL_SECONDS", "30"))
+    CHART_CACHE_MAX_ENTRIES = int(os.getenv("CHART_CACHE_MAX_ENTRIES", "512"))
+    # TRUY VẤN CHART: chạy trong thread pool riêng để không chặn event loop (WebSocket frame/info).
+    # Mỗi thread giữ 1 connection của engine đọc riêng; 0 = chạy thẳng trong event loop (chỉ để so sánh)
+    TRAFFIC_DB_WORKERS = int(os.getenv("TRAFFIC_DB_WORKERS", "2"))
+    # /charts/query: tối đa số điểm trả về (số bucket x số camera)
+    TRAFFIC_QUERY_MAX_POINTS = int(os.getenv("TRAFFIC_QUERY_MAX_POINTS", "20000"))
+    # EXPORT traffic_logs: số dòng mỗi lần đọc từ server-side cursor / mỗi chunk ghi ra
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+    # PHÁT HIỆN CAO ĐIỂM (streaming, trong process camera): mỗi PEAK_SAMPLE_SECONDS lấy số xe đi qua,
+    # so với trung bình / độ lệch chuẩn trượt (EWMA). z >= ENTER bắt đầu đợt cao điểm, z < EXIT kết thúc
+    PEAK_SAMPLE_SECONDS = float(os.getenv("PEAK_SAMPLE_SECONDS", "10"))
+    PEAK_EWMA_ALPHA = float(os.getenv("PEAK_EWMA_ALPHA", "0.02"))
+    PEAK_ENTER_Z = float(os.getenv("PEAK_ENTER_Z", "3"))
+    PEAK_EXIT_Z = float(os.getenv("PEAK_EXIT_Z", "1"))
+    # Chưa đủ số sample này thì chỉ học baseline, không báo
+    PEAK_WARMUP_SAMPLES = int(os.getenv("PEAK_WARMUP_SAMPLES", "30"))
+    # Đường vắng: độ lệch chuẩn tối thiểu và số xe / sample tối thiểu để tính là cao điểm
+    PEAK_MIN_STD = float(os.getenv("PEAK_MIN_STD", "1"))
+    PEAK_MIN_FLOW = int(os.getenv("PEAK_MIN_FLOW", "3"))
+    PEAK_EVENT_MAX_BUFFER = int(os.getenv("PEAK_EVENT_MAX_BUFFER", "1000"))
+
+    # DỰ BÁO NGẮN HẠN (job nền, ghi bảng traffic_forecasts): flow từng phút trong FORECAST_HORIZON_MINUTES tới,
+    # = flow cùng giờ hôm trước (làm trơn FORECAST_SEASON_SMOOTH phút) + độ lệch gần đây làm trơn mũ (ALPHA),
+    # độ lệch giảm dần theo hệ số FORECAST_DAMPING mỗi phút. Chưa đủ 1 ngày dữ liệu thì chỉ làm trơn mũ
+    FORECAST_INTERVAL_SECONDS = float(os.getenv("FORECAST_INTERVAL_SECONDS", "60"))
+    FORECAST_HORIZON_MINUTES = int(os.getenv("FORECAST_HORIZON_MINUTES", "60"))
+    FORECAST_HISTORY_HOURS = float(os.getenv("FORECAST_HISTORY_HOURS", "26"))
+    FORECAST_SEASON_MINUTES = int(os.getenv("FORECAST_SEASON_MINUTES", "1440"))
+    FORECAST_SEASON_SMOOTH = int(os.getenv("FORECAST_SEASON_SMOOTH", "15"))
+    FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.3"))
+    FORECAST_DAMPING = float(os.getenv("FORECAST_DAMPING", "0.97"))
+    # Khoảng dự báo lower/upper = dự báo ± Z * độ lệch chuẩn sai số 1 bước (1.28 ~ 80%)
+    FORECAST_INTERVAL_Z = float(os.getenv("FORECAST_INTERVAL_Z", "1.28"))
+    # Camera không có dữ liệu trong N phút gần nhất thì bỏ qua (xoá dự báo cũ)
+    FORECAST_MAX_STALE_MINUTES = float(os.getenv("FORECAST_MAX_STALE_MINUTES", "30"))
+
+    # BASELINE THEO MÙA: phân phối flow / phút theo (thứ, khung BASELINE_BUCKET_HOURS giờ) của từng camera,
+    # lưu dạng t-digest (bảng traffic_baselines), cập nhật mỗi BASELINE_INTERVAL_SECONDS từ rollup 1 phút.
+    # Điểm bất thường = (flow - trung vị) / (IQR / 1.349); |điểm| >= BASELINE_ANOMALY_Z là bất thường
+    BASELINE_INTERVAL_SECONDS = float(os.getenv("BASELINE_INTERVAL_SECONDS", "30"))
+    BASELINE_BUCKET_HOURS = int(os.getenv("BASELINE_BUCKET_HOURS", "1"))
+    BASELINE_COMPRESSION = int(os.getenv("BASELINE_COMPRESSION", "100"))
+    BASELINE_BACKFILL_DAYS = float(os.getenv("BASELINE_BACKFILL_DAYS", "28"))
+    # Phút rollup của 1 camera tới trễ hơn camera mới nhất quá số phút này thì không cộng vào baseline
+    BASELINE_LATE_MINUTES = float(os.getenv("BASELINE_LATE_MINUTES", "60"))
+    BASELINE_ANOMALY_Z = float(os.getenv("BASELINE_ANOMALY_Z", "3"))
+    # Khung chưa đủ số phút này thì chưa chấm điểm; độ lệch tối thiểu (xe / phút) cho đường vắng
+    BASELINE_MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", "30"))
+    BASELINE_MIN_SCALE = float(os.getenv("BASELINE_MIN_SCALE", "1"))
+
+    # KẾT QUẢ PHÂN TÍCH của analysis/ (export_for_backend, Arrow IPC) cho GET /analysis/processed
+    PROCESSED_DATA_PATH = os.getenv("PROCESSED_DATA_PATH", str(BASE_DIR / "data" / "processed" / "traffic_data.arrow"))
+
+    # BẢO TRÌ traffic_logs: log thô cũ hơn N ngày được gom vào rollup giờ rồi xoá theo batch
+    TRAFFIC_LOG_RETENTION_DAYS = float(os.getenv("TRAFFIC_LOG_RETENTION_DAYS", "7"))
+    # Rollup 1 phút giữ lâu hơn log thô; rollup giờ / ngày giữ vĩnh viễn
+    TRAFFIC_ROLLUP_1M_RETENTION_DAYS = float(os.getenv("TRAFFIC_ROLLUP_1M_RETENTION_DAYS", "30"))
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+    RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    # Thư mục lưu log thô trước khi xoá (csv.gz theo ngày), bỏ trống = xoá hẳn
+    TRAFFIC_LOG_ARCHIVE_DIR = os.getenv("TRAFFIC_LOG_ARCHIVE_DIR", "")
+    # SQLite: chỉ chạy VACUUM (khoá cả DB) khi đã xoá ít nhất chừng này dòng
+    SQLITE_VACUUM_MIN_DELETED = int(os.getenv("SQLITE_VACUUM_MIN_DELETED", "100000"))
+    # PostgreSQL: tạo traffic_logs dạng partition theo ngày (chỉ áp dụng khi bảng chưa tồn tại)
+    TRAFFIC_LOG_PARTITIONING = os.getenv("TRAFFIC_LOG_PARTITIONING", "0") == "1"
+    TRAFFIC_LOG_PARTITIONS_AHEAD = int(os.getenv("TRAFFIC_LOG_PARTITIONS_AHEAD", "3"))
+    
     # MODEL PATH 
     MODELS_PATH = str(BASE_DIR / 'models' / 'best.pt')
+    # Export weight 1 lần ra file mmap được, các process camera map read-only dùng chung
+    SHARED_WEIGHTS = os.getenv("SHARED_WEIGHTS", "1") == "1"
+    
+    # ĐỘ PHÂN GIẢI XỬ LÝ (RESOLUTION GOVERNOR)
+    # Các bậc (width, height) từ cao xuống thấp. REGIONS được vẽ theo bậc đầu tiên
+    # và sẽ được scale tự động khi governor đổi bậc.
+    RESOLUTION_LADDER = [(854, 480), (640, 360), (512, 288)]
+    AUTO_RESOLUTION = os.getenv("AUTO_RESOLUTION", "1") == "1"
+    TARGET_FPS = float(os.getenv("TARGET_FPS", "12"))
+    # Ngưỡng CPU (%) của cả node: trên CPU_HIGH thì hạ bậc, dưới CPU_LOW mới cho nâng bậc
+    CPU_HIGH_PERCENT = float(os.getenv("CPU_HIGH_PERCENT", "90"))
+    CPU_LOW_PERCENT = float(os.getenv("CPU_LOW_PERCENT", "70"))
+    RESOLUTION_COOLDOWN_SECONDS = float(os.getenv("RESOLUTION_COOLDOWN_SECONDS", "15"))
+    
+    # SUPERVISOR: restart process camera bị crash với backoff luỹ thừa (giây)
+    RESTART_BACKOFF_BASE = float(os.getenv("RESTART_BACKOFF_BASE", "1"))
+    RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", "60"))
+    # Process sống quá khoảng này thì coi là ổn định, reset bộ đếm restart
+    RESTART_STABLE_SECONDS = float(os.getenv("RESTART_STABLE_SECONDS", "120"))
+    
+    # CPU AFFINITY: chia core cho các process camera, tránh oversubscribe thread pool
+    CPU_PINNING = os.getenv("CPU_PINNING", "1") == "1"
+    # None = tự chia đều số core cho số camera đang chạy
+    THREADS_PER_WORKER = int(os.getenv("THREADS_PER_WORKER")) if os.getenv("THREADS_PER_WORKER") else None
     
     #DEVICE CONFIGURATION
     DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -73,6 +180,17 @@ class SettingMetricTransport:
     def get_available_cameras(cls):
         return min(len(cls.PATH_VIDEOS), len(cls.REGIONS))
 
+    @classmethod
+    def get_camera_specs(cls):
+        """Danh sách camera khởi động cùng server: [{camera_id, url, region}]"""
+        count = cls.get_available_cameras()
+        if cls.NUM_CAMERAS is not None:
+            count = min(count, cls.NUM_CAMERAS)
+        return [
+            {"camera_id": i, "url": cls.PATH_VIDEOS[i], "region": np.asarray(cls.REGIONS[i]).tolist()}
+            for i in range(count)
+        ]
+
 
 class SettingChatBot:
     """Chatbot RAG configuration"""
@@ -1,11 +1,12 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.core.config import settings_server
+from app.core.config import settings_server, settings_metric_transport
 
 ASYNC_DATABASE_URL = settings_server.DATABASE_URL
 
-SYNC_DATABASE_URL = ASYNC_DATABASE_URL.replace("+asyncpg", "")
+# Engine sync dùng driver mặc định của dialect (psycopg2 / sqlite3)
+SYNC_DATABASE_URL = ASYNC_DATABASE_URL.replace("+asyncpg", "").replace("+aiosqlite", "")
 
 
 engine = create_async_engine(
@@ -35,6 +36,22 @@ SessionLocal = sessionmaker(
     bind=sync_engine
 )
 
+# Engine đọc cho các endpoint traffic, dùng trong app.db.executor: pool riêng đúng bằng
+# số thread nên truy vấn chart không tranh connection với writer / job bảo trì
+read_engine = create_engine(
+    SYNC_DATABASE_URL,
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=max(settings_metric_transport.TRAFFIC_DB_WORKERS, 1),
+    max_overflow=0,
+)
+
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine
+)
+
 Base = declarative_base()
 
 
@@ -45,15 +62,37 @@ async def create_tables():
     """
     # Import tất cả models vào đây để SQLAlchemy nhận diện
     from app.models.chat_message import ChatMessage
-    # from app.models.traffic_log import TrafficLog (Nếu bạn đã tạo file này)
+    from app.models.traffic_logs import TrafficLog
+    from app.models import traffic_rollups, traffic_peaks, traffic_forecasts, traffic_baselines
 
     async with engine.begin() as conn:
         # Xóa comment dòng dưới nếu muốn reset sạch DB mỗi lần chạy (Cẩn thận!)
         # await conn.run_sync(Base.metadata.drop_all)
         
+        # PostgreSQL + TRAFFIC_LOG_PARTITIONING: traffic_logs được tạo dạng partition theo ngày
+        from app.services.traffic_services.retention import create_partitioned_log_table
+        await conn.run_sync(create_partitioned_log_table)
+
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns, TrafficLog.__table__)
         print(" Database tables created successfully")
 
+
+def _add_missing_columns(conn, table):
+    """
+    create_all không sửa bảng đã tồn tại: thêm các cột mới (nullable) còn thiếu,
+    ví dụ delta_* / session_id / is_reset của traffic_logs trên DB cũ.
+    """
+    from sqlalchemy import inspect
+
+    existing = {col["name"] for col in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        col_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}")
+        print(f" Added column {table.name}.{column.name}")
+
 async def get_db():
     """
     Dependency Async cho FastAPI Router
@@ -0,0 +1,51 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings_metric_transport
+from app.db.base import ReadSessionLocal
+
+
+class DBExecutor:
+    """
+    Chạy code DB đồng bộ (SQLAlchemy sync + pandas) từ endpoint async mà không chặn event loop.
+
+    - Số thread cố định (TRAFFIC_DB_WORKERS); request vượt quá sẽ xếp hàng thay vì mở thêm
+      connection.
+    - Mỗi lần gọi mở 1 session từ `session_factory` trong thread, đóng khi xong.
+    - max_workers = 0: chạy thẳng trong event loop (hành vi cũ, dùng để so sánh trong benchmark).
+    """
+
+    def __init__(self, max_workers=None, session_factory=ReadSessionLocal):
+        self.max_workers = (
+            max_workers if max_workers is not None else settings_metric_transport.TRAFFIC_DB_WORKERS
+        )
+        self.session_factory = session_factory
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="traffic-db")
+        return self._pool
+
+    def _call(self, fn, args, kwargs):
+        db = self.session_factory()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    async def run(self, fn, *args, **kwargs):
+        """await run(fn, ...) -> fn(db, ...) chạy trong thread pool."""
+        if self.max_workers <= 0:
+            return self._call(fn, args, kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), functools.partial(self._call, fn, args, kwargs))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+db_executor = DBExecutor()
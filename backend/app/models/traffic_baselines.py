@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, LargeBinary
+from app.db.base import Base
+
+
+class TrafficBaseline(Base):
+    """
+    Phân phối flow theo phút của 1 camera trong 1 khung (thứ trong tuần, khung giờ địa phương),
+    lưu dạng t-digest nén (baselines.TDigest.to_bytes, vài trăm byte / khung).
+    last_bucket: phút (UTC) mới nhất đã cộng vào digest, để chạy tiếp sau khi khởi động lại.
+    """
+    __tablename__ = "traffic_baselines"
+
+    camera_id = Column(Integer, primary_key=True)
+    # 0 = thứ Hai ... 6 = Chủ nhật
+    weekday = Column(Integer, primary_key=True)
+    # Khung giờ thứ `slot` trong ngày, mỗi khung BASELINE_BUCKET_HOURS giờ
+    slot = Column(Integer, primary_key=True)
+    digest = Column(LargeBinary, nullable=False)
+    samples = Column(Integer, default=0, nullable=False)
+    last_bucket = Column(DateTime(timezone=True), nullable=False)
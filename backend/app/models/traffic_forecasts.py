@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, DateTime, Float, String
+from app.db.base import Base
+
+
+class TrafficForecast(Base):
+    """
+    Dự báo flow (số xe / phút) cho các phút sắp tới của 1 camera, do job dự báo chạy nền ghi lại.
+    Mỗi lần chạy thay toàn bộ bảng trong 1 transaction; endpoint chỉ đọc theo khoá chính.
+    bucket_start / generated_at lưu theo UTC.
+    """
+    __tablename__ = "traffic_forecasts"
+
+    camera_id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    # Số phút tính từ mốc dự báo (1 = phút đang diễn ra)
+    horizon = Column(Integer, nullable=False)
+    generated_at = Column(DateTime(timezone=True), nullable=False)
+    method = Column(String(32), nullable=False)
+    flow_car = Column(Float, default=0.0, nullable=False)
+    flow_motor = Column(Float, default=0.0, nullable=False)
+    flow_bus = Column(Float, default=0.0, nullable=False)
+    flow_truck = Column(Float, default=0.0, nullable=False)
+    flow_total = Column(Float, default=0.0, nullable=False)
+    # Khoảng dự báo của flow_total (FORECAST_INTERVAL_Z độ lệch chuẩn)
+    lower_total = Column(Float, default=0.0, nullable=False)
+    upper_total = Column(Float, default=0.0, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, Float, Index
+from sqlalchemy import Column, Integer, DateTime, Float, Index, String, Boolean
 from sqlalchemy.sql import func
 from app.db.base import Base
 
@@ -14,6 +14,15 @@ class TrafficLog(Base):
     count_truck = Column(Integer, default=0)
     total_vehicles = Column(Integer, default=0)
     fps = Column(Float, default=0.0)
+    # Số xe trong khoảng từ bản ghi trước đến bản ghi này (writer tính khi ghi)
+    delta_car = Column(Integer, default=0)
+    delta_motor = Column(Integer, default=0)
+    delta_bus = Column(Integer, default=0)
+    delta_truck = Column(Integer, default=0)
+    delta_total = Column(Integer, default=0)
+    # Mỗi lần process camera khởi động có 1 session_id mới, bộ đếm bắt đầu lại từ 0
+    session_id = Column(String(32), nullable=True)
+    is_reset = Column(Boolean, default=False)
     __table_args__ = (
         Index('idx_camera_timestamp', 'camera_id', 'timestamp'),
     )
\ No newline at end of file
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, DateTime, Float, Index, String
+from app.db.base import Base
+
+
+class TrafficPeak(Base):
+    """
+    1 đợt cao điểm do bộ phát hiện streaming trong process camera báo về
+    (peak_start tạo dòng, peak_end điền ended_at). Thời gian lưu theo UTC.
+    """
+    __tablename__ = "traffic_peaks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    peak_uid = Column(String(32), nullable=False, unique=True)
+    camera_id = Column(Integer, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    ended_at = Column(DateTime(timezone=True), nullable=True)
+    sample_seconds = Column(Float, nullable=False)
+    # Số xe / sample lúc bắt đầu và lớn nhất trong đợt
+    start_value = Column(Float, default=0.0)
+    peak_value = Column(Float, default=0.0)
+    baseline_mean = Column(Float, default=0.0)
+    baseline_std = Column(Float, default=0.0)
+    z_score = Column(Float, default=0.0)
+    samples = Column(Integer, default=1)
+    __table_args__ = (
+        Index('idx_peak_camera_started', 'camera_id', 'started_at'),
+    )
@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, DateTime, Index
+from app.db.base import Base
+
+
+class TrafficRollupMixin:
+    """
+    Bảng tổng hợp theo bucket thời gian cho 1 camera.
+    - flow_*: số xe đi qua trong bucket (cộng các delta giữa 2 bản ghi log liên tiếp)
+    - max_*: giá trị cộng dồn lớn nhất trong bucket (tương đương resample().max())
+    bucket_start lưu theo UTC.
+    """
+    camera_id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    flow_car = Column(Integer, default=0, nullable=False)
+    flow_motor = Column(Integer, default=0, nullable=False)
+    flow_bus = Column(Integer, default=0, nullable=False)
+    flow_truck = Column(Integer, default=0, nullable=False)
+    flow_total = Column(Integer, default=0, nullable=False)
+    max_car = Column(Integer, default=0, nullable=False)
+    max_motor = Column(Integer, default=0, nullable=False)
+    max_bus = Column(Integer, default=0, nullable=False)
+    max_truck = Column(Integer, default=0, nullable=False)
+    max_total = Column(Integer, default=0, nullable=False)
+    samples = Column(Integer, default=0, nullable=False)
+
+
+class TrafficRollup1m(TrafficRollupMixin, Base):
+    __tablename__ = "traffic_rollup_1m"
+    __table_args__ = (
+        Index('idx_rollup_1m_bucket', 'bucket_start'),
+    )
+
+
+class TrafficRollup1h(TrafficRollupMixin, Base):
+    __tablename__ = "traffic_rollup_1h"
+    __table_args__ = (
+        Index('idx_rollup_1h_bucket', 'bucket_start'),
+    )
+
+
+class TrafficRollup1d(TrafficRollupMixin, Base):
+    __tablename__ = "traffic_rollup_1d"
+    __table_args__ = (
+        Index('idx_rollup_1d_bucket', 'bucket_start'),
+    )
@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class CameraCreate(BaseModel):
+    """Schema thêm camera mới khi server đang chạy"""
+    camera_id: Optional[int] = Field(default=None, ge=0, description="Bỏ trống để tự cấp ID kế tiếp")
+    url: str = Field(..., min_length=1, description="Link YouTube live hoặc stream URL")
+    region: List[List[int]] = Field(..., min_length=3, description="Polygon ROI [[x, y], ...] theo khung 854x480")
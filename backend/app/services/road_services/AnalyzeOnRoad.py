@@ -1,10 +1,13 @@
 from datetime import datetime
 import traceback
-from app.services.road_services.AnalyzeOnRoadBase import AnalyzeOnRoadBase
+from app.core.config import settings_metric_transport
+from app.utils.cpu_affinity import apply_worker_layout
 
 
 
-def run_analyzer(video_index, shared_dict, result_queue, frame_dict=None, show_window=False):
+def run_analyzer(video_index, shared_dict, result_queue, frame_dict=None, show_window=False,
+                 path_video=None, region=None, cpu_set=None, num_threads=None,
+                 shared_weights=None, spawned_at=None, log_queue=None, peak_queue=None):
     """
     Wrapper function để chạy Analyzer trong Process riêng biệt.
     
@@ -14,8 +17,20 @@ def run_analyzer(video_index, shared_dict, result_queue, frame_dict=None, show_w
         result_queue (Queue): Để báo trạng thái (start/error)
         frame_dict (Manager.dict): Để lưu hình ảnh realtime (byte jpg)
         show_window (bool): Có hiện cửa sổ CV2 không (thường là False trên server)
+        path_video (str): URL video, None = lấy theo config
+        region (list): Polygon ROI [[x, y], ...], None = lấy theo config
+        cpu_set (list): Các core được pin cho process này, None = không pin
+        num_threads (int): Số thread torch/OpenCV/OpenMP, None = len(cpu_set)
+        shared_weights (str): File weight đã export để mmap dùng chung, None = nạp best.pt
+        spawned_at (float): Thời điểm supervisor spawn process (đo time-to-first-count)
+        log_queue (Queue): Queue bản ghi TrafficLog gửi cho writer của API
+        peak_queue (Queue): Queue sự kiện cao điểm gửi cho PeakEventHub của API
     """
     try:
+        # Pin core + giới hạn thread trước khi nạp model
+        apply_worker_layout(cpu_set, num_threads)
+        from app.services.road_services.AnalyzeOnRoadBase import AnalyzeOnRoadBase
+
         # Khởi tạo Analyzer
         analyzer = AnalyzeOnRoadBase(
             video_index=video_index,
@@ -24,7 +39,13 @@ def run_analyzer(video_index, shared_dict, result_queue, frame_dict=None, show_w
             frame_dict=frame_dict,  # <--- Đã truyền đúng tham số này
             show=show_window,
             auto_save=True,
-            save_interval_seconds=60
+            save_interval_seconds=settings_metric_transport.TRAFFIC_LOG_INTERVAL_SECONDS,
+            path_video=path_video,
+            region=region,
+            shared_weights=shared_weights,
+            spawned_at=spawned_at,
+            log_queue=log_queue,
+            peak_queue=peak_queue,
         )
         
         # Bắt đầu vòng lặp xử lý video
@@ -45,5 +66,6 @@ def run_analyzer(video_index, shared_dict, result_queue, frame_dict=None, show_w
             result_queue.put({
                 'camera': video_index,
                 'status': 'error',
-                'error': str(e)
+                'error': str(e),
+                'timestamp': datetime.now().timestamp()
             })
\ No newline at end of file
@@ -1,7 +1,8 @@
 import cv2
+import queue
+import uuid
 import numpy as np
-from datetime import datetime
-from ultralytics import YOLO
+from datetime import datetime, timezone
 import yt_dlp
 from pathlib import Path
 import traceback
@@ -10,6 +11,10 @@ from app.core.config import settings_metric_transport
 import os
 from app.db.base import SessionLocal
 from app.models.traffic_logs import TrafficLog
+from app.services.traffic_services.deltas import DeltaTracker
+from app.services.traffic_services.peaks import PeakMonitor
+from app.services.road_services.ResolutionGovernor import ResolutionGovernor
+from app.services.road_services.SharedWeights import load_yolo, process_memory_mb
 
 class AnalyzeOnRoadBase:
     """
@@ -18,53 +23,90 @@ class AnalyzeOnRoadBase:
 
     def __init__(self, video_index=0, shared_dict=None, result_queue=None,
                  show=False, count_conf=0.4, frame_dict=None,
-                 auto_save=True, save_interval_seconds=60):
+                 auto_save=True, save_interval_seconds=60,
+                 path_video=None, region=None, shared_weights=None, spawned_at=None,
+                 log_queue=None, peak_queue=None):
 
         # --- Validation ---
-        if video_index >= len(settings_metric_transport.PATH_VIDEOS):
-            raise ValueError(f"Video index {video_index} out of range.")
+        # Camera thêm nóng qua admin API truyền thẳng path_video/region, không cần có trong config
+        if path_video is None or region is None:
+            if video_index >= settings_metric_transport.get_available_cameras():
+                raise ValueError(f"Video index {video_index} out of range.")
         
         # --- Config ---
         self.video_index = video_index
-        self.path_video = settings_metric_transport.PATH_VIDEOS[video_index]
+        self.path_video = path_video if path_video is not None else settings_metric_transport.PATH_VIDEOS[video_index]
         self.model_path = settings_metric_transport.MODELS_PATH
         self.device = settings_metric_transport.DEVICE
-        raw_roi = settings_metric_transport.REGIONS[video_index]
-        self.roi_pts = np.array(raw_roi, dtype=np.int32).reshape((-1, 1, 2))
+        raw_roi = region if region is not None else settings_metric_transport.REGIONS[video_index]
+        # ROI gốc được vẽ theo bậc độ phân giải đầu tiên của ladder
+        self.base_roi = np.array(raw_roi, dtype=np.float32).reshape((-1, 1, 2))
+        self.base_width, self.base_height = settings_metric_transport.RESOLUTION_LADDER[0]
 
         # --- Shared Data ---
         self.shared_dict = shared_dict
         self.frame_dict = frame_dict    
         self.result_queue = result_queue
+        # Queue tới TrafficLogWriter của API; None = chạy độc lập, tự ghi DB
+        self.log_queue = log_queue
+        # Queue sự kiện cao điểm tới PeakEventHub của API; None = chỉ in ra
+        self.peak_queue = peak_queue
         self.show = show
         self.count_conf = count_conf
 
         self.skip_frames = 3     
         
-        self.process_width = 854   
-        self.process_height = 480  
+        self.governor = None
+        if settings_metric_transport.AUTO_RESOLUTION:
+            self.governor = ResolutionGovernor(
+                settings_metric_transport.RESOLUTION_LADDER,
+                target_fps=settings_metric_transport.TARGET_FPS,
+                cpu_high=settings_metric_transport.CPU_HIGH_PERCENT,
+                cpu_low=settings_metric_transport.CPU_LOW_PERCENT,
+                cooldown_seconds=settings_metric_transport.RESOLUTION_COOLDOWN_SECONDS,
+            )
+        self._apply_resolution(self.base_width, self.base_height)
+        self.infer_ms = 0.0
         
         self.last_result = None
         
         #Auto Save
         self.auto_save = auto_save
         self.save_interval_seconds = save_interval_seconds
-        self.last_save_time = datetime.now()
+        self.last_save_time = datetime.now(timezone.utc)
         self.session_start_time = datetime.now()
+        # Bộ đếm của process này bắt đầu từ 0 -> writer dùng session_id để nhận biết reset
+        self.session_id = uuid.uuid4().hex
+        self.delta_tracker = DeltaTracker()
+        self.peak_monitor = PeakMonitor(video_index)
         
         self.logs_dir = Path("logs/traffic_count")
         self.logs_dir.mkdir(parents=True, exist_ok=True)
 
         self.current_day = datetime.now().date()
+
+        # Đo thời gian khởi động: từ lúc supervisor spawn process tới lần đếm đầu tiên
+        self.spawned_at = spawned_at or time.time()
+        self.time_to_first_count = None
+        self.rss_mb, self.pss_mb = None, None
         try:
-            self.model = YOLO(self.model_path)
-            print(f"[Camera {video_index}] Model loaded")
+            t_load = time.perf_counter()
+            self.model = load_yolo(self.model_path, shared_weights)
+            self.model_load_ms = (time.perf_counter() - t_load) * 1000
+            self.rss_mb, self.pss_mb = process_memory_mb()
+            print(f"[Camera {video_index}] Model loaded in {self.model_load_ms:.0f} ms "
+                  f"({'shared' if shared_weights else 'private'} weights, RSS={self.rss_mb} MB)")
         except Exception as e:
             print(f"[Camera {video_index}] Model load failed: {e}")
             raise
 
         # Tracking State
         self.tracked_objects = {}
+        # ID của tracker được cộng id_base: sau khi reset tracker, ID mới không trùng ID đã đếm
+        self.id_base = 0
+        self.max_obj_id = -1
+        # Frame đầu sau khi reset tracker: chỉ ghi nhận trạng thái, không đếm xe đã nằm sẵn trong ROI
+        self.reseed_tracks = False
         self.counted_ids = {}
         self.count_entering = {}
         self.count_exiting = {}
@@ -74,6 +116,27 @@ class AnalyzeOnRoadBase:
         self.is_running = True
 
     # --- Helper Methods ---
+    def _apply_resolution(self, width, height):
+        """Đổi kích thước xử lý và scale ROI theo cùng tỉ lệ."""
+        self.process_width = int(width)
+        self.process_height = int(height)
+        scale = np.array([width / self.base_width, height / self.base_height], dtype=np.float32)
+        self.roi_pts = np.round(self.base_roi * scale).astype(np.int32)
+
+    def _switch_resolution(self, width, height):
+        """
+        Đổi độ phân giải giữa chừng: trạng thái tracker (Kalman) đang theo toạ độ cũ nên được reset,
+        xe đang trong ROI sẽ có ID mới -> frame kế tiếp chỉ ghi nhận lại, không đếm lần 2.
+        """
+        self._apply_resolution(width, height)
+        # Kết quả cũ có toạ độ theo kích thước cũ, không vẽ lại lên frame mới
+        self.last_result = None
+        for tracker in getattr(getattr(self.model, 'predictor', None), 'trackers', None) or []:
+            tracker.reset()
+        self.tracked_objects = {}
+        self.id_base = self.max_obj_id + 1
+        self.reseed_tracks = True
+
     def _is_inside_roi(self, cx, cy):
         return cv2.pointPolygonTest(self.roi_pts, (float(cx), float(cy)), False) >= 0
 
@@ -85,13 +148,15 @@ class AnalyzeOnRoadBase:
         if ids is None:
             self.current_in_roi = {}
             return
+        reseed, self.reseed_tracks = self.reseed_tracks, False
         current_frame_ids = set()
         temp_current_in_roi = {}
         for i in range(len(boxes)):
             if confs[i] < self.count_conf: continue
             x1, y1, x2, y2 = boxes[i]
             cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-            obj_id = int(ids[i])
+            obj_id = self.id_base + int(ids[i])
+            self.max_obj_id = max(self.max_obj_id, obj_id)
             class_name = names[int(classes[i])]
             is_inside_now = self._is_inside_roi(cx, cy)
             
@@ -101,7 +166,7 @@ class AnalyzeOnRoadBase:
             current_frame_ids.add(obj_id)
             if obj_id not in self.tracked_objects:
                 self.tracked_objects[obj_id] = {'was_inside': is_inside_now, 'class': class_name}
-                if is_inside_now:
+                if is_inside_now and not reseed:
                     self._update_set(self.counted_ids, class_name, obj_id)
                     self._update_set(self.count_entering, class_name, obj_id)
                 continue
@@ -133,19 +198,18 @@ class AnalyzeOnRoadBase:
                 'total_entered': total_entered,
                 'total_current': total_current,
                 'timestamp': datetime.now().timestamp(),
+                'resolution': f"{self.process_width}x{self.process_height}",
+                'infer_ms': round(self.infer_ms, 1),
+                'model_load_ms': round(self.model_load_ms, 1),
+                'time_to_first_count': self.time_to_first_count,
+                'rss_mb': self.rss_mb,
+                'pss_mb': self.pss_mb,
+                'peak': self.peak_monitor.state(),
                 'details': {cls: {'entered': len(self.counted_ids.get(cls, set())), 'current': self.current_in_roi.get(cls, 0)} for cls in all_classes}
             }
         except Exception: pass
 
-    def _check_and_save(self):
-        """Auto-save thống kê vào PostgreSQL database."""
-        if not self.auto_save: return
-
-        now = datetime.now()
-        if (now - self.last_save_time).total_seconds() < self.save_interval_seconds:
-            return
-
-        # Tính toán số lượng
+    def _build_log_row(self, now):
         car_count = len(self.counted_ids.get("car", set()))
         
         # Gộp tất cả biến thể xe máy
@@ -160,22 +224,65 @@ class AnalyzeOnRoadBase:
         truck_count = len(self.counted_ids.get("truck", set()))
         total_vehicles = car_count + motor_count + bus_count + truck_count
 
-        # Ghi vào DB
+        return {
+            'camera_id': self.video_index,
+            'timestamp': now,
+            'count_car': int(car_count),
+            'count_motor': int(motor_count),
+            'count_bus': int(bus_count),
+            'count_truck': int(truck_count),
+            'total_vehicles': int(total_vehicles),
+            'fps': round(self.current_fps, 1),
+            'session_id': self.session_id,
+        }
+
+    def _check_and_save(self):
+        """Mỗi save_interval_seconds đẩy 1 bản ghi thống kê cho TrafficLogWriter."""
+        if not self.auto_save: return
+
+        now = datetime.now(timezone.utc)
+        if (now - self.last_save_time).total_seconds() < self.save_interval_seconds:
+            return
+        self.last_save_time = now
+        row = self._build_log_row(now)
+
+        if self.log_queue is None:
+            self._save_direct(row)
+            return
+        try:
+            # Không bao giờ chờ DB: queue đầy thì bỏ bản ghi này (bản sau vẫn là số cộng dồn)
+            self.log_queue.put_nowait(row)
+        except queue.Full:
+            print(f"[Cam {self.video_index}] Log queue full, skip 1 record")
+        except Exception as e:
+            print(f"[Cam {self.video_index}] Error queue log: {e}")
+
+    def _check_peaks(self):
+        """Mỗi frame đưa tổng xe đã đếm vào detector cao điểm; sự kiện được gửi ngay, không chờ batch log."""
+        total = sum(len(ids) for ids in self.counted_ids.values())
+        event = self.peak_monitor.observe(time.time(), total)
+        if event is None:
+            return
+        if self.peak_queue is None:
+            print(f"[Cam {self.video_index}] {event['event']}: {event['value']} xe/{event['sample_seconds']:.0f}s "
+                  f"(baseline {event['baseline_mean']:.1f} ± {event['baseline_std']:.1f})")
+            return
+        try:
+            self.peak_queue.put_nowait(event)
+        except queue.Full:
+            print(f"[Cam {self.video_index}] Peak queue full, skip {event['event']}")
+        except Exception as e:
+            print(f"[Cam {self.video_index}] Error queue peak: {e}")
+
+    def _save_direct(self, row):
+        """Chế độ chạy độc lập (không có API): ghi thẳng 1 dòng vào DB."""
         db = SessionLocal()
         try:
-            log = TrafficLog(
-                camera_id=self.video_index,
-                timestamp=now,
-                count_car=int(car_count),
-                count_motor=int(motor_count),
-                count_bus=int(bus_count),
-                count_truck=int(truck_count),
-                total_vehicles=int(total_vehicles),
-                fps=round(self.current_fps, 1)
-            )
-            db.add(log)
+            self.delta_tracker.prime(db, [self.video_index])
+            state = self.delta_tracker.annotate([row])
+            db.add(TrafficLog(**row))
             db.commit()
-            self.last_save_time = now
+            self.delta_tracker.commit(state)
         except Exception as e:
             print(f"[Cam {self.video_index}] Error saving DB: {e}")
             db.rollback()
@@ -185,7 +292,9 @@ class AnalyzeOnRoadBase:
     def process_single_frame(self, frame):
         # Logic Skip Frame
         if self.frame_count % self.skip_frames == 0:
+            t_infer = time.perf_counter()
             results = self.model.track(frame, persist=True, device=self.device, conf=0.25, iou=0.5, verbose=False)
+            self.infer_ms = (time.perf_counter() - t_infer) * 1000
             r = results[0]
             self.last_result = r
             if r.boxes is not None and len(r.boxes) > 0:
@@ -195,6 +304,9 @@ class AnalyzeOnRoadBase:
                 ids = r.boxes.id.cpu().numpy().astype(int) if r.boxes.id is not None else None
                 self._count_objects(boxes, classes, confs, ids, r.names)
             else: self.current_in_roi = {}
+            if self.time_to_first_count is None:
+                self.time_to_first_count = round(time.time() - self.spawned_at, 2)
+                print(f"[Camera {self.video_index}] Time to first count: {self.time_to_first_count}s")
             plotted = r.plot()
         else:
             if self.last_result is not None: plotted = self.last_result.plot(img=frame)
@@ -237,7 +349,7 @@ class AnalyzeOnRoadBase:
         return youtube_url
 
     def process_video(self):
-        print(f"[Camera {self.video_index}] START MONITORING (720p Input, 480p Process)")
+        print(f"[Camera {self.video_index}] START MONITORING (720p Input, {self.process_width}x{self.process_height} Process)")
         while self.is_running:
             try:
                 stream_url = self.get_stream_url(self.path_video)
@@ -266,12 +378,21 @@ class AnalyzeOnRoadBase:
                         except Exception: pass
 
                     self.frame_count += 1
+                    if self.frame_count % 500 == 0:
+                        self.rss_mb, self.pss_mb = process_memory_mb()
+                    self._check_peaks()
                     self._update_shared_data()
                     self._check_and_save()
 
                     delta = (datetime.now() - t0).total_seconds()
                     self.current_fps = 1 / (delta + 1e-6)
 
+                    if self.governor is not None and self.governor.observe(delta):
+                        new_w, new_h = self.governor.resolution
+                        print(f"[Cam {self.video_index}] Resolution {self.process_width}x{self.process_height} -> {new_w}x{new_h} "
+                              f"(fps={self.governor.last_fps:.1f}, cpu={self.governor.last_cpu})")
+                        self._switch_resolution(new_w, new_h)
+
                     if self.show:
                         cv2.imshow(f"Cam {self.video_index}", plotted)
                         if cv2.waitKey(1) & 0xFF == ord('q'): 
@@ -0,0 +1,290 @@
+import asyncio
+import queue
+import threading
+import time
+from multiprocessing import Process
+
+from app.core.config import settings_metric_transport
+from app.services.road_services.AnalyzeOnRoad import run_analyzer
+from app.utils.cpu_affinity import plan_worker_layout, pin_process_threads, spawn_env
+
+
+class CameraWorker:
+    """Trạng thái của 1 process camera do supervisor quản lý."""
+
+    def __init__(self, camera_id, url, region):
+        self.camera_id = int(camera_id)
+        self.url = url
+        self.region = region
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.next_restart_at = None
+        self.last_error = None
+        self.last_exit_code = None
+        self.cpu_set = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def status(self):
+        return {
+            'camera_id': self.camera_id,
+            'url': self.url,
+            'region': self.region,
+            'pid': self.process.pid if self.process is not None else None,
+            'alive': self.is_alive(),
+            'started_at': self.started_at,
+            'restarts': self.restarts,
+            'next_restart_at': self.next_restart_at,
+            'last_error': self.last_error,
+            'last_exit_code': self.last_exit_code,
+            'cpu_set': self.cpu_set,
+        }
+
+
+class CameraSupervisor:
+    """
+    Quản lý các process run_analyzer:
+    - Khởi động song song toàn bộ camera trong config (không sleep giữa các lần spawn)
+    - Đọc result_queue để ghi nhận lỗi từ process con
+    - Restart process chết với exponential backoff
+    - Thêm / gỡ camera khi server đang chạy
+    """
+
+    def __init__(self, info_dict, frame_dict, result_queue,
+                 backoff_base=None, backoff_max=None, stable_seconds=None,
+                 cpu_pinning=None, threads_per_worker=None, shared_weights=None,
+                 log_queue=None, peak_queue=None):
+        self.info_dict = info_dict
+        self.frame_dict = frame_dict
+        self.result_queue = result_queue
+        self.backoff_base = backoff_base or settings_metric_transport.RESTART_BACKOFF_BASE
+        self.backoff_max = backoff_max or settings_metric_transport.RESTART_BACKOFF_MAX
+        self.stable_seconds = stable_seconds or settings_metric_transport.RESTART_STABLE_SECONDS
+        self.cpu_pinning = settings_metric_transport.CPU_PINNING if cpu_pinning is None else cpu_pinning
+        self.threads_per_worker = threads_per_worker or settings_metric_transport.THREADS_PER_WORKER
+        # File weight mmap dùng chung cho mọi camera (None = mỗi process tự nạp best.pt)
+        self.shared_weights = shared_weights
+        self.log_queue = log_queue
+        self.peak_queue = peak_queue
+        self.workers = {}
+        self._stopping = False
+        # Admin API chạy trong threadpool, vòng giám sát chạy trên event loop
+        self._lock = threading.RLock()
+
+    # --- CPU layout ---
+    def _rebalance(self):
+        """
+        Chia lại core theo số camera hiện có cho các process đang chạy:
+        - dải core đổi nhưng số core giữ nguyên: re-pin mọi thread của process;
+        - số core đổi: restart process, vì số thread torch/OpenMP/OpenCV chỉ đặt được lúc khởi động.
+        """
+        if not self.cpu_pinning:
+            return
+        workers = sorted(self.workers.values(), key=lambda w: w.camera_id)
+        layout = plan_worker_layout(len(workers), threads_per_worker=self.threads_per_worker)
+        for worker, cpu_set in zip(workers, layout):
+            old_set, worker.cpu_set = worker.cpu_set, cpu_set
+            if not worker.is_alive() or old_set == cpu_set:
+                continue
+            if old_set is not None and len(old_set) == len(cpu_set):
+                pin_process_threads(worker.process.pid, cpu_set)
+                continue
+            print(f"[Supervisor] Camera {worker.camera_id}: {len(old_set or [])} -> {len(cpu_set)} core, restart")
+            self._stop(worker)
+            self._end_peaks(worker.camera_id)
+            self._spawn(worker)
+
+    # --- Process lifecycle ---
+    def _spawn(self, worker):
+        num_threads = len(worker.cpu_set) if worker.cpu_set else self.threads_per_worker
+        p = Process(
+            target=run_analyzer,
+            args=(worker.camera_id, self.info_dict, self.result_queue, self.frame_dict, False),
+            kwargs={
+                'path_video': worker.url,
+                'region': worker.region,
+                'cpu_set': worker.cpu_set,
+                'num_threads': num_threads,
+                'shared_weights': self.shared_weights,
+                'spawned_at': time.time(),
+                'log_queue': self.log_queue,
+                'peak_queue': self.peak_queue,
+            },
+        )
+        with spawn_env(num_threads):
+            p.start()
+        worker.process = p
+        worker.started_at = time.time()
+        worker.next_restart_at = None
+        print(f"Camera {worker.camera_id} started (PID: {p.pid})")
+
+    def _stop(self, worker, timeout=5.0):
+        p = worker.process
+        if p is None:
+            return
+        if p.is_alive():
+            p.terminate()
+        p.join(timeout)
+        if p.is_alive():
+            p.kill()
+            p.join()
+
+    def _end_peaks(self, camera_id):
+        """
+        Process camera đã dừng: báo PeakEventHub đóng đợt cao điểm đang mở (nếu có) tại mốc sample cuối
+        mà process báo trong info_dict. Phải gọi trước _clear_shared và trước khi spawn lại.
+        """
+        if self.peak_queue is None:
+            return
+        ended_at = None
+        try:
+            info = self.info_dict.get(f"camera_{camera_id}") if self.info_dict is not None else None
+            ended_at = ((info or {}).get('peak') or {}).get('last_sample_at')
+        except Exception:
+            pass
+        event = {'event': 'camera_stopped', 'camera_id': int(camera_id), 'ended_at': ended_at or time.time()}
+        try:
+            self.peak_queue.put_nowait(event)
+        except Exception as e:
+            print(f"[Supervisor] Camera {camera_id}: không gửi được camera_stopped ({e})")
+
+    def _clear_shared(self, camera_id):
+        key = f"camera_{camera_id}"
+        for shared in (self.info_dict, self.frame_dict):
+            try:
+                if shared is not None and key in shared:
+                    del shared[key]
+            except Exception:
+                pass
+
+    def _register(self, camera_id, url, region):
+        camera_id = int(camera_id)
+        if not region or len(region) < 3:
+            raise ValueError("Region must have at least 3 points.")
+        if camera_id in self.workers:
+            raise ValueError(f"Camera {camera_id} already exists.")
+        worker = CameraWorker(camera_id, url, [[int(x), int(y)] for x, y in region])
+        self.workers[camera_id] = worker
+        return worker
+
+    def start_all(self, specs):
+        # Đăng ký hết trước để chia core một lần, rồi spawn liên tiếp không chờ nhau.
+        # Spec lỗi (trùng id, thiếu region...) chỉ bỏ qua camera đó
+        with self._lock:
+            workers = []
+            for spec in specs:
+                try:
+                    workers.append(self._register(spec['camera_id'], spec['url'], spec['region']))
+                except Exception as e:
+                    print(f"[Supervisor] Bỏ qua camera {spec.get('camera_id')}: {e}")
+            self._rebalance()
+            for worker in workers:
+                try:
+                    self._spawn(worker)
+                except Exception as e:
+                    worker.last_error = str(e)
+                    print(f"[Supervisor] Không khởi động được camera {worker.camera_id}: {e}")
+
+    def add_camera(self, camera_id, url, region):
+        with self._lock:
+            worker = self._register(camera_id, url, region)
+            self._rebalance()
+            try:
+                self._spawn(worker)
+            except Exception:
+                del self.workers[worker.camera_id]
+                self._rebalance()
+                raise
+        return worker.status()
+
+    def remove_camera(self, camera_id):
+        with self._lock:
+            worker = self.workers.pop(int(camera_id), None)
+            if worker is None:
+                raise KeyError(camera_id)
+            # Dừng trước để trả core, rồi mới chia lại cho các camera còn lại
+            self._stop(worker)
+            self._rebalance()
+        self._end_peaks(worker.camera_id)
+        self._clear_shared(worker.camera_id)
+        print(f"Camera {worker.camera_id} removed")
+        return worker.status()
+
+    def shutdown(self):
+        self._stopping = True
+        with self._lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            self._stop(worker)
+
+    # --- Monitoring ---
+    def _drain_results(self):
+        if self.result_queue is None:
+            return
+        while True:
+            try:
+                msg = self.result_queue.get_nowait()
+            except queue.Empty:
+                return
+            except Exception:
+                return
+            worker = self.workers.get(msg.get('camera'))
+            if worker is None:
+                continue
+            if msg.get('status') == 'error':
+                worker.last_error = msg.get('error')
+                print(f"[Supervisor] Camera {worker.camera_id} báo lỗi: {worker.last_error}")
+
+    def _backoff(self, restarts):
+        return min(self.backoff_base * (2 ** restarts), self.backoff_max)
+
+    def poll(self):
+        """Kiểm tra 1 lượt: đọc lỗi, lên lịch và thực hiện restart."""
+        self._drain_results()
+        if self._stopping:
+            return
+        now = time.time()
+        with self._lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            if worker.is_alive():
+                continue
+
+            if worker.next_restart_at is None:
+                worker.last_exit_code = worker.process.exitcode if worker.process is not None else None
+                if worker.started_at and now - worker.started_at >= self.stable_seconds:
+                    worker.restarts = 0
+                self._end_peaks(worker.camera_id)
+                delay = self._backoff(worker.restarts)
+                worker.next_restart_at = now + delay
+                print(f"[Supervisor] Camera {worker.camera_id} đã dừng (exit={worker.last_exit_code}), "
+                      f"restart sau {delay:.1f}s")
+                continue
+
+            if now >= worker.next_restart_at:
+                with self._lock:
+                    # Camera có thể vừa bị gỡ qua admin API
+                    if self.workers.get(worker.camera_id) is not worker:
+                        continue
+                    worker.restarts += 1
+                    try:
+                        self._spawn(worker)
+                    except Exception as e:
+                        worker.last_error = str(e)
+                        worker.next_restart_at = now + self._backoff(worker.restarts)
+
+    async def run(self, interval=1.0):
+        while not self._stopping:
+            try:
+                # poll() có thể chờ lock trong lúc admin API đang dừng / spawn process: chạy ngoài event loop
+                await asyncio.to_thread(self.poll)
+            except Exception as e:
+                print(f"[Supervisor] Lỗi vòng giám sát: {e}")
+            await asyncio.sleep(interval)
+
+    def status(self):
+        with self._lock:
+            workers = sorted(self.workers.values(), key=lambda w: w.camera_id)
+        return [w.status() for w in workers]
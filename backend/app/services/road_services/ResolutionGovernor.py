@@ -0,0 +1,101 @@
+import time
+from collections import deque
+
+try:
+    import psutil  # type: ignore
+except Exception:  # pragma: no cover
+    psutil = None  # type: ignore
+
+
+class ResolutionGovernor:
+    """
+    Tự động chọn độ phân giải xử lý cho 1 camera.
+
+    Theo dõi thời gian xử lý mỗi frame (latency) và CPU của node:
+    - FPS thực tế < target_fps hoặc CPU >= cpu_high  -> hạ xuống bậc thấp hơn
+    - FPS dự đoán ở bậc cao hơn vẫn >= target_fps và CPU < cpu_low -> nâng bậc
+    Mỗi lần đổi bậc phải cách nhau ít nhất cooldown_seconds để tránh dao động.
+    """
+
+    def __init__(self, ladder, target_fps=12.0, cpu_high=90.0, cpu_low=70.0,
+                 window=30, cooldown_seconds=15.0, up_margin=1.1):
+        if not ladder:
+            raise ValueError("Resolution ladder is empty.")
+        self.ladder = [(int(w), int(h)) for w, h in ladder]
+        self.target_fps = float(target_fps)
+        self.cpu_high = float(cpu_high)
+        self.cpu_low = float(cpu_low)
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.up_margin = float(up_margin)
+
+        self.level = 0
+        self.samples = deque(maxlen=window)
+        self.last_change = time.monotonic()
+        self.last_fps = 0.0
+        self.last_cpu = None
+
+        # Lần gọi đầu của psutil.cpu_percent(None) luôn trả 0.0 -> gọi mồi
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)
+
+    @property
+    def resolution(self):
+        return self.ladder[self.level]
+
+    def _area(self, level):
+        w, h = self.ladder[level]
+        return w * h
+
+    def _cpu_percent(self):
+        if psutil is None:
+            return None
+        try:
+            return psutil.cpu_percent(interval=None)
+        except Exception:
+            return None
+
+    def observe(self, frame_seconds):
+        """
+        Ghi nhận thời gian xử lý 1 frame (giây).
+        Trả về True nếu bậc độ phân giải vừa thay đổi.
+        """
+        self.samples.append(max(float(frame_seconds), 1e-6))
+        if len(self.samples) < self.samples.maxlen:
+            return False
+
+        now = time.monotonic()
+        if now - self.last_change < self.cooldown_seconds:
+            return False
+
+        fps = len(self.samples) / sum(self.samples)
+        cpu = self._cpu_percent()
+        self.last_fps = fps
+        self.last_cpu = cpu
+
+        new_level = self.level
+        if fps < self.target_fps or (cpu is not None and cpu >= self.cpu_high):
+            if self.level < len(self.ladder) - 1:
+                new_level = self.level + 1
+        elif self.level > 0:
+            # Chi phí suy luận xấp xỉ tỉ lệ với số pixel
+            predicted_fps = fps * self._area(self.level) / self._area(self.level - 1)
+            has_headroom = cpu is None or cpu < self.cpu_low
+            if has_headroom and predicted_fps >= self.target_fps * self.up_margin:
+                new_level = self.level - 1
+
+        if new_level == self.level:
+            return False
+
+        self.level = new_level
+        self.last_change = now
+        self.samples.clear()
+        return True
+
+    def stats(self):
+        w, h = self.resolution
+        return {
+            'resolution': f"{w}x{h}",
+            'resolution_level': self.level,
+            'target_fps': self.target_fps,
+            'cpu_percent': self.last_cpu,
+        }
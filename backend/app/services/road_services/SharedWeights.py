@@ -0,0 +1,123 @@
+import os
+import time
+from contextlib import contextmanager
+from multiprocessing import get_context
+from pathlib import Path
+
+
+def shared_weights_path(model_path):
+    """models/best.pt -> models/best.shared.pt"""
+    p = Path(model_path)
+    return str(p.with_name(f"{p.stem}.shared.pt"))
+
+
+def is_stale(model_path, shared_path):
+    if not Path(shared_path).exists():
+        return True
+    if not Path(model_path).exists():
+        # Model dạng tên (vd: yolov8n.pt) được ultralytics tự tải, giữ bản đã export
+        return False
+    return Path(shared_path).stat().st_mtime < Path(model_path).stat().st_mtime
+
+
+def export_shared_weights(model_path, shared_path):
+    """
+    Nạp model 1 lần rồi lưu lại dưới dạng checkpoint mmap được:
+    - Đã fuse Conv+BN (process con không phải fuse lại -> không cấp phát weight mới)
+    - float32, eval, không grad (để .float()/.to('cpu') trong ultralytics là no-op)
+    """
+    import torch
+    from ultralytics import YOLO
+
+    yolo = YOLO(model_path)
+    model = yolo.model
+    model.fuse()
+    model.float().eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+
+    ckpt = dict(yolo.ckpt or {})
+    ckpt["model"] = model
+    ckpt["ema"] = None
+    ckpt["optimizer"] = None
+
+    tmp_path = f"{shared_path}.tmp"
+    torch.save(ckpt, tmp_path)
+    os.replace(tmp_path, shared_path)
+    return shared_path
+
+
+def ensure_shared_weights(model_path, shared_path=None):
+    """
+    Gọi ở process cha trước khi spawn camera. Export chạy trong process riêng để
+    process API không phải import torch/ultralytics. Trả về đường dẫn file shared,
+    hoặc None nếu export lỗi (camera sẽ tự nạp model như cũ).
+    """
+    shared_path = shared_path or shared_weights_path(model_path)
+    if not is_stale(model_path, shared_path):
+        return shared_path
+
+    t0 = time.perf_counter()
+    ctx = get_context("spawn")
+    p = ctx.Process(target=export_shared_weights, args=(model_path, shared_path))
+    p.start()
+    p.join()
+    if p.exitcode != 0 or not Path(shared_path).exists():
+        print(f"Export shared weights thất bại (exit={p.exitcode}), camera sẽ nạp {model_path}")
+        return None
+    print(f"Exported shared weights -> {shared_path} ({time.perf_counter() - t0:.1f}s)")
+    return shared_path
+
+
+@contextmanager
+def _mmap_checkpoint_loader(shared_path):
+    """Cho ultralytics đọc checkpoint bằng torch.load(mmap=True) thay vì copy vào RAM."""
+    import torch
+    from ultralytics.nn import tasks
+
+    original = tasks.torch_safe_load
+
+    def mmap_safe_load(weight, *args, **kwargs):
+        if str(weight) != str(shared_path):
+            return original(weight, *args, **kwargs)
+        ckpt = torch.load(shared_path, map_location="cpu", mmap=True, weights_only=False)
+        return ckpt, str(weight)
+
+    tasks.torch_safe_load = mmap_safe_load
+    try:
+        yield
+    finally:
+        tasks.torch_safe_load = original
+
+
+def load_yolo(model_path, shared_path=None):
+    """
+    Nạp YOLO trong process camera. Nếu có file shared thì các tensor weight được
+    map read-only từ page cache: N process dùng chung 1 bản weight trong RAM.
+    """
+    from ultralytics import YOLO
+
+    if shared_path and Path(shared_path).exists():
+        try:
+            with _mmap_checkpoint_loader(shared_path):
+                return YOLO(shared_path)
+        except Exception as e:
+            print(f"Không mmap được {shared_path} ({e}), nạp model thường")
+    return YOLO(model_path)
+
+
+def process_memory_mb():
+    """RSS và PSS (RSS chia đều phần trang nhớ dùng chung) của process hiện tại, MB."""
+    try:
+        import psutil
+        info = psutil.Process().memory_full_info()
+        pss = getattr(info, "pss", None)
+        return round(info.rss / 2**20, 1), (round(pss / 2**20, 1) if pss is not None else None)
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return round(rss_pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1), None
+    except Exception:
+        return None, None
@@ -0,0 +1,353 @@
+"""
+Baseline theo mùa của flow từng camera: phân phối số xe / phút theo (thứ trong tuần, khung giờ địa phương),
+mỗi khung là 1 t-digest cập nhật tăng dần -> so với "cùng thứ, cùng giờ các tuần trước" không cần quét lại lịch sử.
+
+- SeasonalBaselines.update(): đọc các phút mới của rollup 1 phút (sau phút đã xử lý của camera chậm nhất,
+  1 truy vấn cho mọi camera), cộng flow_total vào digest của khung, lưu các khung vừa đổi vào bảng traffic_baselines.
+  Bảng trống (lần chạy đầu) thì nạp BASELINE_BACKFILL_DAYS ngày rollup gần nhất.
+- Điểm bất thường: robust z = (flow - trung vị) / (IQR / 1.349) và percentile của flow trong khung,
+  tính từ các centroid của digest (số lượng giới hạn bởi BASELINE_COMPRESSION), không phụ thuộc độ dài lịch sử.
+  Phút mới nhất được chấm điểm trước khi cộng vào digest; kết quả (snapshot) gửi kèm WS /ws/info.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from app.core.config import settings_metric_transport
+from app.db.base import SessionLocal
+from app.models.traffic_baselines import TrafficBaseline
+from app.models.traffic_rollups import TrafficRollup1m
+from app.services.traffic_services.queries import rollup_series
+from app.services.traffic_services.rollups import LOCAL_TZ, as_utc, bucket_start
+
+SUMMARY_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# IQR / 1.349 ~ độ lệch chuẩn khi phân phối chuẩn
+IQR_TO_STD = 1.349
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning): các centroid (mean, weight) sắp theo mean; hàm scale k1 giữ centroid
+    ở hai đuôi nhỏ (quantile đuôi chính xác), ở giữa lớn. Giá trị mới vào buffer, đầy thì gộp lại.
+    """
+
+    def __init__(self, compression=None, means=(), weights=(), vmin=np.inf, vmax=-np.inf):
+        self.compression = compression or settings_metric_transport.BASELINE_COMPRESSION
+        self.means = np.asarray(means, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self._buffer = []
+
+    @property
+    def count(self):
+        return int(round(self.weights.sum())) + len(self._buffer)
+
+    def add(self, value):
+        value = float(value)
+        self._buffer.append(value)
+        self.vmin = min(self.vmin, value)
+        self.vmax = max(self.vmax, value)
+        if len(self._buffer) >= self.compression:
+            self.compress()
+
+    def _q_limit(self, q):
+        """Quantile lớn nhất mà centroid bắt đầu tại `q` được phủ tới (k1(q_limit) = k1(q) + 1)."""
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1) + 1
+        return (np.sin(min(2 * np.pi * k / self.compression, np.pi / 2)) + 1) / 2
+
+    def compress(self):
+        if not self._buffer:
+            return
+        means = np.concatenate([self.means, self._buffer])
+        weights = np.concatenate([self.weights, np.ones(len(self._buffer))])
+        self._buffer = []
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order].tolist(), weights[order].tolist()
+
+        total = sum(weights)
+        new_means, new_weights = [means[0]], [weights[0]]
+        closed = 0.0  # tổng trọng số các centroid đã chốt
+        limit = total * self._q_limit(0.0)
+        for m, w in zip(means[1:], weights[1:]):
+            if closed + new_weights[-1] + w <= limit:
+                new_weights[-1] += w
+                new_means[-1] += (m - new_means[-1]) * w / new_weights[-1]
+            else:
+                closed += new_weights[-1]
+                limit = total * self._q_limit(closed / total)
+                new_means.append(m)
+                new_weights.append(w)
+        self.means = np.array(new_means)
+        self.weights = np.array(new_weights)
+
+    def _curve(self):
+        """(trọng số tích luỹ tại tâm mỗi centroid, mean) kèm 2 đầu min / max để nội suy."""
+        self.compress()
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[self.vmin], self.means, [self.vmax]])
+        return ranks, values, total
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)
+        ranks, values, total = self._curve()
+        return np.interp(np.asarray(q, dtype=np.float64) * total, ranks, values)
+
+    def cdf(self, x):
+        if self.count == 0:
+            return np.full(np.shape(x), np.nan)
+        ranks, values, total = self._curve()
+        return np.interp(np.asarray(x, dtype=np.float64), values, ranks) / total
+
+    def to_bytes(self):
+        """float32 [min, max, means..., weights...]: ~8 byte / centroid."""
+        self.compress()
+        return np.concatenate([[self.vmin, self.vmax], self.means, self.weights]).astype("<f4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, compression=None):
+        arr = np.frombuffer(data, dtype="<f4").astype(np.float64)
+        n = (len(arr) - 2) // 2
+        return cls(compression, arr[2:2 + n], arr[2 + n:], arr[0], arr[1])
+
+
+def score_values(digest, summary, flows, cfg=settings_metric_transport):
+    """(robust z, percentile) của các giá trị `flows` so với 1 khung; NaN khi khung chưa đủ mẫu."""
+    flows = np.asarray(flows, dtype=np.float64)
+    if summary is None or summary["samples"] < cfg.BASELINE_MIN_SAMPLES:
+        nan = np.full(flows.shape, np.nan)
+        return nan, nan
+    scale = max((summary["p75"] - summary["p25"]) / IQR_TO_STD, cfg.BASELINE_MIN_SCALE)
+    return (flows - summary["p50"]) / scale, digest.cdf(flows) * 100
+
+
+def anomaly_level(z, cfg=settings_metric_transport):
+    if z is None or np.isnan(z):
+        return "unknown"
+    if z >= cfg.BASELINE_ANOMALY_Z:
+        return "high"
+    if z <= -cfg.BASELINE_ANOMALY_Z:
+        return "low"
+    return "normal"
+
+
+def _round(value, digits=2):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+class SeasonalBaselines:
+    def __init__(self, session_factory=SessionLocal, cfg=settings_metric_transport):
+        self.session_factory = session_factory
+        self.cfg = cfg
+        self.digests = {}     # (camera_id, weekday, slot) -> TDigest
+        self._summaries = {}  # khoá -> (digest.count lúc tính, quantile tóm tắt)
+        self.watermarks = {}  # camera_id -> phút (UTC) mới nhất đã cộng vào digest
+        self.latest = {}      # camera_id -> điểm bất thường của phút gần nhất
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.minutes_added = 0
+
+    # ---------- khung ----------
+
+    def slot_of(self, ts):
+        local = as_utc(ts).astimezone(LOCAL_TZ)
+        return local.weekday(), local.hour // self.cfg.BASELINE_BUCKET_HOURS
+
+    def slot_label(self, slot):
+        hours = self.cfg.BASELINE_BUCKET_HOURS
+        return f"{slot * hours:02d}:00-{min((slot + 1) * hours, 24):02d}:00"
+
+    def summary(self, key):
+        """Quantile tóm tắt của khung, chỉ tính lại khi digest có thêm mẫu."""
+        digest = self.digests.get(key)
+        if digest is None:
+            return None
+        cached = self._summaries.get(key)
+        if cached is not None and cached[0] == digest.count:
+            return cached[1]
+        qs = digest.quantile(SUMMARY_QUANTILES)
+        summary = {f"p{int(q * 100):02d}": float(v) for q, v in zip(SUMMARY_QUANTILES, qs)}
+        summary["samples"] = digest.count
+        self._summaries[key] = (digest.count, summary)
+        return summary
+
+    # ---------- cập nhật ----------
+
+    def _load(self, db):
+        for row in db.execute(select(TrafficBaseline)).scalars():
+            key = (row.camera_id, row.weekday, row.slot)
+            self.digests[key] = TDigest.from_bytes(row.digest, self.cfg.BASELINE_COMPRESSION)
+            last = as_utc(row.last_bucket)
+            self.watermarks[row.camera_id] = max(last, self.watermarks.get(row.camera_id, last))
+        self._loaded = True
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        db = self.session_factory()
+        try:
+            with self._lock:
+                if not self._loaded:
+                    self._load(db)
+        finally:
+            db.close()
+
+    def _score_minute(self, key, ts, flow):
+        summary = self.summary(key)
+        z, pct = score_values(self.digests.get(key), summary, [flow], self.cfg)
+        z, pct = z[0], pct[0]
+        return {
+            "minute": as_utc(ts).astimezone(LOCAL_TZ).isoformat(),
+            "flow": int(flow),
+            "weekday": key[1],
+            "slot": self.slot_label(key[2]),
+            "samples": summary["samples"] if summary else 0,
+            "median": _round(summary["p50"]) if summary else None,
+            "percentile": _round(pct, 1),
+            "score": _round(z),
+            "level": anomaly_level(z, self.cfg),
+            "anomalous": bool(not np.isnan(z) and abs(z) >= self.cfg.BASELINE_ANOMALY_Z),
+        }
+
+    def _add_rows(self, rows, score_last):
+        """Cộng các phút (camera_id, bucket_start, flow_total) theo thứ tự thời gian; trả về khoá đã đổi."""
+        last_index = {cam: i for i, (cam, _, _) in enumerate(rows)} if score_last else {}
+        dirty = set()
+        with self._lock:
+            for i, (cam, ts, flow) in enumerate(rows):
+                ts = as_utc(ts)
+                if cam in self.watermarks and ts <= self.watermarks[cam]:
+                    continue
+                key = (cam,) + self.slot_of(ts)
+                if last_index.get(cam) == i:
+                    # Chấm điểm trước khi cộng, để phút hiện tại không tự kéo baseline về phía mình
+                    self.latest[cam] = self._score_minute(key, ts, flow)
+                digest = self.digests.get(key)
+                if digest is None:
+                    digest = self.digests[key] = TDigest(self.cfg.BASELINE_COMPRESSION)
+                digest.add(flow)
+                self.watermarks[cam] = ts
+                dirty.add(key)
+                self.minutes_added += 1
+        return dirty
+
+    def update(self, now=None):
+        """Cộng các phút rollup mới vào digest rồi lưu các khung vừa đổi. Chạy định kỳ trong thread."""
+        now = as_utc(now or datetime.now(timezone.utc))
+        # Chỉ lấy phút đã kết thúc và writer đã flush xong
+        end = bucket_start(now - timedelta(seconds=2 * self.cfg.TRAFFIC_LOG_FLUSH_SECONDS), "1min")
+        t0 = time.perf_counter()
+        self.ensure_loaded()
+
+        if self.watermarks:
+            # Đọc từ camera chậm nhất (phút của camera khác đã cộng bị _add_rows bỏ qua), nhưng không lùi quá
+            # BASELINE_LATE_MINUTES so với camera mới nhất: camera đã gỡ / mất kết nối không kéo truy vấn về quá khứ
+            newest = max(self.watermarks.values())
+            late = newest - timedelta(minutes=self.cfg.BASELINE_LATE_MINUTES)
+            start = max(min(self.watermarks.values()), late) + timedelta(minutes=1)
+        else:
+            start = end - timedelta(days=self.cfg.BASELINE_BACKFILL_DAYS)
+
+        db = self.session_factory()
+        dirty = set()
+        try:
+            # Theo từng ngày để lần nạp đầu không đọc cả tháng vào bộ nhớ
+            chunk_start = start
+            while chunk_start < end:
+                chunk_end = min(chunk_start + timedelta(days=1), end)
+                rows = db.execute(
+                    select(TrafficRollup1m.camera_id, TrafficRollup1m.bucket_start, TrafficRollup1m.flow_total)
+                    .where(TrafficRollup1m.bucket_start >= chunk_start, TrafficRollup1m.bucket_start < chunk_end)
+                    .order_by(TrafficRollup1m.bucket_start, TrafficRollup1m.camera_id)
+                ).all()
+                dirty |= self._add_rows(rows, score_last=chunk_end == end)
+                chunk_start = chunk_end
+
+            with self._lock:
+                for key in dirty:
+                    digest = self.digests[key]
+                    db.merge(TrafficBaseline(
+                        camera_id=key[0], weekday=key[1], slot=key[2],
+                        digest=digest.to_bytes(), samples=digest.count,
+                        last_bucket=self.watermarks[key[0]],
+                    ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return {"slots_updated": len(dirty), "seconds": round(time.perf_counter() - t0, 2)}
+
+    # ---------- đọc ----------
+
+    def snapshot(self, camera_id):
+        """Điểm bất thường của phút gần nhất (None nếu camera chưa có dữ liệu)."""
+        return self.latest.get(camera_id)
+
+    def history(self, db, camera_id, start, end=None):
+        """
+        Điểm bất thường theo phút trong [start, end) so với baseline hiện tại:
+        DataFrame flow, p05, p50, p95, percentile, score (index giờ địa phương). Bỏ các phút không có log.
+        """
+        self.ensure_loaded()
+        df = rollup_series(db, camera_id, start, end, "1min")
+        columns = ["flow", "p05", "p50", "p95", "percentile", "score"]
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+
+        out = pd.DataFrame(np.nan, index=df.index, columns=columns)
+        out["flow"] = df["flow_total"].astype(np.float64)
+        keys = pd.MultiIndex.from_arrays(
+            [df.index.weekday, df.index.hour // self.cfg.BASELINE_BUCKET_HOURS]
+        )
+        with self._lock:
+            for (weekday, slot), positions in pd.Series(np.arange(len(df))).groupby(keys).groups.items():
+                key = (camera_id, int(weekday), int(slot))
+                summary = self.summary(key)
+                if summary is None:
+                    continue
+                rows = np.asarray(positions)
+                flows = out["flow"].to_numpy()[rows]
+                z, pct = score_values(self.digests[key], summary, flows, self.cfg)
+                out.iloc[rows, out.columns.get_loc("score")] = z
+                out.iloc[rows, out.columns.get_loc("percentile")] = pct
+                for name in ("p05", "p50", "p95"):
+                    out.iloc[rows, out.columns.get_loc(name)] = summary[name]
+        return out
+
+
+def anomaly_payload(camera_id, frame, current=None, layout="points", cfg=settings_metric_transport):
+    """DataFrame của SeasonalBaselines.history -> JSON."""
+    labels = [ts.isoformat() for ts in frame.index]
+    values = {name: [_round(v) for v in frame[name].tolist()] for name in frame.columns}
+    values["percentile"] = [_round(v, 1) for v in frame["percentile"].tolist()]
+    values["anomalous"] = [bool(abs(z) >= cfg.BASELINE_ANOMALY_Z) if z is not None else False for z in values["score"]]
+
+    payload = {
+        "camera_id": camera_id,
+        "current": current,
+        "threshold": cfg.BASELINE_ANOMALY_Z,
+        "bucket_hours": cfg.BASELINE_BUCKET_HOURS,
+        "count": len(labels),
+        "timezone": "Asia/Bangkok (UTC+7)",
+    }
+    if layout == "columnar":
+        payload.update({"labels": labels, "values": values})
+    else:
+        names = list(values)
+        payload["points"] = [
+            {"timestamp": label, **{name: values[name][i] for name in names}}
+            for i, label in enumerate(labels)
+        ]
+    return payload
+
+
+seasonal_baselines = SeasonalBaselines()
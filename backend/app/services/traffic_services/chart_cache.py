@@ -0,0 +1,183 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, params
+from fastapi.responses import Response
+
+from app.core.config import settings_metric_transport
+
+
+class ChartCache:
+    """
+    Cache response JSON của các endpoint /charts trong process API.
+
+    - Khoá: (tên endpoint, camera_id, query params) + phiên bản dữ liệu của camera.
+      Writer gọi invalidate(camera_ids) sau mỗi batch commit -> phiên bản tăng,
+      entry cũ tự hết hiệu lực. Endpoint không theo camera dùng phiên bản chung.
+    - TTL giới hạn tuổi entry (cửa sổ "24h gần nhất" trôi theo thời gian).
+    - Mỗi khoá chỉ 1 request được tính, các viewer khác chờ rồi dùng lại kết quả.
+    - Response có ETag / Last-Modified, trả 304 khi client đã có bản mới nhất.
+    """
+
+    def __init__(self, ttl_seconds=None, max_entries=None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings_metric_transport.CHART_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or settings_metric_transport.CHART_CACHE_MAX_ENTRIES
+
+        self.entries = OrderedDict()  # key -> entry dict
+        self.locks = {}               # key -> [asyncio.Lock, số request đang giữ / chờ] (single-flight)
+        self.camera_versions = {}     # camera_id -> số lần có dữ liệu mới
+        self.global_version = 0
+        self.data_changed_at = {}     # camera_id / None -> epoch giây lần commit gần nhất
+        self._version_lock = threading.Lock()  # invalidate() được gọi từ thread writer
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    # --- Invalidation (thread writer) ---
+    def invalidate(self, camera_ids):
+        now = time.time()
+        with self._version_lock:
+            for cam in camera_ids:
+                self.camera_versions[cam] = self.camera_versions.get(cam, 0) + 1
+                self.data_changed_at[cam] = now
+            self.global_version += 1
+            self.data_changed_at[None] = now
+
+    def _version(self, camera_id):
+        with self._version_lock:
+            if camera_id is None:
+                return self.global_version
+            return self.camera_versions.get(camera_id, 0)
+
+    # --- Lookup ---
+    def _get_fresh(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry["version"] != version or time.monotonic() >= entry["expires_at"]:
+            self.entries.pop(key, None)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _make_entry(self, response, version, camera_id):
+        body = bytes(response.body)
+        last_modified = self.data_changed_at.get(camera_id) or time.time()
+        return {
+            "body": body,
+            "media_type": response.media_type,
+            "etag": '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"',
+            "last_modified": int(last_modified),
+            "version": version,
+            "expires_at": time.monotonic() + self.ttl_seconds,
+        }
+
+    # --- HTTP ---
+    @staticmethod
+    def _is_not_modified(request, entry):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip() for tag in if_none_match.split(",")}
+            return "*" in tags or entry["etag"] in tags or f"W/{entry['etag']}" in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(parsedate_to_datetime(if_modified_since).timestamp()) >= entry["last_modified"]
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _respond(self, request, entry, cache_status):
+        headers = {
+            "ETag": entry["etag"],
+            "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+            "Cache-Control": "no-cache",
+            "X-Cache": cache_status,
+        }
+        if self._is_not_modified(request, entry):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type=entry["media_type"], headers=headers)
+
+    async def get_or_compute(self, request, key, camera_id, compute):
+        version = self._version(camera_id)
+        entry = self._get_fresh(key, version)
+        if entry is not None:
+            self.hits += 1
+            return self._respond(request, entry, "HIT")
+
+        # Lock chỉ sống khi còn request giữ / chờ: khoá lỗi, không cache được hay chỉ gọi 1 lần không để lại gì
+        slot = self.locks.get(key)
+        if slot is None:
+            slot = self.locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                # Có thể request khác vừa tính xong trong lúc chờ lock
+                version = self._version(camera_id)
+                entry = self._get_fresh(key, version)
+                if entry is not None:
+                    self.hits += 1
+                    return self._respond(request, entry, "HIT")
+
+                self.misses += 1
+                response = await compute()
+                if response.status_code != 200:
+                    return response  # không cache lỗi
+                entry = self._make_entry(response, version, camera_id)
+                self._put(key, entry)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0 and self.locks.get(key) is slot:
+                del self.locks[key]
+        return self._respond(request, entry, "MISS")
+
+    def cached(self):
+        """
+        Decorator cho endpoint chart: thêm tham số `request`, khoá cache lấy từ tên hàm
+        và các tham số path/query (bỏ qua dependency như `db`).
+        """
+        def decorator(func):
+            sig = inspect.signature(func)
+            key_params = [
+                name for name, p in sig.parameters.items()
+                if not isinstance(p.default, params.Depends)
+            ]
+
+            @functools.wraps(func)
+            async def wrapper(request: Request, **kwargs):
+                camera_id = kwargs.get("camera_id")
+                key = (func.__name__,) + tuple((name, kwargs.get(name)) for name in key_params)
+                return await self.get_or_compute(request, key, camera_id, lambda: func(**kwargs))
+
+            wrapper.__signature__ = sig.replace(parameters=[
+                inspect.Parameter("request", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=Request),
+                *sig.parameters.values(),
+            ])
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "locks": len(self.locks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+chart_cache = ChartCache()
@@ -0,0 +1,326 @@
+"""
+Dựng payload cho các chart từ 1 DataFrame đã đọc sẵn (kết quả của load_traffic_df).
+Endpoint /charts/<chart> và /charts/bundle dùng chung các hàm này, nên bundle chỉ đọc DB 1 lần.
+
+Dữ liệu được lấy theo cột (numpy), nhãn thời gian format 1 lần cho cả index.
+`layout`:
+- "points"  : [{"label": ..., "value(s)": ...}, ...] (mặc định, như trước)
+- "columnar": {"labels": [...], "values": {...}} – mảng numpy, FastJSONResponse serialize thẳng
+"""
+import numpy as np
+import pandas as pd
+
+
+# Bảng nhãn dựng sẵn: lấy theo chỉ số thay vì gọi strftime cho từng điểm
+_HHMM = np.array([f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)], dtype=object)
+_SECONDS = np.array([f":{sec:02d}" for sec in range(60)], dtype=object)
+
+
+def _labels(index):
+    """Nhãn HH:MM (index đã là giờ UTC+7 trong load_traffic_df)."""
+    return _HHMM[index.hour * 60 + index.minute].tolist()
+
+
+def _utc_offset(seconds):
+    sign = "+" if seconds >= 0 else "-"
+    hours, minutes = divmod(abs(int(seconds)) // 60, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+def _iso_timestamps(index):
+    """Giống Timestamp.isoformat() (vd: 2025-11-30T18:20:00+07:00) nhưng dựng theo mảng."""
+    day_codes, days = pd.factorize(index.normalize())
+    day_part = np.array([d.strftime("%Y-%m-%dT") for d in days], dtype=object)[day_codes]
+    time_part = _HHMM[index.hour * 60 + index.minute] + _SECONDS[index.second]
+    if index.tz is None:
+        return (day_part + time_part).tolist()
+    offsets = (index.tz_localize(None) - index.tz_convert("UTC").tz_localize(None)).total_seconds()
+    offset_codes, unique_offsets = pd.factorize(offsets)
+    offset_part = np.array([_utc_offset(o) for o in unique_offsets], dtype=object)[offset_codes]
+    return (day_part + time_part + offset_part).tolist()
+
+
+def _int_column(frame, column):
+    return frame[column].fillna(0).to_numpy(dtype=np.int64)
+
+
+def _float_column(frame, column):
+    return frame[column].fillna(0.0).to_numpy(dtype=np.float64)
+
+
+def _multi_series(labels, columns, layout):
+    """columns: {class: numpy array} -> payload theo layout."""
+    if layout == "columnar":
+        return {"labels": labels, "values": columns}
+    names = list(columns)
+    rows = zip(*(columns[name].tolist() for name in names))
+    return {
+        "points": [
+            {"label": label, "values": dict(zip(names, row))}
+            for label, row in zip(labels, rows)
+        ]
+    }
+
+
+def time_series_payload(camera_id, df, classes, minutes=60, layout="points"):
+    """Tổng số xe theo từng phút (không cộng dồn), N phút gần nhất."""
+    if df.empty:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "message": "DB Empty in last 24h",
+        }
+
+    # Mỗi dòng = 1 phút (flow_total lấy từ rollup) → lấy tail(minutes) là được
+    tail_df = df.tail(minutes)
+    labels = _labels(tail_df.index)
+    values = _int_column(tail_df, "flow_total")  # số xe trong phút đó
+
+    if layout == "columnar":
+        series = {"labels": labels, "values": values}
+    else:
+        series = {
+            "points": [
+                {"label": label, "value": value}
+                for label, value in zip(labels, values.tolist())
+            ]
+        }
+
+    return {
+        "camera_id": camera_id,
+        **series,
+        "period": f"{minutes}m",
+        "timezone": "Asia/Bangkok (UTC+7)",
+        "aggregation": "per_minute",  # optional: gửi thêm meta cho frontend
+    }
+
+
+def grouped_bar_payload(camera_id, df, classes, minutes=60, layout="points"):
+    if df.empty or not classes:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "message": "No data in last 24h",
+        }
+
+    # Lấy minutes điểm cuối (giống time-series)
+    tail = df.tail(minutes)
+    columns = {c: _int_column(tail, c) for c in classes}
+
+    return {
+        "camera_id": camera_id,
+        **_multi_series(_labels(tail.index), columns, layout),
+        "classes": classes,  # để frontend biết thứ tự / legend
+        "period": f"{minutes}m",
+        "timezone": "Asia/Bangkok (UTC+7)",
+    }
+
+
+def area_payload(camera_id, df, classes, minutes=60, layout="points"):
+    if df.empty or not classes:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "message": "No data in last 24h",
+        }
+
+    tail = df.tail(minutes)
+    columns = {c: _int_column(tail, c) for c in classes}
+
+    return {
+        "camera_id": camera_id,
+        **_multi_series(_labels(tail.index), columns, layout),
+        "classes": classes,
+        "period": f"{minutes}m",
+        "timezone": "Asia/Bangkok (UTC+7)",
+        "chart_type": "stacked_area",
+    }
+
+
+def hist_total_payload(camera_id, df, classes, bins=20, layout="points"):
+    if df.empty or "total" not in df.columns:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "bins": bins,
+            "message": "No data or 'total' column missing",
+        }
+
+    values = df["total"].dropna().to_numpy(dtype=np.int64)
+    if len(values) == 0:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "bins": bins,
+            "message": "No total values",
+        }
+
+    counts, bin_edges = np.histogram(values, bins=bins)
+    bin_centers = ((bin_edges[:-1] + bin_edges[1:]) / 2.0)
+    labels = [f"{center:.1f}" for center in bin_centers.tolist()]  # nhãn là mid-point của bin
+
+    if layout == "columnar":
+        series = {"labels": labels, "values": counts}
+    else:
+        # Chuẩn hoá về dạng points: [{label, value}], value = số lượng điểm rơi vào bin
+        series = {
+            "points": [
+                {"label": label, "value": count}
+                for label, count in zip(labels, counts.tolist())
+            ]
+        }
+
+    return {
+        "camera_id": camera_id,
+        **series,
+        "bins": bins,
+        "metric": "total_vehicles",
+    }
+
+
+def boxplot_payload(camera_id, df, classes):
+    if df.empty or not classes:
+        return {
+            "camera_id": camera_id,
+            "items": [],
+            "classes": [],
+            "message": "No data in last 24h",
+        }
+
+    items = []
+    for c in classes:
+        values = df[c].dropna().to_numpy(dtype=np.float64)
+        if len(values) == 0:
+            continue
+        q_min, q1, median, q3, q_max = np.percentile(values, [0, 25, 50, 75, 100]).tolist()
+        items.append(
+            {
+                "name": c,
+                "min": q_min,
+                "q1": q1,
+                "median": median,
+                "q3": q3,
+                "max": q_max,
+            }
+        )
+
+    return {
+        "camera_id": camera_id,
+        "items": items,
+        "classes": classes,
+    }
+
+
+def rolling_avg_payload(camera_id, df, classes, minutes=60, window=5, layout="points"):
+    if df.empty or not classes:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "classes": [],
+            "window": window,
+            "message": "No data in last 24h",
+        }
+
+    # Tính rolling mean theo window
+    df_ra = df[classes].rolling(window=window).mean()
+    tail = df_ra.tail(minutes)
+    columns = {c: _float_column(tail, c) for c in classes}
+
+    return {
+        "camera_id": camera_id,
+        **_multi_series(_labels(tail.index), columns, layout),
+        "classes": classes,
+        "window": window,
+        "period": f"{minutes}m",
+        "timezone": "Asia/Bangkok (UTC+7)",
+    }
+
+
+def peaks_payload(camera_id, df, classes, minutes=60, layout="points"):
+    if df.empty or "total" not in df.columns:
+        return {
+            "camera_id": camera_id,
+            "points": [],
+            "peaks": [],
+            "message": "No data or 'total' missing",
+        }
+
+    # Nếu DB chưa có cột is_peak_auto, có thể tự tính như sau:
+    if "is_peak_auto" in df.columns:
+        is_peak_all = df["is_peak_auto"].fillna(False).to_numpy(dtype=bool)
+    else:
+        # ví dụ: peak = những điểm >= quantile 0.9
+        thr = df["total"].quantile(0.9)
+        is_peak_all = (df["total"] >= thr).to_numpy()
+
+    tail = df.tail(minutes)
+    is_peak = is_peak_all[len(df) - len(tail):]
+    labels = _labels(tail.index)
+    values = _int_column(tail, "total")
+    timestamps = _iso_timestamps(tail.index)
+
+    peak_idx = np.flatnonzero(is_peak).tolist()
+    value_list = values.tolist()
+    peaks = [
+        {"label": labels[i], "value": value_list[i], "timestamp": timestamps[i]}
+        for i in peak_idx
+    ]
+
+    if layout == "columnar":
+        series = {"labels": labels, "values": values, "is_peak": is_peak, "timestamps": timestamps}
+    else:
+        series = {
+            "points": [
+                {"label": label, "value": value, "is_peak": flag, "timestamp": ts}
+                for label, value, flag, ts in zip(labels, value_list, is_peak.tolist(), timestamps)
+            ]
+        }
+
+    return {
+        "camera_id": camera_id,
+        **series,
+        "peaks": peaks,
+        "period": f"{minutes}m",
+        "timezone": "Asia/Bangkok (UTC+7)",
+    }
+
+
+def range_payload(index, frames, metrics, resolution, source):
+    """
+    Kết quả /charts/query dạng cột: 1 mảng nhãn thời gian dùng chung,
+    mỗi camera 1 mảng cho mỗi metric.
+    """
+    return {
+        "resolution": resolution,
+        "source": source,
+        "timezone": "Asia/Bangkok (UTC+7)",
+        "labels": _iso_timestamps(index),
+        "cameras": {
+            str(cam): {m: frame[m].to_numpy(dtype=np.int64) for m in metrics}
+            for cam, frame in frames.items()
+        },
+        "points": len(index) * len(frames),
+    }
+
+
+# Tên chart (như trong URL /charts/<tên>) -> (hàm dựng payload, các tham số nhận)
+CHART_BUILDERS = {
+    "time-series": (time_series_payload, ("minutes", "layout")),
+    "grouped-bar": (grouped_bar_payload, ("minutes", "layout")),
+    "area": (area_payload, ("minutes", "layout")),
+    "hist-total": (hist_total_payload, ("bins", "layout")),
+    "boxplot": (boxplot_payload, ()),
+    "rolling-avg": (rolling_avg_payload, ("minutes", "window", "layout")),
+    "peaks": (peaks_payload, ("minutes", "layout")),
+}
+
+
+def build_bundle(camera_id, df, classes, charts=None, **params):
+    """Dựng nhiều chart từ cùng 1 frame. `charts` = None -> tất cả."""
+    names = list(CHART_BUILDERS) if not charts else charts
+    result = {}
+    for name in names:
+        builder, accepted = CHART_BUILDERS[name]
+        kwargs = {k: params[k] for k in accepted if params.get(k) is not None}
+        result[name] = builder(camera_id, df, classes, **kwargs)
+    return result
@@ -0,0 +1,83 @@
+from sqlalchemy import select, func
+
+from app.models.traffic_logs import TrafficLog
+
+# Cột cộng dồn trong traffic_logs -> cột delta tương ứng
+DELTA_FIELDS = {
+    "count_car": "delta_car",
+    "count_motor": "delta_motor",
+    "count_bus": "delta_bus",
+    "count_truck": "delta_truck",
+    "total_vehicles": "delta_total",
+}
+
+
+class DeltaTracker:
+    """
+    Tính số xe trong từng khoảng giữa 2 bản ghi liên tiếp của cùng camera.
+
+    Bộ đếm bị coi là reset (delta = giá trị cộng dồn hiện tại, is_reset = True) khi:
+    - session_id khác bản ghi trước (process camera mới, đếm lại từ 0)
+    - hoặc cùng session nhưng có cột cộng dồn giảm
+    - hoặc camera chưa từng có bản ghi
+    Trạng thái chỉ được cập nhật (commit) sau khi batch ghi DB thành công.
+    """
+
+    def __init__(self):
+        self.last = {}  # camera_id -> {"session_id": ..., "counts": {field: value}}
+
+    def prime(self, db, camera_ids):
+        """Nạp bản ghi cuối cùng trong DB cho các camera chưa có trong bộ nhớ."""
+        missing = [cam for cam in camera_ids if cam not in self.last]
+        if not missing:
+            return
+        latest = (
+            select(TrafficLog.camera_id, func.max(TrafficLog.id).label("id"))
+            .where(TrafficLog.camera_id.in_(missing))
+            .group_by(TrafficLog.camera_id)
+            .subquery()
+        )
+        rows = db.execute(
+            select(TrafficLog).join(latest, TrafficLog.id == latest.c.id)
+        ).scalars().all()
+        for log in rows:
+            self.last[log.camera_id] = {
+                "session_id": log.session_id,
+                "counts": {field: int(getattr(log, field) or 0) for field in DELTA_FIELDS},
+            }
+
+    def prime_before(self, db, camera_id, before):
+        """Nạp bản ghi cuối cùng trước mốc `before` của camera (tính lại delta cho 1 đoạn log cũ)."""
+        prev = db.execute(
+            select(TrafficLog).where(TrafficLog.camera_id == camera_id, TrafficLog.timestamp < before)
+            .order_by(TrafficLog.timestamp.desc(), TrafficLog.id.desc()).limit(1)
+        ).scalars().first()
+        if prev is not None:
+            self.last[camera_id] = {
+                "session_id": prev.session_id,
+                "counts": {field: int(getattr(prev, field) or 0) for field in DELTA_FIELDS},
+            }
+
+    def annotate(self, rows):
+        """
+        Gán delta_* / is_reset vào từng bản ghi (theo thứ tự thời gian mỗi camera).
+        Trả về trạng thái mới để commit() sau khi ghi thành công.
+        """
+        state = dict(self.last)
+        for row in rows:
+            cam = int(row["camera_id"])
+            cur = {field: int(row.get(field) or 0) for field in DELTA_FIELDS}
+            prev = state.get(cam)
+            is_reset = (
+                prev is None
+                or prev["session_id"] != row.get("session_id")
+                or any(cur[field] < prev["counts"][field] for field in DELTA_FIELDS)
+            )
+            for field, delta_field in DELTA_FIELDS.items():
+                row[delta_field] = cur[field] if is_reset else cur[field] - prev["counts"][field]
+            row["is_reset"] = is_reset
+            state[cam] = {"session_id": row.get("session_id"), "counts": cur}
+        return state
+
+    def commit(self, state):
+        self.last = state
@@ -0,0 +1,205 @@
+"""
+Export traffic_logs theo khoảng thời gian / camera ra CSV, NDJSON hoặc Parquet dạng stream.
+
+Dữ liệu đọc bằng server-side cursor (`yield_per`, psycopg2 dùng named cursor) và ghi ra
+từng chunk `EXPORT_CHUNK_SIZE` dòng, nên bộ nhớ không phụ thuộc độ dài khoảng thời gian.
+Dùng chung cho endpoint GET /export/traffic-logs (StreamingResponse, chunked) và CLI:
+
+    cd backend
+    python -m app.services.traffic_services.export --start 2025-11-01 --end 2025-12-01 \\
+        --cameras 0,1 --format parquet -o traffic_2025-11.parquet
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from app.core.config import settings_metric_transport
+from app.db.base import SessionLocal
+from app.models.traffic_logs import TrafficLog
+from app.services.traffic_services.rollups import LOCAL_TZ, as_utc
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn, thiếu thì dùng json chuẩn
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet cần pyarrow
+    pa = pq = None
+
+EXPORT_COLUMNS = [c.name for c in TrafficLog.__table__.columns]
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_log_chunks(db, start, end, camera_ids=None, chunk_size=None):
+    """Các list dòng (tuple theo EXPORT_COLUMNS), mỗi list tối đa `chunk_size` dòng, theo thời gian."""
+    chunk_size = chunk_size or settings_metric_transport.EXPORT_CHUNK_SIZE
+    query = (
+        select(*[getattr(TrafficLog, c) for c in EXPORT_COLUMNS])
+        .where(TrafficLog.timestamp >= as_utc(start), TrafficLog.timestamp < as_utc(end))
+        .order_by(TrafficLog.timestamp.asc(), TrafficLog.id.asc())
+        .execution_options(yield_per=chunk_size)
+    )
+    if camera_ids:
+        query = query.where(TrafficLog.camera_id.in_(camera_ids))
+    result = db.execute(query)
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+_TS = EXPORT_COLUMNS.index("timestamp")
+
+
+def _iso_rows(chunk):
+    """timestamp -> chuỗi ISO 8601 UTC (naive trong DB được coi là UTC)."""
+    for row in chunk:
+        row = list(row)
+        if row[_TS] is not None:
+            row[_TS] = as_utc(row[_TS]).isoformat()
+        yield row
+
+
+def csv_stream(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in chunks:
+        writer.writerows(_iso_rows(chunk))
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def ndjson_stream(chunks):
+    for chunk in chunks:
+        records = (dict(zip(EXPORT_COLUMNS, row)) for row in _iso_rows(chunk))
+        if orjson is not None:
+            lines = [orjson.dumps(r) for r in records]
+        else:
+            lines = [json.dumps(r, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for r in records]
+        lines.append(b"")
+        yield b"\n".join(lines)
+
+
+class _StreamSink(io.RawIOBase):
+    """File-like chỉ ghi cho ParquetWriter: giữ tổng số byte (tell) nhưng trả dữ liệu ra sau mỗi row group."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def parquet_schema():
+    types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "fps": pa.float64(),
+        "session_id": pa.string(),
+        "is_reset": pa.bool_(),
+    }
+    return pa.schema([(c, types.get(c, pa.int64())) for c in EXPORT_COLUMNS])
+
+
+def parquet_stream(chunks):
+    """Mỗi chunk là 1 row group, byte của row group được trả ra ngay sau khi ghi."""
+    if pa is None:
+        raise RuntimeError("Export Parquet cần pyarrow (pip install pyarrow)")
+    schema = parquet_schema()
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            columns[_TS] = [as_utc(ts) if ts is not None else None for ts in columns[_TS]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+STREAMERS = {
+    "csv": csv_stream,
+    "ndjson": ndjson_stream,
+    "parquet": parquet_stream,
+}
+
+
+def stream_export(start, end, camera_ids=None, fmt="csv", chunk_size=None, session_factory=SessionLocal):
+    """Generator byte của file export; session mở / đóng cùng generator (dùng được trong StreamingResponse)."""
+    db = session_factory()
+    try:
+        for data in STREAMERS[fmt](iter_log_chunks(db, start, end, camera_ids, chunk_size)):
+            if data:
+                yield data
+    finally:
+        db.close()
+
+
+def _parse_time(value):
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=LOCAL_TZ)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export traffic_logs (CSV / NDJSON / Parquet)")
+    parser.add_argument("--start", required=True, help="ISO 8601, không ghi múi giờ = giờ địa phương")
+    parser.add_argument("--end", default=None, help="mặc định hiện tại")
+    parser.add_argument("--cameras", default=None, help="vd: 0,1 (bỏ trống = tất cả)")
+    parser.add_argument("--format", choices=list(STREAMERS), default="csv")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("-o", "--output", default="-", help="file đích, '-' = stdout")
+    args = parser.parse_args(argv)
+
+    start = _parse_time(args.start)
+    end = _parse_time(args.end) if args.end else datetime.now(timezone.utc)
+    camera_ids = [int(c) for c in args.cameras.split(",") if c.strip()] if args.cameras else None
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    written = 0
+    try:
+        for data in stream_export(start, end, camera_ids, args.format, args.chunk_size):
+            out.write(data)
+            written += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"Export xong: {written} bytes", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Dự báo flow ngắn hạn (FORECAST_HORIZON_MINUTES phút tới) cho từng camera, chạy nền trong API
+(hoặc bằng cron) rồi ghi vào bảng traffic_forecasts -> GET /charts/forecast/{camera_id} chỉ đọc bảng.
+
+Dùng đúng chuỗi flow theo phút của chart (rollup 1 phút, multi_camera_series), 1 truy vấn cho mọi camera:
+- seasonal-naive: flow cùng phút của chu kỳ trước (FORECAST_SEASON_MINUTES, mặc định 1 ngày),
+  làm trơn trung bình trượt FORECAST_SEASON_SMOOTH phút để bớt nhiễu;
+- exponential smoothing (FORECAST_ALPHA) trên độ lệch giữa thực tế và seasonal, độ lệch hiện tại
+  giảm dần FORECAST_DAMPING mỗi phút -> xa dần thì quay về mức hôm trước;
+- phút chưa có dữ liệu chu kỳ trước: chỉ làm trơn mũ trên flow (dự báo phẳng).
+Phút không có bản ghi log (samples = 0, camera mất kết nối) không tính là flow 0.
+
+    cd backend
+    python -m app.services.traffic_services.forecast
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert, select
+
+from app.core.config import settings_metric_transport
+from app.db.base import SessionLocal
+from app.models.traffic_forecasts import TrafficForecast
+from app.models.traffic_rollups import TrafficRollup1m
+from app.services.traffic_services.queries import multi_camera_series
+from app.services.traffic_services.rollups import CLASS_FIELDS, LOCAL_TZ, as_utc, bucket_start
+
+FLOW_COLUMNS = [f"flow_{name}" for name in CLASS_FIELDS]
+# Số phút gần nhất dùng để ước lượng độ lệch chuẩn sai số dự báo 1 bước
+ERROR_WINDOW_MINUTES = 180
+
+
+def _smooth_level(values, alpha):
+    """Mức làm trơn mũ tại mỗi phút (bỏ qua NaN, giữ mức trước đó)."""
+    return values.ewm(alpha=alpha, adjust=False, ignore_na=True).mean().ffill()
+
+
+def _error_std(values, level):
+    """Độ lệch chuẩn sai số 1 bước (thực tế - mức phút trước) của flow_total trong ERROR_WINDOW_MINUTES."""
+    errors = (values["flow_total"] - level["flow_total"].shift(1)).iloc[-ERROR_WINDOW_MINUTES:].dropna()
+    return float(errors.std()) if len(errors) > 1 else 0.0
+
+
+def forecast_camera(frame, horizon=None, cfg=settings_metric_transport):
+    """
+    frame: flow_* / samples theo phút (phút cuối là phút đầy đủ gần nhất).
+    Trả về DataFrame `horizon` dòng (index = số phút tới, bắt đầu từ 1): flow_*, lower_total,
+    upper_total, method. None nếu camera chưa có dữ liệu.
+    """
+    horizon = horizon or cfg.FORECAST_HORIZON_MINUTES
+    season = cfg.FORECAST_SEASON_MINUTES
+    alpha = cfg.FORECAST_ALPHA
+
+    flows = frame[FLOW_COLUMNS].astype(float)
+    flows.loc[frame["samples"].to_numpy() <= 0] = np.nan
+    if flows["flow_total"].notna().sum() == 0:
+        return None
+    n = len(flows)
+
+    # Seasonal: profile làm trơn của chu kỳ trước, kéo dài tới hết horizon
+    profile = flows.rolling(cfg.FORECAST_SEASON_SMOOTH, center=True, min_periods=1).mean().to_numpy()
+    seasonal = np.full((n + horizon, len(FLOW_COLUMNS)), np.nan)
+    if n + horizon > season:
+        seasonal[season:] = profile[: n + horizon - season]
+
+    level = _smooth_level(flows, alpha)
+    resid = flows - seasonal[:n]
+    resid_level = _smooth_level(resid, alpha)
+
+    steps = np.arange(1, horizon + 1)
+    damping = cfg.FORECAST_DAMPING ** steps
+    seasonal_fc = seasonal[n:] + damping[:, None] * resid_level.iloc[-1].to_numpy()[None, :]
+    level_fc = np.broadcast_to(level.iloc[-1].to_numpy(), seasonal_fc.shape)
+
+    use_season = ~np.isnan(seasonal_fc[:, FLOW_COLUMNS.index("flow_total")])
+    values = np.where(use_season[:, None], seasonal_fc, level_fc)
+    values = np.clip(np.nan_to_num(values), 0, None)
+
+    # Sai số tăng theo số bước như simple exponential smoothing: sigma * sqrt(1 + (h - 1) * alpha^2)
+    sigma = np.where(use_season, _error_std(resid, resid_level), _error_std(flows, level))
+    width = cfg.FORECAST_INTERVAL_Z * sigma * np.sqrt(1 + (steps - 1) * alpha ** 2)
+    total = values[:, FLOW_COLUMNS.index("flow_total")]
+
+    result = pd.DataFrame(values, columns=FLOW_COLUMNS, index=pd.Index(steps, name="horizon"))
+    result["lower_total"] = np.clip(total - width, 0, None)
+    result["upper_total"] = total + width
+    result["method"] = np.where(use_season, "seasonal_ses", "ses")
+    return result
+
+
+def active_cameras(db, since):
+    """Camera có rollup 1 phút từ `since` tới nay."""
+    query = select(TrafficRollup1m.camera_id).where(TrafficRollup1m.bucket_start >= since).distinct()
+    return sorted(db.execute(query).scalars().all())
+
+
+def forecast_rows(camera_id, result, origin, generated_at):
+    """DataFrame của forecast_camera -> các dòng insert vào traffic_forecasts."""
+    rows = []
+    for step, row in zip(result.index.tolist(), result.to_dict("records")):
+        row.update(
+            camera_id=camera_id,
+            bucket_start=origin + timedelta(minutes=step - 1),
+            horizon=step,
+            generated_at=generated_at,
+        )
+        rows.append(row)
+    return rows
+
+
+def run_forecasts(session_factory=SessionLocal, now=None, cfg=settings_metric_transport):
+    """Tính lại dự báo của mọi camera còn dữ liệu, thay toàn bộ bảng traffic_forecasts trong 1 transaction."""
+    now = as_utc(now or datetime.now(timezone.utc))
+    origin = bucket_start(now, "1min")  # phút đang diễn ra = bước dự báo đầu tiên
+    start = origin - timedelta(hours=cfg.FORECAST_HISTORY_HOURS)
+
+    t0 = time.perf_counter()
+    db = session_factory()
+    try:
+        cameras = active_cameras(db, origin - timedelta(minutes=cfg.FORECAST_MAX_STALE_MINUTES))
+        rows = []
+        if cameras:
+            _, frames = multi_camera_series(db, cameras, start, origin, "1min")
+            for cam in cameras:
+                result = forecast_camera(frames[cam], cfg=cfg)
+                if result is not None:
+                    rows.extend(forecast_rows(cam, result, origin, now))
+        db.execute(delete(TrafficForecast))
+        if rows:
+            db.execute(insert(TrafficForecast), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    stats = {"cameras": len(cameras), "rows": len(rows), "seconds": round(time.perf_counter() - t0, 2)}
+    print(f"Forecast: {stats}")
+    return stats
+
+
+def load_forecast(db, camera_id, minutes=None):
+    """Các dòng dự báo của camera (tối đa `minutes` phút tới), theo thứ tự thời gian."""
+    query = select(TrafficForecast).where(TrafficForecast.camera_id == camera_id)
+    if minutes:
+        query = query.where(TrafficForecast.horizon <= minutes)
+    return db.execute(query.order_by(TrafficForecast.bucket_start.asc())).scalars().all()
+
+
+def forecast_payload(camera_id, rows, layout="points"):
+    """Các dòng traffic_forecasts -> JSON (nhãn thời gian theo giờ địa phương)."""
+    labels = [as_utc(r.bucket_start).astimezone(LOCAL_TZ).isoformat() for r in rows]
+    values = {name: [round(getattr(r, f"flow_{name}"), 2) for r in rows] for name in CLASS_FIELDS}
+    values["lower"] = [round(r.lower_total, 2) for r in rows]
+    values["upper"] = [round(r.upper_total, 2) for r in rows]
+    values["horizon"] = [r.horizon for r in rows]
+    values["method"] = [r.method for r in rows]
+
+    payload = {
+        "camera_id": camera_id,
+        "generated_at": as_utc(rows[0].generated_at).astimezone(LOCAL_TZ).isoformat() if rows else None,
+        "horizon_minutes": len(rows),
+        "unit": "vehicles/min",
+        "timezone": "Asia/Bangkok (UTC+7)",
+    }
+    if layout == "columnar":
+        payload.update({"labels": labels, "values": values})
+    else:
+        names = list(values)
+        payload["points"] = [
+            {"timestamp": label, **{name: values[name][i] for name in names}}
+            for i, label in enumerate(labels)
+        ]
+    return payload
+
+
+if __name__ == "__main__":
+    run_forecasts()
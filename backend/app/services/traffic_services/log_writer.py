@@ -0,0 +1,185 @@
+import csv
+import io
+import queue
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import insert
+
+from app.core.config import settings_metric_transport
+from app.db.base import SessionLocal
+from app.models.traffic_logs import TrafficLog
+from app.services.traffic_services.deltas import DeltaTracker
+from app.services.traffic_services.rollups import compute_rollups, apply_rollups, as_utc
+
+LOG_COLUMNS = [
+    "camera_id", "timestamp",
+    "count_car", "count_motor", "count_bus", "count_truck",
+    "total_vehicles", "fps",
+    "delta_car", "delta_motor", "delta_bus", "delta_truck", "delta_total",
+    "session_id", "is_reset",
+]
+
+
+class TrafficLogWriter:
+    """
+    Writer duy nhất của bảng traffic_logs.
+
+    Các process camera chỉ put_nowait() bản ghi vào `log_queue` (không bao giờ chờ DB).
+    Thread này gom bản ghi vào buffer trong RAM và ghi theo batch mỗi `flush_seconds`
+    hoặc khi đủ `batch_size`:
+    - PostgreSQL (psycopg2): COPY ... FROM STDIN
+    - Các DB khác: executemany qua insert(TrafficLog)
+    Ghi lỗi thì giữ nguyên batch trong buffer và thử lại với backoff.
+    Trước khi ghi, mỗi bản ghi được gán delta_* (số xe từ bản ghi trước, phát hiện
+    reset theo session_id). Các bảng rollup 1m/1h/1d được cập nhật trong cùng
+    transaction với batch. Sau khi commit, `on_commit(camera_ids)` được gọi (vd: xoá cache chart).
+    """
+
+    def __init__(self, log_queue, flush_seconds=None, batch_size=None, max_buffer=None,
+                 session_factory=SessionLocal, on_commit=None):
+        self.log_queue = log_queue
+        self.flush_seconds = flush_seconds or settings_metric_transport.TRAFFIC_LOG_FLUSH_SECONDS
+        self.batch_size = batch_size or settings_metric_transport.TRAFFIC_LOG_BATCH_SIZE
+        self.max_buffer = max_buffer or settings_metric_transport.TRAFFIC_LOG_MAX_BUFFER
+        self.session_factory = session_factory
+        self.on_commit = on_commit
+        self.deltas = DeltaTracker()
+
+        self.buffer = deque()
+        self.dropped = 0
+        self.written = 0
+        self.failures = 0
+        self.last_error = None
+        self._retry_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="traffic-log-writer", daemon=True)
+        self._thread.start()
+        print("TrafficLogWriter: đã kích hoạt ghi log giao thông theo batch...")
+
+    def stop(self, timeout=10.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Cố ghi nốt phần còn lại trước khi tắt
+        self._drain()
+        while self.buffer:
+            if not self._flush_once():
+                break
+
+    # --- Main loop ---
+    def _drain(self, timeout=0.0):
+        """Chuyển bản ghi từ queue vào buffer. Chờ tối đa `timeout` cho bản ghi đầu tiên."""
+        got = 0
+        block = timeout > 0
+        while True:
+            try:
+                row = self.log_queue.get(block, timeout) if block else self.log_queue.get_nowait()
+            except queue.Empty:
+                break
+            except (EOFError, OSError):
+                break
+            block = False
+            self._append(row)
+            got += 1
+        return got
+
+    def _append(self, row):
+        if len(self.buffer) >= self.max_buffer:
+            self.buffer.popleft()
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"TrafficLogWriter: buffer đầy, đã bỏ {self.dropped} bản ghi cũ")
+        self.buffer.append(row)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while not self._stop_event.is_set():
+            wait = max(0.05, min(next_flush - time.monotonic(), 0.5))
+            self._drain(timeout=wait)
+
+            now = time.monotonic()
+            if now < self._retry_at:
+                continue
+            if len(self.buffer) >= self.batch_size or now >= next_flush:
+                while self.buffer and self._flush_once():
+                    pass
+                next_flush = time.monotonic() + self.flush_seconds
+
+    # --- DB write ---
+    def _flush_once(self):
+        """Ghi 1 batch. Trả về True nếu thành công."""
+        batch = [self.buffer[i] for i in range(min(self.batch_size, len(self.buffer)))]
+        if not batch:
+            return True
+
+        # Bản sao để buffer giữ nguyên bản ghi gốc nếu phải thử lại
+        rows = sorted((dict(r) for r in batch), key=lambda r: (r["camera_id"], as_utc(r["timestamp"])))
+        db = self.session_factory()
+        try:
+            self.deltas.prime(db, {r["camera_id"] for r in rows})
+            delta_state = self.deltas.annotate(rows)
+            self._write_rows(db, rows)
+            apply_rollups(db, compute_rollups(rows))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failures += 1
+            self.last_error = str(e)
+            delay = min(2 ** min(self.failures, 5), 30)
+            self._retry_at = time.monotonic() + delay
+            print(f"TrafficLogWriter: lỗi ghi DB ({e}), thử lại sau {delay}s")
+            return False
+        finally:
+            db.close()
+
+        self.deltas.commit(delta_state)
+        if self.on_commit is not None:
+            try:
+                self.on_commit({r["camera_id"] for r in rows})
+            except Exception as e:
+                print(f"TrafficLogWriter: lỗi on_commit ({e})")
+        for _ in batch:
+            self.buffer.popleft()
+        self.written += len(batch)
+        self.failures = 0
+        self._retry_at = 0.0
+        return True
+
+    def _write_rows(self, db, rows):
+        conn = db.connection()
+        if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+            self._copy_rows(conn, rows)
+        else:
+            db.execute(insert(TrafficLog), rows)
+
+    def _copy_rows(self, conn, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow([row.get(col) for col in LOG_COLUMNS])
+        buf.seek(0)
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {TrafficLog.__tablename__} ({', '.join(LOG_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buf,
+            )
+        finally:
+            cursor.close()
+
+    def stats(self):
+        return {
+            "buffered": len(self.buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,451 @@
+"""
+Phát hiện cao điểm dạng streaming.
+
+- StreamingPeakDetector: trung bình / phương sai trượt (Welford lúc đầu, EWMA khi đủ mẫu), O(1) mỗi sample,
+  có trễ (hysteresis): z >= PEAK_ENTER_Z bắt đầu đợt cao điểm, z < PEAK_EXIT_Z kết thúc.
+- PeakMonitor: chạy trong process camera, đổi số xe cộng dồn thành số xe / PEAK_SAMPLE_SECONDS
+  và đưa vào detector; sự kiện peak_start / peak_end được đẩy vào `peak_queue`.
+- PeakEventHub: thread trong process API đọc `peak_queue`, lưu bảng traffic_peaks và phát
+  sự kiện cho các WebSocket /ws/peaks đang nghe. Khi process camera dừng (crash, restart, bị gỡ),
+  supervisor gửi `camera_stopped` để hub đóng đợt đang mở tại mốc sample cuối.
+"""
+import asyncio
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from app.core.config import settings_metric_transport
+from app.db.base import SessionLocal
+from app.models.traffic_logs import TrafficLog
+from app.models.traffic_peaks import TrafficPeak
+from app.services.traffic_services.rollups import LOCAL_TZ, as_utc
+
+
+class StreamingPeakDetector:
+    """
+    Baseline cập nhật tăng dần, không giữ lịch sử:
+        diff = x - mean;  mean += a * diff;  var = (1 - a) * (var + a * diff^2)
+    với a = max(alpha, 1/n): n mẫu đầu đúng bằng trung bình / phương sai Welford,
+    sau đó là EWMA (quên dần dữ liệu cũ). Trong đợt cao điểm baseline học chậm hơn
+    (ACTIVE_ALPHA_FACTOR) để đợt dài không tự kéo baseline lên rồi "hết" cao điểm.
+    """
+
+    ACTIVE_ALPHA_FACTOR = 0.1
+
+    def __init__(self, alpha=None, enter_z=None, exit_z=None, warmup=None, min_std=None, min_flow=None):
+        s = settings_metric_transport
+        self.alpha = alpha if alpha is not None else s.PEAK_EWMA_ALPHA
+        self.enter_z = enter_z if enter_z is not None else s.PEAK_ENTER_Z
+        self.exit_z = exit_z if exit_z is not None else s.PEAK_EXIT_Z
+        self.warmup = warmup if warmup is not None else s.PEAK_WARMUP_SAMPLES
+        self.min_std = min_std if min_std is not None else s.PEAK_MIN_STD
+        self.min_flow = min_flow if min_flow is not None else s.PEAK_MIN_FLOW
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.active = None  # đợt cao điểm đang diễn ra
+
+    @property
+    def std(self):
+        return max(math.sqrt(self.var), self.min_std)
+
+    def zscore(self, value):
+        return (value - self.mean) / self.std
+
+    def _learn(self, value):
+        self.n += 1
+        a = max(self.alpha, 1.0 / self.n)
+        if self.active is not None:
+            a *= self.ACTIVE_ALPHA_FACTOR
+        diff = value - self.mean
+        self.mean += a * diff
+        self.var = (1 - a) * (self.var + a * diff * diff)
+
+    def update(self, ts, value):
+        """
+        1 sample bắt đầu lúc `ts` (epoch giây) -> ("peak_start" | "peak_end", đợt cao điểm) hoặc None.
+        Sự kiện được tính theo baseline trước khi sample này được học.
+        """
+        event = None
+        if self.n >= self.warmup:
+            z = self.zscore(value)
+            if self.active is None:
+                if z >= self.enter_z and value >= self.min_flow:
+                    self.active = {
+                        "peak_id": uuid.uuid4().hex,
+                        "started_at": ts,
+                        "start_value": value,
+                        "peak_value": value,
+                        "baseline_mean": self.mean,
+                        "baseline_std": self.std,
+                        "z": z,
+                        "samples": 1,
+                    }
+                    event = ("peak_start", dict(self.active))
+            elif z < self.exit_z:
+                ended = dict(self.active, ended_at=ts)
+                self.active = None
+                event = ("peak_end", ended)
+            else:
+                self.active["samples"] += 1
+                if value > self.active["peak_value"]:
+                    self.active["peak_value"] = value
+                    self.active["z"] = max(self.active["z"], z)
+        self._learn(value)
+        return event
+
+
+class PeakMonitor:
+    """
+    Dùng trong process camera: observe(now, tổng xe cộng dồn) mỗi frame, chỉ làm việc
+    khi đủ 1 sample (PEAK_SAMPLE_SECONDS). Trả về sự kiện (dict) hoặc None.
+    """
+
+    def __init__(self, camera_id, sample_seconds=None, detector=None):
+        self.camera_id = int(camera_id)
+        self.sample_seconds = sample_seconds or settings_metric_transport.PEAK_SAMPLE_SECONDS
+        self.detector = detector or StreamingPeakDetector()
+        self._window_start = None
+        self._window_total = 0
+
+    def observe(self, now, total):
+        if self._window_start is None or total < self._window_total:
+            self._window_start, self._window_total = now, total
+            return None
+        elapsed = now - self._window_start
+        if elapsed < self.sample_seconds:
+            return None
+        # Frame bị trễ làm sample dài hơn: quy về số xe / sample_seconds để so được với baseline
+        value = round((total - self._window_total) * self.sample_seconds / elapsed, 2)
+        # Đợt cao điểm tính từ đầu sample đầu tiên vượt ngưỡng tới đầu sample đầu tiên trở lại bình thường
+        window_start = self._window_start
+        self._window_start, self._window_total = now, total
+        result = self.detector.update(window_start, value)
+        if result is None:
+            return None
+        kind, peak = result
+        return {
+            "event": kind,
+            "camera_id": self.camera_id,
+            "sample_seconds": self.sample_seconds,
+            "value": value,
+            **peak,
+        }
+
+    def state(self):
+        """Trạng thái hiện tại cho info_dict của camera."""
+        d = self.detector
+        active = d.active
+        return {
+            "active": active is not None,
+            "peak_id": active["peak_id"] if active else None,
+            "since": active["started_at"] if active else None,
+            "baseline_mean": round(d.mean, 2),
+            "baseline_std": round(d.std, 2),
+            "samples": d.n,
+            # Mốc kết thúc sample cuối đã đưa vào detector (epoch giây), để đóng đợt khi process dừng
+            "last_sample_at": self._window_start,
+        }
+
+
+def _iso(ts):
+    if ts is None:
+        return None
+    if isinstance(ts, datetime):
+        return as_utc(ts).astimezone(LOCAL_TZ).isoformat()
+    return datetime.fromtimestamp(ts, LOCAL_TZ).isoformat()
+
+
+def event_payload(event):
+    """Sự kiện từ process camera -> JSON cho WebSocket (thời gian ISO theo giờ địa phương)."""
+    return {
+        "event": event["event"],
+        "peak_id": event["peak_id"],
+        "camera_id": event["camera_id"],
+        "started_at": _iso(event["started_at"]),
+        "ended_at": _iso(event.get("ended_at")),
+        "value": event["value"],
+        "peak_value": event["peak_value"],
+        "baseline_mean": round(event["baseline_mean"], 2),
+        "baseline_std": round(event["baseline_std"], 2),
+        "z": round(event["z"], 2),
+        "samples": event["samples"],
+        "sample_seconds": event["sample_seconds"],
+    }
+
+
+def peak_row(peak):
+    """TrafficPeak -> dict cho API."""
+    return {
+        "peak_id": peak.peak_uid,
+        "camera_id": peak.camera_id,
+        "started_at": _iso(peak.started_at),
+        "ended_at": _iso(peak.ended_at),
+        "start_value": peak.start_value,
+        "peak_value": peak.peak_value,
+        "baseline_mean": peak.baseline_mean,
+        "baseline_std": peak.baseline_std,
+        "z": peak.z_score,
+        "samples": peak.samples,
+        "sample_seconds": peak.sample_seconds,
+    }
+
+
+def load_peaks(db, camera_id, start, end=None):
+    """Các đợt cao điểm của camera giao với [start, end) (đợt chưa kết thúc tính tới hiện tại)."""
+    query = select(TrafficPeak).where(
+        TrafficPeak.camera_id == camera_id,
+        (TrafficPeak.ended_at.is_(None)) | (TrafficPeak.ended_at > as_utc(start)),
+    )
+    if end is not None:
+        query = query.where(TrafficPeak.started_at < as_utc(end))
+    return db.execute(query.order_by(TrafficPeak.started_at.asc())).scalars().all()
+
+
+def peak_mask(index, peaks, bucket_seconds=60):
+    """Mảng bool theo `index` (DatetimeIndex có múi giờ, mốc đầu bucket): bucket giao với đợt cao điểm nào."""
+    starts = ((index - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    mask = np.zeros(len(index), dtype=bool)
+    now = time.time()
+    for peak in peaks:
+        begin = as_utc(peak.started_at).timestamp()
+        end = as_utc(peak.ended_at).timestamp() if peak.ended_at is not None else now
+        mask |= (starts + bucket_seconds > begin) & (starts < max(end, begin + 1))
+    return mask
+
+
+def _utc(ts):
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+class PeakEventHub:
+    """
+    Nhận sự kiện cao điểm từ các process camera (qua `peak_queue`), trong 1 thread:
+    - giữ đợt cao điểm đang diễn ra của từng camera (`active`) để trả ngay cho client mới,
+    - phát sự kiện cho các subscriber WebSocket (asyncio.Queue trên event loop của chúng),
+    - lưu vào traffic_peaks, mỗi sự kiện 1 savepoint: mất kết nối DB thì giữ lại, thử lại ở vòng sau;
+      sự kiện tự nó lỗi (vi phạm ràng buộc, thiếu trường) thì bỏ, không chặn các sự kiện khác,
+    - gọi `on_event(camera_ids)` sau khi lưu (vd: xoá cache chart).
+    """
+
+    def __init__(self, peak_queue, session_factory=SessionLocal, on_event=None, max_buffer=None):
+        self.peak_queue = peak_queue
+        self.session_factory = session_factory
+        self.on_event = on_event
+        self.max_buffer = max_buffer or settings_metric_transport.PEAK_EVENT_MAX_BUFFER
+        self.active = {}  # camera_id -> payload peak_start
+        self.pending = deque()
+        self.received = 0
+        self.dropped = 0
+        self.last_error = None
+        self._retry_at = 0.0
+        self._subscribers = {}  # asyncio.Queue -> (loop, camera_id | None)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread is not None:
+            return
+        self._close_dangling()
+        self._thread = threading.Thread(target=self._run, name="traffic-peak-hub", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._persist()
+
+    def _close_dangling(self):
+        """
+        Đợt cao điểm chưa kết thúc từ lần chạy trước (process camera đã mất): đóng tại mốc dữ liệu cuối
+        còn biết được của camera - bản ghi traffic_logs mới nhất sau lúc bắt đầu, tối thiểu là hết
+        các sample đã tính vào đợt.
+        """
+        db = self.session_factory()
+        try:
+            peaks = db.execute(select(TrafficPeak).where(TrafficPeak.ended_at.is_(None))).scalars().all()
+            for peak in peaks:
+                started = as_utc(peak.started_at)
+                last_log = db.execute(
+                    select(func.max(TrafficLog.timestamp)).where(
+                        TrafficLog.camera_id == peak.camera_id, TrafficLog.timestamp >= started,
+                    )
+                ).scalar()
+                ended = started + timedelta(seconds=(peak.samples or 1) * peak.sample_seconds)
+                peak.ended_at = max(ended, as_utc(last_log)) if last_log is not None else ended
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"PeakEventHub: không đóng được đợt cao điểm cũ ({e})")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                event = self.peak_queue.get(timeout=0.5)
+            except queue.Empty:
+                event = None
+            except (EOFError, OSError):
+                break
+            if event is not None:
+                self.handle(event)
+            if self.pending and time.monotonic() >= self._retry_at:
+                self._persist()
+
+    # --- Events ---
+    def handle(self, event):
+        self.received += 1
+        cam = event["camera_id"]
+        if event["event"] == "camera_stopped":
+            # Process camera đã dừng: không còn ai gửi peak_end cho đợt đang mở
+            self._end_active(cam, event.get("ended_at") or time.time())
+            return
+        payload = event_payload(event)
+        if event["event"] == "peak_start":
+            previous = self.active.get(cam)
+            if previous is not None and previous["peak_id"] != event["peak_id"]:
+                # peak_end của process cũ bị mất: đóng đợt cũ tại lúc đợt mới bắt đầu
+                self._end_active(cam, event["started_at"])
+            with self._lock:
+                self.active[cam] = payload
+        elif self.active.get(cam, {}).get("peak_id") == event["peak_id"]:
+            with self._lock:
+                del self.active[cam]
+        self._enqueue(event)
+        self._broadcast(cam, payload)
+
+    def _end_active(self, camera_id, ended_at):
+        """Đóng đợt đang mở của camera (nếu có) tại `ended_at` (epoch giây): lưu DB và báo subscriber."""
+        with self._lock:
+            previous = self.active.pop(camera_id, None)
+        if previous is None:
+            return
+        self._enqueue({"event": "peak_end", "peak_id": previous["peak_id"], "camera_id": camera_id,
+                       "ended_at": ended_at})
+        self._broadcast(camera_id, dict(previous, event="peak_end", ended_at=_iso(ended_at)))
+
+    def _enqueue(self, event):
+        if len(self.pending) >= self.max_buffer:
+            self.pending.popleft()
+        self.pending.append(event)
+
+    def _insert(self, db, event):
+        db.add(TrafficPeak(
+            peak_uid=event["peak_id"],
+            camera_id=event["camera_id"],
+            started_at=_utc(event["started_at"]),
+            sample_seconds=event["sample_seconds"],
+            start_value=event["start_value"],
+            peak_value=event["peak_value"],
+            baseline_mean=event["baseline_mean"],
+            baseline_std=event["baseline_std"],
+            z_score=event["z"],
+            samples=event["samples"],
+            ended_at=_utc(event["ended_at"]) if event.get("ended_at") is not None else None,
+        ))
+        db.flush()
+
+    def _apply(self, db, event):
+        if event["event"] == "peak_start":
+            self._insert(db, event)
+            return
+        values = {"ended_at": _utc(event["ended_at"])}
+        for key, column in (("peak_value", "peak_value"), ("z", "z_score"), ("samples", "samples")):
+            if key in event:
+                values[column] = event[key]
+        result = db.execute(update(TrafficPeak).where(TrafficPeak.peak_uid == event["peak_id"]).values(**values))
+        if result.rowcount == 0 and "started_at" in event:
+            # peak_start bị mất (buffer đầy): peak_end mang đủ thông tin để tạo dòng
+            self._insert(db, event)
+
+    def _persist(self):
+        if not self.pending:
+            return
+        events = list(self.pending)
+        db = self.session_factory()
+        try:
+            for event in events:
+                try:
+                    with db.begin_nested():
+                        self._apply(db, event)
+                except (OperationalError, InterfaceError):
+                    raise  # mất kết nối: cả batch thử lại sau
+                except Exception as e:
+                    self.dropped += 1
+                    self.last_error = str(e)
+                    print(f"PeakEventHub: bỏ sự kiện {event.get('event')} {event.get('peak_id')} ({e})")
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.last_error = str(e)
+            self._retry_at = time.monotonic() + 5
+            print(f"PeakEventHub: lỗi ghi DB ({e}), thử lại sau 5s")
+            return
+        finally:
+            db.close()
+        for _ in events:
+            self.pending.popleft()
+        if self.on_event is not None:
+            cams = {e["camera_id"] for e in events if "camera_id" in e}
+            try:
+                self.on_event(cams)
+            except Exception as e:
+                print(f"PeakEventHub: lỗi on_event ({e})")
+
+    # --- WebSocket ---
+    def subscribe(self, camera_id=None, maxsize=100):
+        """Gọi trong event loop; trả về asyncio.Queue nhận payload sự kiện."""
+        q = asyncio.Queue(maxsize=maxsize)
+        with self._lock:
+            self._subscribers[q] = (asyncio.get_running_loop(), camera_id)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def snapshot(self, camera_id=None):
+        # Gọi từ event loop trong lúc thread hub đổi `active`
+        with self._lock:
+            active = sorted(self.active.items())
+        return [p for cam, p in active if camera_id is None or cam == camera_id]
+
+    @staticmethod
+    def _offer(q, payload):
+        try:
+            q.put_nowait(payload)
+        except asyncio.QueueFull:
+            pass  # client đọc chậm: bỏ sự kiện, trạng thái mới nhất vẫn có qua snapshot
+
+    def _broadcast(self, camera_id, payload):
+        with self._lock:
+            targets = [(q, loop) for q, (loop, cam) in self._subscribers.items() if cam is None or cam == camera_id]
+        for q, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, q, payload)
+            except RuntimeError:
+                self.unsubscribe(q)  # loop đã đóng
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+            "active": len(self.active),
+            "subscribers": len(self._subscribers),
+            "last_error": self.last_error,
+        }
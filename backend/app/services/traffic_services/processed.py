@@ -0,0 +1,103 @@
+"""
+Đọc kết quả phân tích của analysis/ (analyze.export_for_backend, file traffic_data.arrow).
+
+File là Arrow IPC stream không nén: memory-map rồi lấy thẳng các batch, không parse JSON.
+Bên ghi có thể nối thêm batch (chế độ append) -> dòng trùng timestamp thì giữ dòng sau cùng;
+batch cuối đang ghi dở thì bỏ qua, lần đọc sau sẽ có. Kết quả được cache theo (mtime, size) của file.
+"""
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.core.config import settings_metric_transport
+from app.services.traffic_services.export import pa
+from app.services.traffic_services.rollups import LOCAL_TZ
+
+
+class ProcessedStore:
+    def __init__(self, path=None):
+        self.path = path or settings_metric_transport.PROCESSED_DATA_PATH
+        self._lock = threading.Lock()
+        self._key = None
+        self._table = None
+
+    def _read(self):
+        source = pa.memory_map(self.path, "r")
+        try:
+            reader = pa.ipc.open_stream(source)
+            batches = []
+            while True:
+                try:
+                    batches.append(reader.read_next_batch())
+                except StopIteration:
+                    break
+                except (pa.ArrowInvalid, OSError):
+                    break  # batch cuối đang được ghi dở
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            # Giữ dòng cuối cùng của mỗi timestamp, sắp theo thời gian (take() copy ra khỏi vùng map)
+            ts = table.column("timestamp").cast(pa.int64()).to_numpy()
+            _, last = np.unique(ts[::-1], return_index=True)
+            return table.take(pa.array(len(ts) - 1 - last))
+        finally:
+            source.close()
+
+    def load(self):
+        """pa.Table đã khử trùng lặp; None nếu chưa có file."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key != self._key:
+                self._table = self._read()
+                self._key = key
+            return self._table
+
+    def updated_at(self):
+        try:
+            return datetime.fromtimestamp(os.stat(self.path).st_mtime, timezone.utc)
+        except FileNotFoundError:
+            return None
+
+
+def tail_minutes(table, minutes):
+    """Các dòng trong `minutes` phút tính tới bucket cuối."""
+    if table is None or table.num_rows == 0 or not minutes:
+        return table
+    ts = table.column("timestamp").cast(pa.int64()).to_numpy()
+    start = int(np.searchsorted(ts, ts[-1] - int(minutes * 60 * 1e9)))
+    return table.slice(start)
+
+
+def to_ipc_bytes(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def processed_payload(table, updated_at=None, layout="points"):
+    """pa.Table -> JSON (nhãn thời gian theo giờ địa phương), các cột lấy thẳng dạng numpy."""
+    ts = table.column("timestamp").cast(pa.int64()).to_numpy() // 1_000_000_000
+    labels = [datetime.fromtimestamp(t, LOCAL_TZ).isoformat() for t in ts.tolist()]
+    names = [n for n in table.column_names if n != "timestamp"]
+    columns = {n: table.column(n).to_numpy() for n in names}
+    meta = table.schema.metadata or {}
+    payload = {
+        "classes": meta.get(b"classes", b"").decode().split(",") if meta.get(b"classes") else [],
+        "count": table.num_rows,
+        "updated_at": updated_at.astimezone(LOCAL_TZ).isoformat() if updated_at else None,
+        "timezone": "Asia/Bangkok (UTC+7)",
+    }
+    if layout == "columnar":
+        payload.update({"labels": labels, "values": columns})
+    else:
+        rows = zip(*(columns[n].tolist() for n in names))
+        payload["points"] = [{"timestamp": label, **dict(zip(names, row))} for label, row in zip(labels, rows)]
+    return payload
+
+
+processed_store = ProcessedStore()
@@ -0,0 +1,222 @@
+"""
+Truy vấn chart: gom bucket, lấy max / tổng theo bucket ngay trong DB, chỉ trả về chuỗi kết quả.
+
+- SQLite: strftime('%s') + chia nguyên, LAG() (window function, SQLite >= 3.25)
+- PostgreSQL: date_trunc() cho phút / giờ, floor(epoch / n) cho bucket khác, LAG()
+Cột `bucket` luôn là epoch giây (UTC) để xử lý giống nhau cho mọi dialect.
+"""
+from datetime import datetime, time, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, case, cast, func, literal_column, select
+
+from app.models.traffic_logs import TrafficLog
+from app.models.traffic_rollups import TrafficRollup1m, TrafficRollup1h, TrafficRollup1d
+from app.services.traffic_services.rollups import CLASS_FIELDS, LOCAL_TZ, as_utc, bucket_start
+
+POSTGRES_TRUNC_UNITS = {60: "minute", 3600: "hour"}
+
+
+def freq_seconds(freq):
+    """'1min' / '5min' / '1h' -> số giây."""
+    return int(pd.Timedelta(freq).total_seconds())
+
+
+def epoch_expr(dialect, column):
+    """Biểu thức SQL: `column` dạng epoch giây (UTC)."""
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", column), Integer)
+    if dialect == "sqlite":
+        return cast(func.strftime(literal_column("'%s'"), column), Integer)
+    raise NotImplementedError(f"Dialect chưa hỗ trợ: {dialect}")
+
+
+def bucket_expr(dialect, column, seconds):
+    """Biểu thức SQL: mốc bắt đầu bucket `seconds` giây của `column`, dạng epoch giây."""
+    # Hằng số viết thẳng vào SQL (không bind param) để biểu thức trong SELECT và GROUP BY giống hệt nhau
+    n = literal_column(str(int(seconds)))
+    if dialect == "postgresql":
+        unit = POSTGRES_TRUNC_UNITS.get(seconds)
+        if unit is not None:
+            return cast(func.extract("epoch", func.date_trunc(literal_column(f"'{unit}'"), column)), Integer)
+        return cast(func.floor(func.extract("epoch", column) / n) * n, Integer)
+    return epoch_expr(dialect, column) // n * n
+
+
+def rollup_table(seconds):
+    """
+    Bảng rollup thô nhất dùng được cho bucket `seconds` -> (model, độ phân giải của bảng).
+    Bảng ngày chỉ dùng cho bucket đúng 1 ngày (mốc 00:00 giờ địa phương, không gom tiếp theo UTC được).
+    """
+    if seconds == 86400:
+        return TrafficRollup1d, 86400
+    if seconds % 3600 == 0:
+        return TrafficRollup1h, 3600
+    return TrafficRollup1m, 60
+
+
+def _to_frame(rows, columns):
+    df = pd.DataFrame(rows, columns=columns)
+    if df.empty:
+        return df
+    index = pd.to_datetime(df.pop("bucket").astype("int64"), unit="s", utc=True).dt.tz_convert(LOCAL_TZ)
+    df.index = pd.DatetimeIndex(index, name="time")
+    return df
+
+
+def _rollup_query(db, camera_ids, start, end, seconds):
+    """SELECT camera_id, bucket (epoch), flow_*, max_*, samples theo bucket `seconds` từ bảng rollup phù hợp."""
+    model, native = rollup_table(seconds)
+    dialect = db.get_bind().dialect.name
+    # Bucket trùng độ phân giải của bảng: mỗi dòng rollup là 1 bucket, không cần GROUP BY
+    grouped = seconds != native
+    if grouped:
+        bucket = bucket_expr(dialect, model.bucket_start, seconds).label("bucket")
+    else:
+        bucket = epoch_expr(dialect, model.bucket_start).label("bucket")
+
+    columns = [model.camera_id, bucket]
+    for name in CLASS_FIELDS:
+        flow, peak = getattr(model, f"flow_{name}"), getattr(model, f"max_{name}")
+        columns.append((func.sum(flow) if grouped else flow).label(f"flow_{name}"))
+        columns.append((func.max(peak) if grouped else peak).label(f"max_{name}"))
+    columns.append((func.sum(model.samples) if grouped else model.samples).label("samples"))
+
+    query = select(*columns).where(model.camera_id.in_(camera_ids), model.bucket_start >= start)
+    if end is not None:
+        query = query.where(model.bucket_start < end)
+    if grouped:
+        query = query.group_by(model.camera_id, bucket)
+    query = query.order_by(model.camera_id, bucket if grouped else model.bucket_start)
+    return query, [c.name for c in columns]
+
+
+def rollup_series(db, camera_id, start, end=None, freq="1min"):
+    """
+    Chuỗi flow_* (tổng) / max_* (lớn nhất) theo bucket `freq` từ bảng rollup.
+    Dùng rollup ngày cho bucket 1 ngày, rollup giờ khi bucket là bội số của giờ, còn lại rollup phút.
+    """
+    query, names = _rollup_query(db, [camera_id], start, end, freq_seconds(freq))
+    df = _to_frame(db.execute(query).all(), names)
+    return df.drop(columns="camera_id") if not df.empty else df
+
+
+def log_series(db, camera_id, start, end=None, freq="1min"):
+    """
+    Chuỗi tính thẳng từ traffic_logs (không cần rollup / delta): max cộng dồn mỗi bucket,
+    flow = max - LAG(max); bucket có max nhỏ hơn bucket trước coi là reset (flow = max).
+    """
+    seconds = freq_seconds(freq)
+    bucket = bucket_expr(db.get_bind().dialect.name, TrafficLog.timestamp, seconds).label("bucket")
+
+    inner = [bucket]
+    for name, field in CLASS_FIELDS.items():
+        inner.append(func.max(getattr(TrafficLog, field)).label(f"max_{name}"))
+    inner.append(func.count().label("samples"))
+
+    query = select(*inner).where(TrafficLog.camera_id == camera_id, TrafficLog.timestamp >= start)
+    if end is not None:
+        query = query.where(TrafficLog.timestamp < end)
+    per_bucket = query.group_by(bucket).subquery()
+
+    columns = [per_bucket.c.bucket]
+    for name in CLASS_FIELDS:
+        cur = getattr(per_bucket.c, f"max_{name}")
+        prev = func.lag(cur).over(order_by=per_bucket.c.bucket)
+        columns.append(case((prev.is_(None), 0), (cur < prev, cur), else_=cur - prev).label(f"flow_{name}"))
+        columns.append(cur)
+    columns.append(per_bucket.c.samples)
+
+    query = select(*columns).order_by(per_bucket.c.bucket)
+    return _to_frame(db.execute(query).all(), [c.name for c in columns])
+
+
+def fill_gaps(df, freq="1min"):
+    """Bucket không có dữ liệu: flow_* = 0, max_* giữ giá trị trước đó."""
+    if df.empty:
+        return df
+    full_index = pd.date_range(df.index[0], df.index[-1], freq=freq, name="time")
+    df = df.reindex(full_index)
+    flow_cols = [c for c in df.columns if c.startswith("flow_")]
+    df[flow_cols] = df[flow_cols].fillna(0)
+    df["samples"] = df["samples"].fillna(0)
+    return df.ffill()
+
+
+def chart_series(db, camera_id, start, end=None, freq="1min"):
+    """Chuỗi đã lấp khoảng trống cho chart: ưu tiên rollup, chưa có thì tính từ log thô."""
+    df = rollup_series(db, camera_id, start, end, freq)
+    if df.empty:
+        df = log_series(db, camera_id, start, end, freq)
+    return fill_gaps(df, freq)
+
+
+# ========================== TRUY VẤN KHOẢNG THỜI GIAN BẤT KỲ ==========================
+
+# Độ phân giải cho /charts/query, từ mịn tới thô (bucket < 1 ngày tính theo UTC, 1d theo giờ địa phương)
+QUERY_RESOLUTIONS = ("1min", "5min", "15min", "30min", "1h", "1d")
+METRIC_COLUMNS = tuple(f"flow_{n}" for n in CLASS_FIELDS) + tuple(f"max_{n}" for n in CLASS_FIELDS) + ("samples",)
+
+
+def _local_days(start, end):
+    """Mốc 00:00 giờ địa phương (UTC) của các ngày giao với [start, end)."""
+    day = bucket_start(start, "1d").astimezone(LOCAL_TZ).date()
+    end = as_utc(end)
+    while True:
+        midnight = datetime.combine(day, time(), LOCAL_TZ).astimezone(timezone.utc)
+        if midnight >= end:
+            return
+        yield midnight
+        day += timedelta(days=1)
+
+
+def count_buckets(start, end, freq):
+    seconds = freq_seconds(freq)
+    if seconds == 86400:
+        return sum(1 for _ in _local_days(start, end))
+    first = int(as_utc(start).timestamp()) // seconds * seconds
+    return max(0, -(-(int(as_utc(end).timestamp()) - first) // seconds))
+
+
+def bucket_grid(start, end, freq):
+    """Mốc bắt đầu (epoch giây) của mọi bucket giao với [start, end)."""
+    seconds = freq_seconds(freq)
+    if seconds == 86400:
+        return np.array([int(d.timestamp()) for d in _local_days(start, end)], dtype=np.int64)
+    first = int(as_utc(start).timestamp()) // seconds * seconds
+    return np.arange(first, int(as_utc(end).timestamp()), seconds, dtype=np.int64)
+
+
+def pick_resolution(start, end, n_cameras, max_points):
+    """Độ phân giải mịn nhất mà số điểm (bucket x camera) không vượt `max_points`, None nếu không có."""
+    for freq in QUERY_RESOLUTIONS:
+        if count_buckets(start, end, freq) * n_cameras <= max_points:
+            return freq
+    return None
+
+
+def multi_camera_series(db, camera_ids, start, end, freq):
+    """
+    {camera_id: DataFrame flow_* / max_* / samples} trên cùng 1 lưới bucket phủ [start, end),
+    đọc bằng 1 truy vấn rollup cho mọi camera. Bucket trống: flow = 0, max giữ giá trị trước đó.
+    """
+    grid = bucket_grid(start, end, freq)
+    index = pd.DatetimeIndex(pd.to_datetime(grid, unit="s", utc=True).tz_convert(LOCAL_TZ), name="time")
+    if len(grid) == 0:
+        return index, {cam: pd.DataFrame(columns=list(METRIC_COLUMNS), index=index) for cam in camera_ids}
+
+    query_start = datetime.fromtimestamp(int(grid[0]), timezone.utc)
+    query, names = _rollup_query(db, camera_ids, query_start, as_utc(end), freq_seconds(freq))
+    df = pd.DataFrame(db.execute(query).all(), columns=names)
+
+    flow_cols = [c for c in METRIC_COLUMNS if not c.startswith("max_")]
+    frames = {}
+    for cam, part in df.groupby("camera_id"):
+        part = part.drop(columns="camera_id").set_index("bucket").reindex(grid)
+        part[flow_cols] = part[flow_cols].fillna(0)
+        part = part.ffill().fillna(0).astype(np.int64)
+        part.index = index
+        frames[int(cam)] = part
+    empty = pd.DataFrame(0, index=index, columns=list(METRIC_COLUMNS), dtype=np.int64)
+    return index, {cam: frames.get(cam, empty) for cam in camera_ids}
@@ -0,0 +1,316 @@
+"""
+Bảo trì bảng traffic_logs (chạy định kỳ trong API hoặc bằng cron):
+
+1. Log thô cũ hơn TRAFFIC_LOG_RETENTION_DAYS: giờ nào chưa có rollup thì gom vào rollup
+   (1m / 1h / 1d) trước, để không mất dữ liệu khi xoá.
+2. Xoá (hoặc lưu ra csv.gz rồi xoá) log thô cũ theo batch RETENTION_BATCH_SIZE dòng.
+   Nếu bảng là partition theo ngày (PostgreSQL) thì DROP cả partition.
+3. Xoá rollup 1 phút cũ hơn TRAFFIC_ROLLUP_1M_RETENTION_DAYS (rollup giờ / ngày giữ lại).
+4. VACUUM / ANALYZE theo dialect.
+
+    cd backend
+    python -m app.services.traffic_services.retention
+"""
+import csv
+import gzip
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import delete, except_, inspect, select, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.core.config import settings_metric_transport
+from app.db.base import SessionLocal, sync_engine
+from app.models.traffic_logs import TrafficLog
+from app.models.traffic_rollups import TrafficRollup1h, TrafficRollup1m
+from app.services.traffic_services.deltas import DELTA_FIELDS, DeltaTracker
+from app.services.traffic_services.queries import bucket_expr
+from app.services.traffic_services.rollups import LOCAL_TZ, apply_rollups, bucket_start, compute_rollups
+
+LOG_TABLE = TrafficLog.__tablename__
+PARTITION_RE = re.compile(rf"^{LOG_TABLE}_p(\d{{8}})$")
+ARCHIVE_COLUMNS = [c.name for c in TrafficLog.__table__.columns]
+
+
+# ========================== PARTITION (PostgreSQL) ==========================
+
+def create_partitioned_log_table(conn):
+    """
+    Gọi trong create_tables() trước create_all: nếu bật TRAFFIC_LOG_PARTITIONING trên PostgreSQL
+    và traffic_logs chưa tồn tại, tạo bảng cha PARTITION BY RANGE (timestamp) + partition DEFAULT.
+    Bảng đã tồn tại dạng thường thì giữ nguyên (chuyển đổi phải làm tay).
+    """
+    if conn.dialect.name != "postgresql" or not settings_metric_transport.TRAFFIC_LOG_PARTITIONING:
+        return
+    if inspect(conn).has_table(LOG_TABLE):
+        return
+
+    table = TrafficLog.__table__
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).rstrip().rstrip(";")
+    # Khoá chính của bảng partition phải chứa cột partition (cột PK tự NOT NULL)
+    ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, timestamp)")
+    conn.exec_driver_sql(f'{ddl} PARTITION BY RANGE (timestamp)')
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    conn.exec_driver_sql(f"CREATE TABLE {LOG_TABLE}_default PARTITION OF {LOG_TABLE} DEFAULT")
+    print(f" Created partitioned table {LOG_TABLE} (daily partitions)")
+
+
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+             "WHERE c.relname = :name"),
+        {"name": LOG_TABLE},
+    ).first() is not None
+
+
+def _list_partitions(conn):
+    """{ngày địa phương: tên partition} của các partition theo ngày."""
+    rows = conn.execute(
+        text("SELECT c.relname FROM pg_inherits i "
+             "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+             "WHERE p.relname = :name"),
+        {"name": LOG_TABLE},
+    ).scalars().all()
+    result = {}
+    for name in rows:
+        m = PARTITION_RE.match(name)
+        if m:
+            result[datetime.strptime(m.group(1), "%Y%m%d").date()] = name
+    return result
+
+
+def _day_bounds(day):
+    start = datetime(day.year, day.month, day.day, tzinfo=LOCAL_TZ)
+    return start.astimezone(timezone.utc), (start + timedelta(days=1)).astimezone(timezone.utc)
+
+
+def ensure_partitions(conn, days_ahead=None):
+    """
+    Tạo sẵn partition cho hôm nay và `days_ahead` ngày tới (theo giờ địa phương).
+    Mỗi partition tạo trong 1 savepoint: ngày nào lỗi (vd. DEFAULT đã có dòng của ngày đó) thì bỏ qua,
+    dòng của ngày đó tiếp tục nằm trong DEFAULT và được xoá theo batch khi quá hạn.
+    """
+    days_ahead = settings_metric_transport.TRAFFIC_LOG_PARTITIONS_AHEAD if days_ahead is None else days_ahead
+    existing = _list_partitions(conn)
+    today = datetime.now(LOCAL_TZ).date()
+    created = []
+    for offset in range(days_ahead + 1):
+        day = today + timedelta(days=offset)
+        if day in existing:
+            continue
+        start, end = _day_bounds(day)
+        name = f"{LOG_TABLE}_p{day:%Y%m%d}"
+        try:
+            with conn.begin_nested():
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {LOG_TABLE} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+        except Exception as e:
+            print(f"Retention: không tạo được partition {name}: {e}")
+            continue
+        created.append(name)
+    return created
+
+
+# ========================== ROLLUP LOG CŨ ==========================
+
+def _missing_rollup_hours(db, cutoff):
+    """(camera_id, epoch giờ) có log thô cũ hơn cutoff nhưng chưa có rollup giờ."""
+    dialect = db.get_bind().dialect.name
+    raw_hour = bucket_expr(dialect, TrafficLog.timestamp, 3600)
+    rollup_hour = bucket_expr(dialect, TrafficRollup1h.bucket_start, 3600)
+    query = except_(
+        select(TrafficLog.camera_id, raw_hour).where(TrafficLog.timestamp < cutoff),
+        select(TrafficRollup1h.camera_id, rollup_hour).where(TrafficRollup1h.bucket_start < cutoff),
+    )
+    missing = {}
+    for cam, hour in db.execute(query).all():
+        missing.setdefault(cam, []).append(int(hour))
+    return missing
+
+
+def _rollup_hours(db, camera_id, hours):
+    """Gom log thô của các giờ thiếu rollup (tính delta cho log cũ chưa có)."""
+    start = datetime.fromtimestamp(min(hours), timezone.utc)
+    end = datetime.fromtimestamp(max(hours) + 3600, timezone.utc)
+    wanted = set(hours)
+
+    tracker = DeltaTracker()
+    tracker.prime_before(db, camera_id, start)
+
+    columns = ("camera_id", "timestamp", "session_id", *DELTA_FIELDS, *DELTA_FIELDS.values())
+    rows = [
+        dict(r) for r in db.execute(
+            select(*[getattr(TrafficLog, c) for c in columns])
+            .where(TrafficLog.camera_id == camera_id, TrafficLog.timestamp >= start, TrafficLog.timestamp < end)
+            .order_by(TrafficLog.timestamp.asc(), TrafficLog.id.asc())
+        ).mappings()
+    ]
+    if any(r["delta_total"] is None for r in rows):
+        # Log từ trước khi có cột delta: tính lại cho cả đoạn
+        tracker.annotate(rows)
+    rows = [r for r in rows if int(bucket_start(r["timestamp"], "1h").timestamp()) in wanted]
+    apply_rollups(db, compute_rollups(rows))
+    return len(rows)
+
+
+def rollup_old_logs(db, cutoff):
+    rolled = 0
+    for cam, hours in _missing_rollup_hours(db, cutoff).items():
+        rolled += _rollup_hours(db, cam, hours)
+        db.commit()
+    return rolled
+
+
+# ========================== XOÁ / LƯU TRỮ ==========================
+
+def _archive(rows, archive_dir):
+    """Ghi thêm vào file csv.gz theo ngày (UTC) của log."""
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(f"{row['timestamp']:%Y-%m-%d}", []).append(row)
+    for day, day_rows in by_day.items():
+        path = Path(archive_dir) / f"{LOG_TABLE}_{day}.csv.gz"
+        new_file = not path.exists()
+        with gzip.open(path, "at", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(ARCHIVE_COLUMNS)
+            writer.writerows([row[c] for c in ARCHIVE_COLUMNS] for row in day_rows)
+
+
+def delete_old_logs(db, cutoff, batch_size, archive_dir=None):
+    """
+    Xoá log thô cũ hơn cutoff theo batch (mỗi batch 1 transaction ngắn).
+    Bảng partition: điều kiện timestamp giúp PostgreSQL chỉ quét partition DEFAULT.
+    """
+    deleted = 0
+    while True:
+        if archive_dir:
+            rows = db.execute(
+                select(TrafficLog.__table__).where(TrafficLog.timestamp < cutoff)
+                .order_by(TrafficLog.id).limit(batch_size)
+            ).mappings().all()
+            ids = [r["id"] for r in rows]
+            if ids:
+                _archive(rows, archive_dir)
+        else:
+            ids = db.execute(
+                select(TrafficLog.id).where(TrafficLog.timestamp < cutoff)
+                .order_by(TrafficLog.id).limit(batch_size)
+            ).scalars().all()
+        if not ids:
+            return deleted
+        db.execute(delete(TrafficLog).where(TrafficLog.id.in_(ids), TrafficLog.timestamp < cutoff))
+        db.commit()
+        deleted += len(ids)
+
+
+def drop_old_partitions(db, cutoff, archive_dir=None):
+    """Bảng partition: DROP các partition ngày đã nằm trọn trước cutoff."""
+    conn = db.connection()
+    deleted = 0
+    for day, name in sorted(_list_partitions(conn).items()):
+        start, end = _day_bounds(day)
+        if end > cutoff:
+            continue
+        if archive_dir:
+            rows = conn.execute(text(f"SELECT * FROM {name}")).mappings().all()
+            _archive(rows, archive_dir)
+        deleted += conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        conn.execute(text(f"ALTER TABLE {LOG_TABLE} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        print(f"Retention: dropped partition {name}")
+    return deleted
+
+
+def delete_old_rollups(db, cutoff, batch_size):
+    deleted = 0
+    while True:
+        result = db.execute(
+            delete(TrafficRollup1m).where(
+                TrafficRollup1m.bucket_start.in_(
+                    select(TrafficRollup1m.bucket_start).where(TrafficRollup1m.bucket_start < cutoff)
+                    .distinct().limit(max(1, batch_size // 100))
+                )
+            )
+        )
+        db.commit()
+        if not result.rowcount:
+            return deleted
+        deleted += result.rowcount
+
+
+# ========================== VACUUM / ANALYZE ==========================
+
+def vacuum(engine, deleted):
+    dialect = engine.dialect.name
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if dialect == "postgresql":
+            # VACUUM không chạy được trong transaction -> AUTOCOMMIT
+            for table in (LOG_TABLE, TrafficRollup1m.__tablename__):
+                conn.exec_driver_sql(f"VACUUM (ANALYZE) {table}")
+        elif dialect == "sqlite":
+            if deleted >= settings_metric_transport.SQLITE_VACUUM_MIN_DELETED:
+                conn.exec_driver_sql("VACUUM")
+            conn.exec_driver_sql("ANALYZE")
+            conn.exec_driver_sql("PRAGMA optimize")
+
+
+# ========================== JOB ==========================
+
+def run_maintenance(session_factory=SessionLocal, engine=sync_engine, now=None):
+    now = now or datetime.now(timezone.utc)
+    cfg = settings_metric_transport
+    log_cutoff = now - timedelta(days=cfg.TRAFFIC_LOG_RETENTION_DAYS)
+    rollup_cutoff = now - timedelta(days=cfg.TRAFFIC_ROLLUP_1M_RETENTION_DAYS)
+    archive_dir = cfg.TRAFFIC_LOG_ARCHIVE_DIR or None
+    if archive_dir:
+        Path(archive_dir).mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    stats = {}
+    db = session_factory()
+    try:
+        partitioned = is_partitioned(db.connection())
+        if partitioned:
+            try:
+                stats["partitions_created"] = ensure_partitions(db.connection())
+                db.commit()
+            except Exception as e:
+                # Không tạo được partition không được chặn rollup / xoá / vacuum phía sau
+                db.rollback()
+                stats["partitions_created"] = []
+                print(f"Retention: lỗi tạo partition: {e}")
+            # Partition chỉ DROP được cả ngày -> gom rollup tới hết ngày của cutoff
+            log_cutoff = bucket_start(log_cutoff, "1d")
+
+        stats["rolled_up"] = rollup_old_logs(db, log_cutoff)
+        if partitioned:
+            stats["logs_deleted"] = drop_old_partitions(db, log_cutoff, archive_dir)
+            # Dòng cũ rơi vào partition DEFAULT (ngày chưa có partition) không bị DROP ở trên
+            stats["logs_deleted"] += delete_old_logs(db, log_cutoff, cfg.RETENTION_BATCH_SIZE, archive_dir)
+        else:
+            stats["logs_deleted"] = delete_old_logs(db, log_cutoff, cfg.RETENTION_BATCH_SIZE, archive_dir)
+        stats["rollup_1m_deleted"] = delete_old_rollups(db, rollup_cutoff, cfg.RETENTION_BATCH_SIZE)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    vacuum(engine, stats["logs_deleted"] + stats["rollup_1m_deleted"])
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    print(f"Retention: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    run_maintenance()
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select, update
+
+from app.core.config import settings_metric_transport
+from app.models.traffic_logs import TrafficLog
+from app.models.traffic_rollups import TrafficRollup1m, TrafficRollup1h, TrafficRollup1d
+from app.services.traffic_services.deltas import DELTA_FIELDS, DeltaTracker
+
+LOCAL_TZ = ZoneInfo(settings_metric_transport.LOCAL_TIMEZONE)
+
+# Tên lớp trong bảng rollup -> cột cộng dồn tương ứng trong traffic_logs
+CLASS_FIELDS = {
+    "car": "count_car",
+    "motor": "count_motor",
+    "bus": "count_bus",
+    "truck": "count_truck",
+    "total": "total_vehicles",
+}
+
+ROLLUP_MODELS = {
+    "1min": TrafficRollup1m,
+    "1h": TrafficRollup1h,
+    "1d": TrafficRollup1d,
+}
+
+
+def as_utc(ts):
+    """Timestamp naive được coi là UTC (quy ước của traffic_logs)."""
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def bucket_start(ts, resolution):
+    ts = as_utc(ts)
+    if resolution == "1min":
+        return ts.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == "1d":
+        # Ngày tính theo giờ địa phương, lưu mốc 00:00 local dưới dạng UTC
+        local = ts.astimezone(LOCAL_TZ)
+        return local.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(timezone.utc)
+    raise ValueError(f"Unknown resolution: {resolution}")
+
+
+def _empty_bucket():
+    agg = {f"flow_{name}": 0 for name in CLASS_FIELDS}
+    agg.update({f"max_{name}": 0 for name in CLASS_FIELDS})
+    agg["samples"] = 0
+    return agg
+
+
+def compute_rollups(rows):
+    """
+    Gom batch TrafficLog (đã có delta_*) thành các bucket rollup.
+    Trả về {resolution: {(camera_id, bucket_start): bucket}}
+    """
+    aggs = {res: {} for res in ROLLUP_MODELS}
+    for row in rows:
+        cam = int(row["camera_id"])
+        for res in ROLLUP_MODELS:
+            key = (cam, bucket_start(row["timestamp"], res))
+            agg = aggs[res].setdefault(key, _empty_bucket())
+            for name, field in CLASS_FIELDS.items():
+                agg[f"flow_{name}"] += int(row.get(DELTA_FIELDS[field]) or 0)
+                agg[f"max_{name}"] = max(agg[f"max_{name}"], int(row.get(field) or 0))
+            agg["samples"] += 1
+    return aggs
+
+
+def _upsert_buckets(db, model, buckets):
+    if not buckets:
+        return
+    values = [
+        {"camera_id": cam, "bucket_start": start, **agg}
+        for (cam, start), agg in buckets.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        greatest = func.greatest
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        greatest = func.max
+    else:
+        _merge_buckets(db, model, values)
+        return
+
+    stmt = dialect_insert(model)
+    set_values = {"samples": model.samples + stmt.excluded.samples}
+    for name in CLASS_FIELDS:
+        set_values[f"flow_{name}"] = getattr(model, f"flow_{name}") + getattr(stmt.excluded, f"flow_{name}")
+        set_values[f"max_{name}"] = greatest(getattr(model, f"max_{name}"), getattr(stmt.excluded, f"max_{name}"))
+    stmt = stmt.on_conflict_do_update(index_elements=["camera_id", "bucket_start"], set_=set_values)
+    db.execute(stmt, values)
+
+
+def _merge_buckets(db, model, values):
+    """Fallback cho dialect không có ON CONFLICT: đọc - cộng - ghi từng bucket."""
+    for v in values:
+        row = db.get(model, (v["camera_id"], v["bucket_start"]))
+        if row is None:
+            db.add(model(**v))
+            continue
+        for name in CLASS_FIELDS:
+            setattr(row, f"flow_{name}", getattr(row, f"flow_{name}") + v[f"flow_{name}"])
+            setattr(row, f"max_{name}", max(getattr(row, f"max_{name}"), v[f"max_{name}"]))
+        row.samples += v["samples"]
+
+
+def apply_rollups(db, aggs):
+    for res, buckets in aggs.items():
+        _upsert_buckets(db, ROLLUP_MODELS[res], buckets)
+
+
+def backfill_rollups(db, hours=24):
+    """
+    Dựng rollup từ traffic_logs cho các camera chưa có rollup trong `hours` giờ qua
+    (dùng khi nâng cấp từ phiên bản chưa có bảng rollup). Mốc bắt đầu lùi về 00:00
+    địa phương để bucket ngày đầu tiên đầy đủ. Log cũ chưa có delta_* sẽ được tính
+    và ghi bổ sung delta luôn.
+    """
+    since = bucket_start(datetime.now(timezone.utc) - timedelta(hours=hours), "1d")
+    cameras = db.execute(
+        select(TrafficLog.camera_id).where(TrafficLog.timestamp >= since).distinct()
+    ).scalars().all()
+
+    for cam in cameras:
+        has_rollup = db.execute(
+            select(TrafficRollup1m.camera_id)
+            .where(TrafficRollup1m.camera_id == cam, TrafficRollup1m.bucket_start >= since)
+            .limit(1)
+        ).first()
+        if has_rollup:
+            continue
+
+        columns = ("id", "camera_id", "timestamp", "session_id", *DELTA_FIELDS, *DELTA_FIELDS.values())
+        rows = [
+            dict(r) for r in db.execute(
+                select(*[getattr(TrafficLog, c) for c in columns])
+                .where(TrafficLog.camera_id == cam, TrafficLog.timestamp >= since)
+                .order_by(TrafficLog.timestamp.asc(), TrafficLog.id.asc())
+            ).mappings()
+        ]
+        legacy = [r for r in rows if r["delta_total"] is None]
+        if legacy:
+            # Nối tiếp bản ghi cuối trước `since`, nếu không dòng đầu tiên mang cả bộ đếm cộng dồn
+            tracker = DeltaTracker()
+            tracker.prime_before(db, cam, since)
+            tracker.annotate(rows)
+            # Bulk UPDATE theo khóa chính
+            db.execute(
+                update(TrafficLog),
+                [{"id": r["id"], **{f: r[f] for f in (*DELTA_FIELDS.values(), "is_reset")}} for r in legacy],
+            )
+        apply_rollups(db, compute_rollups(rows))
+        db.commit()
+        print(f"Rollup backfill: camera {cam}, {len(rows)} logs ({len(legacy)} thiếu delta)")
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Biến môi trường điều khiển thread pool của OpenMP/BLAS. Phải được đặt trước khi
+# process con import torch/numpy nên được truyền qua môi trường lúc spawn.
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def available_cpus() -> List[int]:
+    """Danh sách core process hiện tại được phép chạy."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_worker_layout(num_workers: int, cpus: Optional[List[int]] = None,
+                       threads_per_worker: Optional[int] = None) -> List[List[int]]:
+    """Chia core cho các worker.
+
+    Mỗi worker nhận một dải core liền nhau (tốt cho cache). Nếu số core ít hơn
+    `num_workers * threads_per_worker` thì các dải được xếp vòng và dùng chung core.
+    """
+    if num_workers <= 0:
+        return []
+    cpus = list(cpus) if cpus else available_cpus()
+    if threads_per_worker is None:
+        threads_per_worker = max(1, len(cpus) // num_workers)
+    threads_per_worker = max(1, min(threads_per_worker, len(cpus)))
+
+    layout = []
+    for i in range(num_workers):
+        start = (i * threads_per_worker) % len(cpus)
+        layout.append([cpus[(start + k) % len(cpus)] for k in range(threads_per_worker)])
+    return layout
+
+
+def thread_env(num_threads: int) -> Dict[str, str]:
+    return {name: str(num_threads) for name in THREAD_ENV_VARS}
+
+
+@contextmanager
+def spawn_env(num_threads: Optional[int]) -> Iterator[None]:
+    """Tạm đặt biến môi trường thread cho process sắp spawn rồi khôi phục lại."""
+    if not num_threads:
+        yield
+        return
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update(thread_env(num_threads))
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def pin_process(pid: int, cpu_set: List[int]) -> bool:
+    """Gán affinity cho một process (pid=0 là process hiện tại)."""
+    if not cpu_set or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(pid, set(cpu_set))
+        return True
+    except OSError as e:
+        print(f"Không thể gán CPU affinity cho PID {pid}: {e}")
+        return False
+
+
+def pin_process_threads(pid: int, cpu_set: List[int]) -> int:
+    """Gán affinity cho mọi thread của process đang chạy.
+
+    Trên Linux `sched_setaffinity(pid)` chỉ đổi thread có TID = pid; thread pool
+    torch/OpenMP/OpenCV đã tạo vẫn giữ mask cũ nên phải duyệt /proc/<pid>/task.
+    Trả về số thread đã pin.
+    """
+    if not cpu_set or not hasattr(os, "sched_setaffinity"):
+        return 0
+    task_dir = f"/proc/{pid}/task"
+    if not os.path.isdir(task_dir):
+        return int(pin_process(pid, cpu_set))
+    pinned = 0
+    for tid in os.listdir(task_dir):
+        try:
+            os.sched_setaffinity(int(tid), set(cpu_set))
+            pinned += 1
+        except (OSError, ValueError):
+            # Thread vừa kết thúc giữa lúc duyệt
+            continue
+    return pinned
+
+
+def apply_worker_layout(cpu_set: Optional[List[int]], num_threads: Optional[int] = None) -> None:
+    """Gọi bên trong process worker: pin core và giới hạn thread torch/OpenCV."""
+    if cpu_set:
+        pin_process(0, cpu_set)
+    num_threads = num_threads or (len(cpu_set) if cpu_set else None)
+    if not num_threads:
+        return
+
+    os.environ.update(thread_env(num_threads))
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Chỉ đặt được trước khi torch chạy tác vụ song song đầu tiên
+            pass
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(num_threads)
+    except ImportError:
+        pass
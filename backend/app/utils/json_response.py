@@ -0,0 +1,41 @@
+import json
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn, thiếu thì dùng json chuẩn
+    orjson = None
+
+
+def _to_builtin(obj):
+    """default= cho json chuẩn: numpy array / scalar -> kiểu Python."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse dùng orjson: nhanh hơn json chuẩn và serialize thẳng numpy array
+    (payload chart dạng columnar không cần .tolist()).
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            # default: mảng numpy không liên tục (vd: cột cắt từ DataFrame) orjson không serialize thẳng được
+            return orjson.dumps(
+                content,
+                default=_to_builtin,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            )
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+            default=_to_builtin,
+        ).encode("utf-8")
@@ -0,0 +1,121 @@
+"""
+Đo CPU dựng + serialize payload chart ở 1440 điểm (24h theo phút), không tính thời gian đọc DB:
+
+- legacy  : iterrows() + strftime/int() từng dòng + JSONResponse (json chuẩn)
+- points  : charts.py (lấy theo cột numpy) + FastJSONResponse (orjson), cùng format cũ
+- columnar: charts.py layout="columnar" + FastJSONResponse
+
+    cd backend
+    python benchmarks/bench_chart_payloads.py --points 1440 --repeat 200
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+CLASSES = ["count_car", "count_motor", "count_bus", "count_truck"]
+
+
+def make_frame(n):
+    """DataFrame giống kết quả load_traffic_df: index theo phút (UTC+7), cột cộng dồn + flow."""
+    rng = np.random.default_rng(0)
+    index = pd.date_range(end=pd.Timestamp.now(tz="Asia/Bangkok").floor("min"), periods=n, freq="1min", name="time")
+    flows = rng.poisson(4, size=(n, len(CLASSES)))
+    df = pd.DataFrame(flows.cumsum(axis=0), index=index, columns=CLASSES)
+    df["total_vehicles"] = df[CLASSES].sum(axis=1)
+    df["flow_total"] = flows.sum(axis=1)
+    df["total"] = df["total_vehicles"]
+    return df
+
+
+# --- Cách cũ (trước khi lấy theo cột), giữ lại để so sánh ---
+def legacy_grouped_bar(camera_id, df, classes, minutes):
+    points = []
+    for idx, row in df.tail(minutes).iterrows():
+        values = {}
+        for c in classes:
+            v = row.get(c, 0)
+            values[c] = int(v) if pd.notna(v) else 0
+        points.append({"label": idx.strftime("%H:%M"), "values": values})
+    return {"camera_id": camera_id, "points": points, "classes": classes}
+
+
+def legacy_rolling_avg(camera_id, df, classes, minutes, window=5):
+    points = []
+    for idx, row in df[classes].rolling(window=window).mean().tail(minutes).iterrows():
+        values = {}
+        for c in classes:
+            v = row.get(c, None)
+            values[c] = float(v) if pd.notna(v) else 0.0
+        points.append({"label": idx.strftime("%H:%M"), "values": values})
+    return {"camera_id": camera_id, "points": points, "classes": classes, "window": window}
+
+
+def legacy_peaks(camera_id, df, classes, minutes):
+    df = df.assign(is_peak_auto=df["total"] >= df["total"].quantile(0.9))
+    points, peaks = [], []
+    for idx, row in df.tail(minutes).iterrows():
+        val = int(row["total"]) if pd.notna(row["total"]) else 0
+        is_peak = bool(row.get("is_peak_auto", False))
+        point = {"label": idx.strftime("%H:%M"), "value": val, "is_peak": is_peak, "timestamp": idx.isoformat()}
+        points.append(point)
+        if is_peak:
+            peaks.append({"label": point["label"], "value": val, "timestamp": point["timestamp"]})
+    return {"camera_id": camera_id, "points": points, "peaks": peaks}
+
+
+def cpu_ms(fn, repeat):
+    fn()  # warmup
+    t0 = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - t0) * 1000 / repeat
+
+
+def main():
+    from app.services.traffic_services import charts
+    from app.utils.json_response import FastJSONResponse, orjson
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=1440)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    df = make_frame(args.points)
+    n = args.points
+    cases = {
+        "grouped-bar": (
+            lambda: legacy_grouped_bar(0, df, CLASSES, n),
+            lambda layout: charts.grouped_bar_payload(0, df, CLASSES, minutes=n, layout=layout),
+        ),
+        "rolling-avg": (
+            lambda: legacy_rolling_avg(0, df, CLASSES, n),
+            lambda layout: charts.rolling_avg_payload(0, df, CLASSES, minutes=n, layout=layout),
+        ),
+        "peaks": (
+            lambda: legacy_peaks(0, df, CLASSES, n),
+            lambda layout: charts.peaks_payload(0, df, CLASSES, minutes=n, layout=layout),
+        ),
+    }
+
+    print(f"{n} points, {args.repeat} lần/case, orjson={'có' if orjson is not None else 'không'}")
+    print(f"{'chart':>12} {'method':>9} {'cpu ms':>8} {'bytes':>8}")
+    for name, (legacy, build) in cases.items():
+        methods = (
+            ("legacy", lambda: JSONResponse(legacy())),
+            ("points", lambda: FastJSONResponse(build("points"))),
+            ("columnar", lambda: FastJSONResponse(build("columnar"))),
+        )
+        for method, fn in methods:
+            ms = cpu_ms(fn, args.repeat)
+            print(f"{name:>12} {method:>9} {ms:8.2f} {len(fn().body):8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+So sánh cách dựng chuỗi cho chart trên bảng đã seed sẵn (mặc định 30 ngày x 20 camera):
+
+- pandas : kéo toàn bộ log thô của camera về, resample max + diff trong Python (cách cũ)
+- sql-log: gom bucket / max / LAG ngay trong DB từ traffic_logs (queries.log_series)
+- rollup : gom từ bảng rollup 1m/1h (queries.rollup_series)
+
+Mặc định dùng SQLite tạm; truyền --database-url để chạy trên PostgreSQL (bảng phải trống).
+
+    cd backend
+    python benchmarks/bench_chart_queries.py --days 30 --cameras 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+
+def seed(session_factory, days, cameras, interval):
+    from app.models.traffic_logs import TrafficLog
+    from app.services.traffic_services.rollups import apply_rollups, compute_rollups
+
+    end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    n = int(days * 86400 / interval)
+    times = [end - timedelta(seconds=interval * (n - i)) for i in range(n)]
+    rng = np.random.default_rng(0)
+
+    for cam in range(cameras):
+        deltas = rng.poisson(3, size=(n, 4))
+        counts = deltas.cumsum(axis=0)
+        rows = []
+        for i in range(n):
+            car, motor, bus, truck = (int(v) for v in counts[i])
+            d_car, d_motor, d_bus, d_truck = (int(v) for v in deltas[i])
+            rows.append({
+                "camera_id": cam, "timestamp": times[i],
+                "count_car": car, "count_motor": motor, "count_bus": bus, "count_truck": truck,
+                "total_vehicles": car + motor + bus + truck, "fps": 10.0,
+                "delta_car": d_car, "delta_motor": d_motor, "delta_bus": d_bus, "delta_truck": d_truck,
+                "delta_total": d_car + d_motor + d_bus + d_truck,
+                "session_id": "bench", "is_reset": i == 0,
+            })
+        db = session_factory()
+        try:
+            for i in range(0, n, 20000):
+                db.execute(insert(TrafficLog), rows[i:i + 20000])
+            apply_rollups(db, compute_rollups(rows))
+            db.commit()
+        finally:
+            db.close()
+        print(f"  seeded camera {cam + 1}/{cameras} ({n} logs)", end="\r")
+    print()
+    return end
+
+
+def pandas_series(db, camera_id, start, freq):
+    """Cách cũ: đọc log thô rồi resample + diff bằng pandas."""
+    from app.models.traffic_logs import TrafficLog
+
+    query = select(TrafficLog.timestamp, TrafficLog.total_vehicles).where(
+        TrafficLog.camera_id == camera_id, TrafficLog.timestamp >= start
+    )
+    df = pd.read_sql(query, db.get_bind())
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    s = df.set_index("timestamp")["total_vehicles"].resample(freq).max().ffill()
+    flow = s.diff().fillna(0)
+    return flow.where(flow >= 0, s)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--cameras", type=int, default=20)
+    parser.add_argument("--interval", type=int, default=10, help="giây giữa 2 log của 1 camera")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database_url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{tmpdir.name}/bench.db"
+
+    from app.db.base import Base
+    from app.models import traffic_logs, traffic_rollups  # noqa: F401 (đăng ký bảng)
+    from app.services.traffic_services.queries import log_series, rollup_series
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    print(f"Seeding {args.days} ngày x {args.cameras} camera, 1 log / {args.interval}s ...")
+    t0 = time.perf_counter()
+    end = seed(session_factory, args.days, args.cameras, args.interval)
+    print(f"Seed xong trong {time.perf_counter() - t0:.1f}s")
+
+    camera_id = args.cameras // 2
+    cases = [("24h", timedelta(hours=24), "1min"), (f"{args.days}d", timedelta(days=args.days), "1h")]
+    print(f"{'window':>7} {'freq':>5} {'method':>8} {'ms':>9} {'rows':>7}")
+    db = session_factory()
+    try:
+        for label, window, freq in cases:
+            start = end - window
+            methods = (
+                ("pandas", lambda: pandas_series(db, camera_id, start, freq)),
+                ("sql-log", lambda: log_series(db, camera_id, start, freq=freq)),
+                ("rollup", lambda: rollup_series(db, camera_id, start, freq=freq)),
+            )
+            for name, fn in methods:
+                ms, rows = timed(fn, args.repeat)
+                print(f"{label:>7} {freq:>5} {name:>8} {ms:9.1f} {rows:7d}")
+    finally:
+        db.close()
+        engine.dispose()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark chia CPU cho các worker camera.
+
+Với mỗi layout (số worker x số thread/worker, có/không pin core), chạy song song
+các process suy luận YOLO trên frame 854x480 giả lập trong `--seconds` giây rồi so
+sánh tổng số frame/giây. Mỗi worker phục vụ cameras/workers luồng camera lần lượt.
+
+Ví dụ (8 core, 4 camera):
+    cd backend
+    python benchmarks/bench_cpu_layout.py --cameras 4 --seconds 20
+"""
+import os
+import sys
+import time
+import argparse
+from multiprocessing import get_context
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.cpu_affinity import available_cpus, plan_worker_layout, spawn_env
+
+
+def _worker(cpu_set, num_threads, streams, seconds, model_path, ready, start, out):
+    from app.utils.cpu_affinity import apply_worker_layout
+    apply_worker_layout(cpu_set, num_threads)
+
+    import numpy as np
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    frame = np.random.randint(0, 255, (480, 854, 3), dtype=np.uint8)
+    model.predict(frame, verbose=False)  # warmup
+    ready.wait()
+    start.wait()
+
+    frames = 0
+    t_end = time.perf_counter() + seconds
+    while time.perf_counter() < t_end:
+        for _ in range(streams):
+            model.predict(frame, verbose=False)
+            frames += 1
+    out.put(frames)
+
+
+def run_layout(workers, threads, pinned, cameras, seconds, model_path):
+    ctx = get_context("spawn")
+    cpus = available_cpus()
+    layout = plan_worker_layout(workers, cpus, threads_per_worker=threads) if pinned else [None] * workers
+    streams = max(1, cameras // workers)
+
+    ready = ctx.Barrier(workers + 1)
+    start = ctx.Barrier(workers + 1)
+    out = ctx.Queue()
+    procs = []
+    for cpu_set in layout:
+        p = ctx.Process(target=_worker,
+                        args=(cpu_set, threads if pinned else None, streams, seconds, model_path, ready, start, out))
+        with spawn_env(threads if pinned else None):
+            p.start()
+        procs.append(p)
+
+    ready.wait()
+    start.wait()
+    total = sum(out.get() for _ in procs)
+    for p in procs:
+        p.join()
+    return total / seconds
+
+
+def candidate_layouts(cameras, num_cpus):
+    layouts = []
+    for workers in range(1, cameras + 1):
+        if cameras % workers:
+            continue
+        threads = 1
+        while workers * threads <= num_cpus:
+            layouts.append((workers, threads, True))
+            threads *= 2
+    # Baseline: 1 process/camera, không pin, thread pool mặc định
+    layouts.append((cameras, None, False))
+    return layouts
+
+
+def main():
+    from app.core.config import settings_metric_transport
+
+    parser = argparse.ArgumentParser(description="Tìm layout workers x threads tốt nhất cho N camera")
+    parser.add_argument("--cameras", type=int, default=settings_metric_transport.get_available_cameras())
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--model", default=settings_metric_transport.MODELS_PATH)
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    print(f"{len(cpus)} cores, {args.cameras} cameras, {args.seconds:.0f}s / layout")
+    print(f"{'workers':>8} {'threads':>8} {'pinned':>7} {'fps total':>10} {'fps/cam':>8}")
+
+    results = []
+    for workers, threads, pinned in candidate_layouts(args.cameras, len(cpus)):
+        fps = run_layout(workers, threads, pinned, args.cameras, args.seconds, args.model)
+        results.append((fps, workers, threads, pinned))
+        print(f"{workers:>8} {str(threads or 'auto'):>8} {str(pinned):>7} {fps:>10.1f} {fps / args.cameras:>8.2f}")
+
+    fps, workers, threads, pinned = max(results, key=lambda r: r[0])
+    print(f"\nBest: {workers} workers x {threads or 'auto'} threads (pinned={pinned}) -> {fps:.1f} fps")
+    if pinned and workers == args.cameras:
+        print(f"Đặt THREADS_PER_WORKER={threads} CPU_PINNING=1 để dùng layout này.")
+
+
+if __name__ == "__main__":
+    main()
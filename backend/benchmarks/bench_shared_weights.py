@@ -0,0 +1,76 @@
+"""
+So sánh nạp model riêng từng process (best.pt) với weight mmap dùng chung (best.shared.pt).
+
+Mỗi chế độ spawn N process giống camera worker, đo:
+- time-to-first-count: từ lúc spawn tới khi suy luận xong frame đầu tiên
+- RSS / PSS mỗi process khi tất cả N process cùng sống (PSS chia đều trang dùng chung)
+
+    cd backend
+    python benchmarks/bench_shared_weights.py --processes 4
+"""
+import os
+import sys
+import time
+import argparse
+from multiprocessing import get_context
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.road_services.SharedWeights import ensure_shared_weights
+
+
+def _worker(model_path, shared_path, spawned_at, loaded, out):
+    import numpy as np
+    from app.services.road_services.SharedWeights import load_yolo, process_memory_mb
+
+    t0 = time.perf_counter()
+    model = load_yolo(model_path, shared_path)
+    load_ms = (time.perf_counter() - t0) * 1000
+    frame = np.zeros((480, 854, 3), dtype=np.uint8)
+    model.predict(frame, verbose=False)
+    ttfc = time.time() - spawned_at
+
+    loaded.wait()  # đo bộ nhớ khi mọi process đã nạp xong
+    rss, pss = process_memory_mb()
+    out.put((load_ms, ttfc, rss, pss))
+    loaded.wait()
+
+
+def run_mode(n, model_path, shared_path):
+    ctx = get_context("spawn")
+    loaded = ctx.Barrier(n)
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(model_path, shared_path, time.time(), loaded, out))
+             for _ in range(n)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return results
+
+
+def _fmt(values):
+    values = [v for v in values if v is not None]
+    return f"{sum(values) / len(values):8.1f}" if values else f"{'n/a':>8}"
+
+
+def main():
+    from app.core.config import settings_metric_transport
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--model", default=settings_metric_transport.MODELS_PATH)
+    args = parser.parse_args()
+
+    shared_path = ensure_shared_weights(args.model)
+    print(f"{args.processes} processes | model={args.model}")
+    print(f"{'mode':>8} {'load ms':>8} {'ttfc s':>8} {'rss MB':>8} {'pss MB':>8}")
+    for mode, path in (("private", None), ("shared", shared_path)):
+        rows = run_mode(args.processes, args.model, path)
+        load_ms, ttfc, rss, pss = zip(*rows)
+        print(f"{mode:>8} {_fmt(load_ms)} {_fmt(ttfc)} {_fmt(rss)} {_fmt(pss)}")
+
+
+if __name__ == "__main__":
+    main()
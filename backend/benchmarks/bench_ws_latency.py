@@ -0,0 +1,180 @@
+"""
+Load test: độ trễ frame qua WebSocket trong lúc /charts bị gọi liên tục.
+
+Server (uvicorn, 1 process) chỉ gồm router traffic, không chạy camera: 1 thread giả lập
+camera ghi frame mới vào frame_dict mỗi 20ms, 8 byte đầu là thời điểm tạo frame.
+Client đo độ trễ (nhận - tạo) trên /ws/frames/0, lần lượt:
+
+- idle : không có request chart
+- load : --clients thread gọi /charts/bundle liên tục (minutes ngẫu nhiên để không trúng cache)
+
+So sánh TRAFFIC_DB_WORKERS=0 (truy vấn chạy thẳng trong event loop, như trước) với thread pool.
+
+    cd backend
+    python benchmarks/bench_ws_latency.py --workers 0,2 --clients 8 --seconds 10
+"""
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+import asyncio
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+FRAME_INTERVAL = 0.02
+FRAME_PADDING = b"\0" * 50_000  # cỡ 1 ảnh JPEG 854x480
+
+
+# ========================== SERVER ==========================
+
+def serve(port):
+    import uvicorn
+    from fastapi import FastAPI
+    from app.api import api_vehicles
+
+    app = FastAPI()
+    # Chỉ lấy route, bỏ startup/shutdown (không spawn camera)
+    app.router.routes.extend(api_vehicles.router.routes)
+    api_vehicles.sys_state.frame_dict = {}
+
+    def fake_camera():
+        # Thread riêng như process camera thật: event loop bị chặn thì frame vẫn được tạo đều
+        while True:
+            api_vehicles.sys_state.frame_dict["camera_0"] = struct.pack("d", time.time()) + FRAME_PADDING
+            time.sleep(FRAME_INTERVAL)
+
+    threading.Thread(target=fake_camera, daemon=True).start()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ========================== CLIENT ==========================
+
+def hammer_charts(base_url, cameras, stop, counter):
+    while not stop.is_set():
+        cam = random.randrange(cameras)
+        url = f"{base_url}/charts/bundle/{cam}?minutes={random.randint(30, 1440)}"
+        try:
+            with urllib.request.urlopen(url, timeout=60) as resp:
+                resp.read()
+            counter.append(1)
+        except Exception as e:
+            print(f"  request lỗi: {e}")
+
+
+async def measure(ws_url, seconds):
+    import websockets
+
+    ages, received = [], []
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            data = await ws.recv()
+            now = time.time()
+            ages.append((now - struct.unpack("d", data[:8])[0]) * 1000)
+            received.append(now)
+    # age: frame cũ bao lâu khi tới client; gap: khoảng cách giữa 2 frame liên tiếp (loop bị chặn -> gap lớn)
+    return np.array(ages), np.diff(received) * 1000
+
+
+def run_phase(base_url, ws_url, cameras, clients, seconds):
+    stop = threading.Event()
+    counter = []
+    threads = [
+        threading.Thread(target=hammer_charts, args=(base_url, cameras, stop, counter), daemon=True)
+        for _ in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        ages, gaps = asyncio.run(measure(ws_url, seconds))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    return ages, gaps, len(counter) / seconds
+
+
+def wait_ready(server, base_url, timeout=60):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and server.poll() is None:
+        try:
+            urllib.request.urlopen(f"{base_url}/charts/vehicle-distribution", timeout=5).read()
+            return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError("Server không khởi động được")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", default="0,2", help="các giá trị TRAFFIC_DB_WORKERS cần so sánh")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--days", type=float, default=1)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--database-url", default=None, help="mặc định SQLite tạm (seed mới)")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench_ws.db")
+        database_url = f"sqlite+aiosqlite:///{path}"
+        os.environ["DATABASE_URL"] = database_url
+
+        from app.db.base import Base, SessionLocal, sync_engine
+        from app.models import traffic_logs, traffic_rollups  # noqa: F401
+        from bench_chart_queries import seed
+
+        Base.metadata.create_all(sync_engine)
+        print(f"Seed {args.days} ngày x {args.cameras} camera vào {path}")
+        seed(SessionLocal, args.days, args.cameras, interval=10)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/ws/frames/0"
+
+    print(
+        f"{'workers':>7} {'phase':>5} {'frame/s':>7} {'age p50':>8} {'age p99':>8}"
+        f" {'gap p50':>8} {'gap p99':>8} {'gap max':>8} {'chart/s':>8}"
+    )
+    for workers in (int(w) for w in args.workers.split(",")):
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url,
+            TRAFFIC_DB_WORKERS=str(workers),
+            CHART_CACHE_TTL_SECONDS="0",
+        )
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port)],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(server, base_url)
+            for phase, clients in (("idle", 0), ("load", args.clients)):
+                ages, gaps, rate = run_phase(base_url, ws_url, args.cameras, clients, args.seconds)
+                age_p50, age_p99 = np.percentile(ages, [50, 99])
+                gap_p50, gap_p99 = np.percentile(gaps, [50, 99])
+                print(
+                    f"{workers:>7} {phase:>5} {len(ages) / args.seconds:7.1f} {age_p50:8.1f} {age_p99:8.1f}"
+                    f" {gap_p50:8.1f} {gap_p99:8.1f} {gaps.max():8.1f} {rate:8.1f}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
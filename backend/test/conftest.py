@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Chạy pytest từ backend/ hay từ gốc repo đều import được `app`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Không cần PostgreSQL cho test: engine trỏ tới file SQLite tạm (đặt trước khi import app.db)
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db")
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """sessionmaker trên DB SQLite riêng của từng test, đã tạo đủ bảng."""
+    from app.db.base import Base
+    from app.models import traffic_logs, traffic_rollups, traffic_peaks, traffic_forecasts, traffic_baselines  # noqa: F401
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'traffic.db'}")
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    engine.dispose()
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.models.traffic_rollups import TrafficRollup1m
+from app.services.traffic_services.baselines import SeasonalBaselines, TDigest
+
+T0 = datetime(2025, 11, 30, 10, 0, tzinfo=timezone.utc)
+
+
+def _digest(values, compression=100):
+    digest = TDigest(compression)
+    for v in values:
+        digest.add(v)
+    return digest
+
+
+def test_quantiles_close_to_numpy():
+    values = np.random.default_rng(0).lognormal(3, 0.6, 20000)
+    digest = _digest(values)
+    qs = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+    # Sai số tính theo rank: t-digest chính xác nhất ở hai đuôi
+    ranks = np.searchsorted(np.sort(values), digest.quantile(qs)) / len(values)
+    assert np.all(np.abs(ranks - qs) < 0.01)
+    assert digest.quantile(0.0) == values.min() and digest.quantile(1.0) == values.max()
+    assert len(digest.means) < 200
+    assert digest.count == len(values)
+
+
+def test_cdf_is_inverse_of_quantile():
+    digest = _digest(np.random.default_rng(1).normal(50, 10, 5000))
+    qs = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+    assert np.allclose(digest.cdf(digest.quantile(qs)), qs, atol=1e-6)
+    assert digest.cdf(-1e9) == 0 and digest.cdf(1e9) == 1
+
+
+def test_bytes_round_trip_keeps_quantiles():
+    digest = _digest(np.random.default_rng(2).poisson(30, 3000))
+    data = digest.to_bytes()
+    assert len(data) == 4 * (2 + 2 * len(digest.means))
+
+    restored = TDigest.from_bytes(data, 100)
+    qs = [0.05, 0.5, 0.95]
+    assert restored.count == digest.count
+    assert np.allclose(restored.quantile(qs), digest.quantile(qs), rtol=1e-5)
+    # Cộng tiếp sau khi nạp lại như sau khi restart API
+    restored.add(1000)
+    assert restored.count == digest.count + 1 and restored.quantile(1.0) == 1000
+
+
+def test_empty_digest_returns_nan():
+    digest = TDigest(100)
+    assert np.isnan(digest.quantile(0.5)) and np.isnan(digest.cdf(3))
+
+
+def _add_rollups(session_factory, rows):
+    db = session_factory()
+    db.add_all([TrafficRollup1m(camera_id=cam, bucket_start=T0 + timedelta(minutes=m), flow_total=flow, samples=1)
+                for cam, m, flow in rows])
+    db.commit()
+    db.close()
+
+
+def test_late_camera_rows_are_not_skipped(session_factory):
+    baselines = SeasonalBaselines(session_factory=session_factory)
+    _add_rollups(session_factory, [(0, m, 10) for m in range(10)] + [(1, m, 20) for m in range(5)])
+    baselines.update(now=T0 + timedelta(minutes=15))
+    assert baselines.watermarks == {0: T0 + timedelta(minutes=9), 1: T0 + timedelta(minutes=4)}
+
+    # Camera 1 ghi trễ các phút 5..9 (đã qua watermark của camera 0), camera 0 có phút mới
+    _add_rollups(session_factory, [(1, m, 20) for m in range(5, 10)] + [(0, 10, 10)])
+    baselines.update(now=T0 + timedelta(minutes=16))
+    assert baselines.watermarks == {0: T0 + timedelta(minutes=10), 1: T0 + timedelta(minutes=9)}
+
+    counts = {cam: sum(d.count for (c, _, _), d in baselines.digests.items() if c == cam) for cam in (0, 1)}
+    # Phút của camera 0 không bị cộng 2 lần
+    assert counts == {0: 11, 1: 10}
+
+    # Nạp lại từ bảng traffic_baselines cho cùng kết quả
+    reloaded = SeasonalBaselines(session_factory=session_factory)
+    reloaded.ensure_loaded()
+    assert reloaded.watermarks == baselines.watermarks
+    assert {k: d.count for k, d in reloaded.digests.items()} == {k: d.count for k, d in baselines.digests.items()}
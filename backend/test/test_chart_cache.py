@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from app.services.traffic_services.chart_cache import ChartCache
+
+REQUEST = SimpleNamespace(headers={})
+
+
+def test_concurrent_requests_compute_once():
+    cache = ChartCache(ttl_seconds=60, max_entries=10)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return JSONResponse({"ok": True})
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get_or_compute(REQUEST, ("chart", 0), 0, compute) for _ in range(5)])
+
+    responses = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(r.headers["X-Cache"] for r in responses) == ["HIT"] * 4 + ["MISS"]
+    assert cache.locks == {}
+
+
+def test_locks_do_not_leak_for_uncached_keys():
+    cache = ChartCache(ttl_seconds=60, max_entries=2)
+
+    async def failing():
+        raise RuntimeError("db down")
+
+    async def not_found():
+        return JSONResponse({"error": "no data"}, status_code=404)
+
+    async def ok():
+        return JSONResponse({"ok": True})
+
+    async def scenario():
+        for i in range(50):
+            with pytest.raises(RuntimeError):
+                await cache.get_or_compute(REQUEST, ("query", i, "error"), 0, failing)
+            await cache.get_or_compute(REQUEST, ("query", i, "404"), 0, not_found)
+            await cache.get_or_compute(REQUEST, ("query", i), 0, ok)
+
+    asyncio.run(scenario())
+    assert cache.locks == {}
+    assert len(cache.entries) == 2
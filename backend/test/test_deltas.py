@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models.traffic_logs import TrafficLog
+from app.services.traffic_services.deltas import DELTA_FIELDS, DeltaTracker
+
+T0 = datetime(2025, 11, 30, 10, 0, tzinfo=timezone.utc)
+
+
+def _row(cam, session, car, motor=0, bus=0, truck=0, minute=0):
+    return {
+        "camera_id": cam, "session_id": session, "timestamp": T0 + timedelta(minutes=minute),
+        "count_car": car, "count_motor": motor, "count_bus": bus, "count_truck": truck,
+        "total_vehicles": car + motor + bus + truck,
+    }
+
+
+def _deltas(row):
+    return [row[field] for field in DELTA_FIELDS.values()]
+
+
+def test_first_row_is_reset_then_differences():
+    tracker = DeltaTracker()
+    rows = [_row(0, "a", 5, 2), _row(0, "a", 8, 2, 1), _row(0, "a", 8, 4, 1)]
+    tracker.commit(tracker.annotate(rows))
+
+    assert [r["is_reset"] for r in rows] == [True, False, False]
+    assert _deltas(rows[0]) == [5, 2, 0, 0, 7]
+    assert _deltas(rows[1]) == [3, 0, 1, 0, 4]
+    assert _deltas(rows[2]) == [0, 2, 0, 0, 2]
+
+
+def test_counter_drop_and_new_session_are_resets():
+    tracker = DeltaTracker()
+    rows = [
+        _row(0, "a", 10), _row(0, "a", 12),
+        _row(0, "a", 3),    # bộ đếm giảm trong cùng session
+        _row(0, "b", 4),    # process camera mới, dù bộ đếm tăng
+        _row(0, "b", 6),
+    ]
+    tracker.annotate(rows)
+    assert [r["is_reset"] for r in rows] == [True, False, True, True, False]
+    assert [r["delta_car"] for r in rows] == [10, 2, 3, 4, 2]
+
+
+def test_cameras_are_tracked_independently():
+    tracker = DeltaTracker()
+    rows = [_row(0, "a", 1), _row(1, "x", 100), _row(0, "a", 3), _row(1, "x", 101)]
+    tracker.annotate(rows)
+    assert [r["delta_car"] for r in rows] == [1, 100, 2, 1]
+
+
+def test_state_changes_only_on_commit():
+    tracker = DeltaTracker()
+    tracker.commit(tracker.annotate([_row(0, "a", 10)]))
+
+    # Batch ghi DB lỗi -> không commit, lần thử lại phải ra đúng delta cũ
+    first = [_row(0, "a", 15)]
+    tracker.annotate(first)
+    retry = [_row(0, "a", 15)]
+    tracker.commit(tracker.annotate(retry))
+    assert first[0]["delta_car"] == retry[0]["delta_car"] == 5
+    assert tracker.last[0]["counts"]["count_car"] == 15
+
+
+def test_prime_continues_from_last_row_in_db(session_factory):
+    db = session_factory()
+    db.add_all([
+        TrafficLog(camera_id=0, timestamp=T0, session_id="a", count_car=4, total_vehicles=4),
+        TrafficLog(camera_id=0, timestamp=T0 + timedelta(minutes=1), session_id="a", count_car=9, total_vehicles=9),
+    ])
+    db.commit()
+
+    tracker = DeltaTracker()
+    tracker.prime(db, [0, 1])
+    db.close()
+    assert tracker.last[0] == {
+        "session_id": "a",
+        "counts": {"count_car": 9, "count_motor": 0, "count_bus": 0, "count_truck": 0, "total_vehicles": 9},
+    }
+    assert 1 not in tracker.last
+
+    rows = [_row(0, "a", 12, minute=2), _row(1, "x", 7, minute=2)]
+    tracker.annotate(rows)
+    assert [r["is_reset"] for r in rows] == [False, True]
+    assert [r["delta_car"] for r in rows] == [3, 7]
@@ -0,0 +1,138 @@
+import queue
+from datetime import datetime, timedelta, timezone
+
+from app.models.traffic_logs import TrafficLog
+from app.models.traffic_peaks import TrafficPeak
+from app.services.road_services.CameraSupervisor import CameraSupervisor
+from app.services.traffic_services.peaks import PeakEventHub, PeakMonitor, StreamingPeakDetector
+from app.services.traffic_services.rollups import as_utc
+
+T0 = 1764496800.0  # 2025-11-30 10:00 UTC
+
+
+def _detector(**kwargs):
+    params = dict(alpha=0.05, enter_z=3.0, exit_z=1.0, warmup=10, min_std=1.0, min_flow=5)
+    params.update(kwargs)
+    return StreamingPeakDetector(**params)
+
+
+def _feed(detector, values, start=0):
+    return [(i, detector.update(T0 + 10 * i, v)) for i, v in enumerate(values, start) if v is not None]
+
+
+def test_warmup_matches_welford_mean_and_variance():
+    detector = _detector(alpha=0.0, warmup=1000)
+    values = [10, 12, 9, 14, 11, 8, 13, 10]
+    for i, v in enumerate(values):
+        assert detector.update(T0 + i, v) is None
+    mean = sum(values) / len(values)
+    assert abs(detector.mean - mean) < 1e-9
+    assert abs(detector.var - sum((v - mean) ** 2 for v in values) / len(values)) < 1e-9
+
+
+def test_peak_start_and_end_with_hysteresis():
+    detector = _detector()
+    baseline = [10, 11, 9, 10, 12, 10, 9, 11, 10, 10] * 3
+    assert all(event is None for _, event in _feed(detector, baseline))
+
+    # z nằm giữa exit_z và enter_z: vẫn trong đợt cao điểm
+    events = [(i, e) for i, e in _feed(detector, [40, 55, 20, 30, 10], start=len(baseline)) if e]
+    assert [(i - len(baseline), kind) for i, (kind, _) in events] == [(0, "peak_start"), (4, "peak_end")]
+    start, end = events[0][1][1], events[1][1][1]
+    assert start["peak_id"] == end["peak_id"]
+    assert start["started_at"] == T0 + 10 * len(baseline)
+    assert end["ended_at"] == T0 + 10 * (len(baseline) + 4)
+    assert end["peak_value"] == 55 and end["samples"] == 4
+    assert detector.active is None
+
+
+def test_no_event_during_warmup_or_below_min_flow():
+    detector = _detector(min_flow=50)
+    assert all(event is None for _, event in _feed(detector, [1, 2, 1, 100, 1, 2, 1, 1, 2, 1, 1, 2, 30, 1]))
+    assert detector.active is None
+
+
+def test_monitor_scales_late_samples_and_resets_on_counter_drop():
+    monitor = PeakMonitor(3, sample_seconds=10, detector=_detector(warmup=1000))
+    assert monitor.observe(T0, 0) is None
+    assert monitor.observe(T0 + 5, 4) is None
+    monitor.observe(T0 + 20, 10)          # sample trễ 20s -> 5 xe / 10s
+    assert monitor.detector.n == 1 and monitor.detector.mean == 5
+    assert monitor.state()["last_sample_at"] == T0 + 20
+
+    monitor.observe(T0 + 25, 2)           # bộ đếm giảm (process restart): mở cửa sổ mới, không tạo sample
+    assert monitor.detector.n == 1 and monitor.state()["last_sample_at"] == T0 + 25
+
+
+def _peak_start(cam=0, peak_id="p1", started_at=T0):
+    return {
+        "event": "peak_start", "camera_id": cam, "peak_id": peak_id, "started_at": started_at,
+        "sample_seconds": 10.0, "value": 40.0, "start_value": 40.0, "peak_value": 40.0,
+        "baseline_mean": 10.0, "baseline_std": 2.0, "z": 15.0, "samples": 1,
+    }
+
+
+def _peaks(session_factory):
+    db = session_factory()
+    try:
+        return {p.peak_uid: p for p in db.query(TrafficPeak).all()}
+    finally:
+        db.close()
+
+
+def test_hub_closes_active_peak_when_camera_stops(session_factory):
+    hub = PeakEventHub(queue.Queue(), session_factory=session_factory)
+    hub.handle(_peak_start(cam=0, peak_id="p1"))
+    hub.handle(_peak_start(cam=1, peak_id="p2"))
+    hub.handle({"event": "camera_stopped", "camera_id": 0, "ended_at": T0 + 300})
+    hub.handle({"event": "camera_stopped", "camera_id": 5, "ended_at": T0 + 300})  # không có đợt mở
+    hub._persist()
+
+    assert [p["peak_id"] for p in hub.snapshot()] == ["p2"]
+    peaks = _peaks(session_factory)
+    assert as_utc(peaks["p1"].ended_at).timestamp() == T0 + 300
+    assert peaks["p2"].ended_at is None
+
+
+def test_supervisor_reports_last_sample_time_on_worker_exit():
+    peak_queue = queue.Queue()
+    info = {"camera_0": {"peak": {"active": True, "last_sample_at": T0 + 120}}}
+    supervisor = CameraSupervisor(info, {}, None, cpu_pinning=False, peak_queue=peak_queue)
+    supervisor._register(0, "video.mp4", [[0, 0], [1, 0], [1, 1]])
+    supervisor.poll()  # process chưa chạy -> coi như đã dừng
+
+    assert peak_queue.get_nowait() == {"event": "camera_stopped", "camera_id": 0, "ended_at": T0 + 120}
+    assert supervisor.workers[0].next_restart_at is not None
+
+
+def test_dangling_peaks_close_at_last_log(session_factory):
+    started = datetime.fromtimestamp(T0, timezone.utc)
+    db = session_factory()
+    db.add_all([
+        TrafficPeak(peak_uid="logged", camera_id=0, started_at=started, sample_seconds=10.0, samples=1),
+        TrafficPeak(peak_uid="no_logs", camera_id=1, started_at=started, sample_seconds=10.0, samples=3),
+        TrafficLog(camera_id=0, timestamp=started - timedelta(minutes=5), session_id="a"),
+        TrafficLog(camera_id=0, timestamp=started + timedelta(minutes=7), session_id="a"),
+        TrafficLog(camera_id=1, timestamp=started - timedelta(minutes=1), session_id="b"),
+    ])
+    db.commit()
+    db.close()
+
+    PeakEventHub(queue.Queue(), session_factory=session_factory)._close_dangling()
+    peaks = _peaks(session_factory)
+    assert as_utc(peaks["logged"].ended_at) == started + timedelta(minutes=7)
+    # Không có log sau lúc bắt đầu: đóng sau các sample đã tính vào đợt
+    assert as_utc(peaks["no_logs"].ended_at) == started + timedelta(seconds=30)
+
+
+def test_hub_drops_bad_event_and_persists_the_rest(session_factory):
+    hub = PeakEventHub(queue.Queue(), session_factory=session_factory)
+    hub.handle(_peak_start(cam=0, peak_id="p1"))
+    hub._persist()
+
+    hub.handle(_peak_start(cam=1, peak_id="p1"))  # trùng peak_uid: vi phạm unique
+    hub.handle(_peak_start(cam=2, peak_id="p2"))
+    hub._persist()
+
+    assert not hub.pending and hub.dropped == 1
+    assert sorted(_peaks(session_factory)) == ["p1", "p2"]
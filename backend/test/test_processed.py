@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from app.services.traffic_services.processed import ProcessedStore, processed_payload, tail_minutes
+
+SCHEMA = pa.schema(
+    [pa.field("timestamp", pa.timestamp("ns", tz="UTC")), pa.field("car", pa.int64()), pa.field("total", pa.int64())],
+    metadata={"classes": "car"},
+)
+T0 = datetime(2025, 11, 30, 10, 0, tzinfo=timezone.utc)
+
+
+def _batch(minutes, cars):
+    ts = [T0 + timedelta(minutes=m) for m in minutes]
+    return pa.record_batch([pa.array(ts, SCHEMA.field("timestamp").type), pa.array(cars), pa.array(cars)],
+                           schema=SCHEMA)
+
+
+def _write(path, *batches, tail=b""):
+    # Giống analyze.write_arrow: schema + các batch nối thêm, không có EOS
+    with open(path, "wb") as f:
+        f.write(SCHEMA.serialize())
+        for batch in batches:
+            f.write(batch.serialize())
+        f.write(tail)
+
+
+def test_appended_batches_keep_last_row_per_timestamp(tmp_path):
+    path = tmp_path / "traffic_data.arrow"
+    _write(path, _batch([0, 5, 10], [1, 2, 3]), _batch([10, 15], [30, 4]))
+
+    table = ProcessedStore(str(path)).load()
+    assert table.column("car").to_pylist() == [1, 2, 30, 4]
+    assert table.column("timestamp").to_pylist()[-1] == T0 + timedelta(minutes=15)
+
+
+def test_partially_written_last_batch_is_ignored(tmp_path):
+    path = tmp_path / "traffic_data.arrow"
+    partial = _batch([20], [9]).serialize().to_pybytes()
+    _write(path, _batch([0, 5], [1, 2]), tail=partial[: len(partial) // 2])
+
+    store = ProcessedStore(str(path))
+    assert store.load().column("car").to_pylist() == [1, 2]
+
+    # File đổi (mtime / size) thì đọc lại
+    _write(path, _batch([0, 5], [1, 2]), _batch([20], [9]))
+    assert store.load().column("car").to_pylist() == [1, 2, 9]
+
+
+def test_missing_file_and_payload(tmp_path):
+    assert ProcessedStore(str(tmp_path / "none.arrow")).load() is None
+
+    path = tmp_path / "traffic_data.arrow"
+    _write(path, _batch([0, 5, 10, 15], [1, 2, 3, 4]))
+    table = tail_minutes(ProcessedStore(str(path)).load(), 10)
+    payload = processed_payload(table, layout="columnar")
+    assert payload["classes"] == ["car"]
+    assert payload["count"] == 3
+    assert payload["values"]["car"].tolist() == [2, 3, 4]
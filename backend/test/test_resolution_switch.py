@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("yt_dlp")
+
+from app.services.road_services import AnalyzeOnRoadBase as base_module  # noqa: E402
+from app.services.road_services.AnalyzeOnRoadBase import AnalyzeOnRoadBase  # noqa: E402
+
+NAMES = {0: "car", 1: "motor"}
+
+
+class FakeTracker:
+    def __init__(self):
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+class FakeModel:
+    def __init__(self):
+        self.predictor = type("Predictor", (), {"trackers": [FakeTracker()]})()
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(base_module, "load_yolo", lambda *args: FakeModel())
+    width, height = base_module.settings_metric_transport.RESOLUTION_LADDER[0]
+    region = [[0, 0], [width // 2, 0], [width // 2, height], [0, height]]
+    return AnalyzeOnRoadBase(video_index=0, path_video="video.mp4", region=region, auto_save=False)
+
+
+def _frame(analyzer, detections):
+    """detections: [(track id, class, cx, cy)] theo toạ độ của độ phân giải đang xử lý."""
+    boxes = np.array([[cx - 5, cy - 5, cx + 5, cy + 5] for _, _, cx, cy in detections], dtype=np.float32)
+    classes = np.array([cls for _, cls, _, _ in detections])
+    ids = np.array([tid for tid, _, _, _ in detections])
+    analyzer._count_objects(boxes.reshape(-1, 4), classes, np.ones(len(detections)), ids, NAMES)
+
+
+def _total(analyzer):
+    return sum(len(ids) for ids in analyzer.counted_ids.values())
+
+
+def test_switch_does_not_recount_vehicles_in_roi(analyzer):
+    w, h = analyzer.process_width, analyzer.process_height
+    inside, outside = (w * 0.25, h * 0.5), (w * 0.75, h * 0.5)
+    _frame(analyzer, [(1, 0, *inside), (2, 1, *outside)])
+    assert _total(analyzer) == 1
+
+    analyzer._switch_resolution(w // 2, h // 2)
+    assert analyzer.model.predictor.trackers[0].resets == 1
+    # Tracker mới đánh lại ID từ 1: xe 1 vẫn trong ROI, xe 2 vẫn ngoài ROI
+    _frame(analyzer, [(1, 0, inside[0] / 2, inside[1] / 2), (2, 1, outside[0] / 2, outside[1] / 2)])
+    assert _total(analyzer) == 1
+    assert analyzer.current_in_roi == {"car": 1}
+
+    # Sau frame ghi nhận lại, xe đi vào ROI vẫn được đếm, kể cả khi tracker dùng lại ID cũ
+    _frame(analyzer, [(1, 0, inside[0] / 2, inside[1] / 2), (2, 1, inside[0] / 2, inside[1] / 2)])
+    _frame(analyzer, [(1, 0, inside[0] / 2, inside[1] / 2), (3, 0, inside[0] / 2, inside[1] / 2)])
+    assert analyzer.counted_ids == {"car": {1, 6}, "motor": {5}}
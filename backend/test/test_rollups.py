@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+
+from app.models.traffic_logs import TrafficLog
+from app.models.traffic_rollups import TrafficRollup1d, TrafficRollup1h, TrafficRollup1m
+from app.services.traffic_services.deltas import DELTA_FIELDS
+from app.services.traffic_services.rollups import backfill_rollups
+
+
+def _log(minutes_ago, total):
+    return TrafficLog(
+        camera_id=0, timestamp=datetime.now(timezone.utc) - timedelta(minutes=minutes_ago),
+        count_car=total, total_vehicles=total,
+    )
+
+
+def test_backfill_continues_from_log_before_window(session_factory):
+    db = session_factory()
+    # Log cũ chưa có delta_*: bộ đếm cộng dồn đã là 500 trước mốc `since` của backfill
+    db.add_all([_log(5 * 24 * 60, 480), _log(4 * 24 * 60, 500), _log(120, 510), _log(60, 530)])
+    db.flush()
+    # Cột delta thêm sau nên log cũ có giá trị NULL
+    db.execute(update(TrafficLog).values(is_reset=None, **dict.fromkeys(DELTA_FIELDS.values())))
+    db.commit()
+
+    backfill_rollups(db, hours=24)
+
+    for model in (TrafficRollup1m, TrafficRollup1h, TrafficRollup1d):
+        assert db.execute(select(func.sum(model.flow_total))).scalar() == 30, model.__tablename__
+    deltas = db.execute(
+        select(TrafficLog.delta_total, TrafficLog.is_reset).order_by(TrafficLog.timestamp)
+    ).all()
+    # Log trước `since` không thuộc đợt backfill
+    assert deltas == [(None, None), (None, None), (10, False), (20, False)]
+    db.close()
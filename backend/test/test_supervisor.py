@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+from app.services.road_services.CameraSupervisor import CameraSupervisor
+
+REGION = [[0, 0], [10, 0], [10, 10]]
+
+
+def _supervisor(monkeypatch):
+    supervisor = CameraSupervisor({}, {}, None, cpu_pinning=False)
+    spawned = []
+    monkeypatch.setattr(supervisor, "_spawn", lambda worker: spawned.append(worker.camera_id))
+    return supervisor, spawned
+
+
+def test_start_all_skips_bad_specs(monkeypatch):
+    supervisor, spawned = _supervisor(monkeypatch)
+    supervisor.start_all([
+        {"camera_id": 0, "url": "a.mp4", "region": REGION},
+        {"camera_id": 0, "url": "dup.mp4", "region": REGION},   # trùng id
+        {"camera_id": 1, "url": "b.mp4", "region": [[0, 0]]},   # region thiếu điểm
+        {"camera_id": 2, "url": "c.mp4", "region": REGION},
+    ])
+    assert spawned == [0, 2]
+    assert supervisor.workers[0].url == "a.mp4"
+
+
+def test_run_does_not_block_event_loop_while_lock_is_held(monkeypatch):
+    supervisor, _ = _supervisor(monkeypatch)
+
+    async def scenario():
+        ticks = 0
+        task = asyncio.create_task(supervisor.run(interval=0.01))
+        # Admin API (thread khác) giữ lock trong lúc dừng process
+        holder = threading.Thread(target=_hold, args=(supervisor._lock, 0.3))
+        holder.start()
+        while holder.is_alive():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        supervisor._stopping = True
+        await asyncio.wait_for(task, 2)
+        return ticks
+
+    assert asyncio.run(scenario()) > 5
+
+
+def _hold(lock, seconds):
+    with lock:
+        time.sleep(seconds)
@@ -1,5 +1,4 @@
 import os
-import json
 import time
 import cv2
 import yaml
@@ -7,6 +6,8 @@ import sys
 import argparse
 from ultralytics import YOLO
 
+from stats_log import StatsLogWriter
+
 # Try to import yt_dlp for resolving YouTube stream URLs. It's optional but
 # recommended when the `source` in config is a YouTube link.
 try:
@@ -231,9 +232,19 @@ def main():
 
     window_name = "Traffic Inference"
 
-    # Đường dẫn ghi thống kê thời gian thực cho backend/frontend
+    # Thống kê thời gian thực: thread riêng ghi log nhị phân (xoay file) + stats.json bản mới nhất
     stats_path = os.path.join(repo_root, "data", "runtime", "stats.json")
     ensure_parent_dir(stats_path)
+    lcfg = cfg.get("stats_log", {}) or {}
+    stats_log = StatsLogWriter(
+        resolve_repo_path(str(lcfg.get("dir", "data/runtime/stats"))),
+        classes=cfg["yolo"].get("classes") or ["car", "motor", "truck", "bus"],
+        rate_hz=float(lcfg.get("rate_hz", 2.0)),
+        max_bytes=int(float(lcfg.get("max_mb", 64)) * 1024 * 1024),
+        rotate_daily=bool(lcfg.get("rotate_daily", True)),
+        snapshot_path=stats_path if lcfg.get("snapshot", True) else None,
+    )
+    stats_log.start()
     t_last = time.time()
     smoothed_fps = fps
 
@@ -355,23 +366,12 @@ def main():
                 txt = f"{k}: {v}"
                 cv2.putText(plotted, txt, (x, y0 + i * dy), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
 
-        # Cập nhật và ghi thống kê ra file JSON cho backend/frontend
+        # Cập nhật thống kê; việc ghi file do thread stats_log làm theo nhịp rate_hz
         now = time.time()
         dt = max(1e-6, now - t_last)
         t_last = now
         smoothed_fps = 0.9 * smoothed_fps + 0.1 * (1.0 / dt)
-
-        stats = {
-            "timestamp": now,
-            "fps": round(float(smoothed_fps), 1),
-            "counts": per_class_counts,
-            "total": int(sum(per_class_counts.values()) if per_class_counts else 0),
-        }
-        try:
-            with open(stats_path, "w", encoding="utf-8") as f:
-                json.dump(stats, f, ensure_ascii=False)
-        except Exception:
-            pass
+        stats_log.submit(now, smoothed_fps, per_class_counts)
 
         if save_output and writer is not None:
             writer.write(plotted)
@@ -384,6 +384,7 @@ def main():
     cap.release()
     if writer is not None:
         writer.release()
+    stats_log.close()
     cv2.destroyAllWindows()
 
 
@@ -0,0 +1,153 @@
+"""
+Log thống kê nhị phân, chỉ ghi nối (append-only), xoay file theo dung lượng / theo ngày.
+
+Mỗi file `stats-YYYYMMDD-HHMMSS-NNN.bin` gồm:
+- header HEADER_SIZE byte: MAGIC (8 byte), uint32 header_size, uint32 record_size,
+  rồi JSON utf-8 {"version", "classes"} và padding \\0;
+- các record kích thước cố định (little-endian, xem `record_dtype`):
+  ts float64 | fps float32 | total uint32 | counts uint32[len(classes)].
+
+Record không có con trỏ / độ dài biến thiên nên bên đọc map thẳng bằng numpy.memmap
+(analysis/load_data.py: read_stats_binary). Record cuối ghi dở (thiếu byte) bị bỏ qua khi đọc.
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b"TSTATS01"
+HEADER_SIZE = 4096
+VERSION = 1
+
+
+def record_dtype(n_classes: int) -> np.dtype:
+    return np.dtype([
+        ("ts", "<f8"),
+        ("fps", "<f4"),
+        ("total", "<u4"),
+        ("counts", "<u4", (n_classes,)),
+    ])
+
+
+def build_header(classes) -> bytes:
+    meta = json.dumps({"version": VERSION, "classes": list(classes)}, ensure_ascii=False).encode("utf-8")
+    head = MAGIC + np.array([HEADER_SIZE, record_dtype(len(classes)).itemsize], dtype="<u4").tobytes() + meta
+    if len(head) > HEADER_SIZE:
+        raise ValueError("Danh sách lớp quá dài cho header stats log")
+    return head.ljust(HEADER_SIZE, b"\0")
+
+
+class StatsLogWriter(threading.Thread):
+    """
+    Thread ghi stats: vòng inference chỉ gọi `submit()` (giữ bản mới nhất trong bộ nhớ, không I/O),
+    thread này lấy mẫu `rate_hz` lần/giây và nối 1 record vào file hiện tại.
+
+    - Xoay file khi vượt `max_bytes` hoặc sang ngày mới (giờ địa phương).
+    - `snapshot_path`: nếu có, ghi kèm JSON bản mới nhất (ghi file tạm rồi os.replace) cùng nhịp,
+      cho ai còn đọc stats.json cũ.
+    """
+
+    def __init__(self, out_dir: str, classes, rate_hz: float = 2.0, max_bytes: int = 64 * 1024 * 1024,
+                 rotate_daily: bool = True, snapshot_path: str | None = None):
+        super().__init__(name="stats-log", daemon=True)
+        self.out_dir = out_dir
+        self.classes = list(classes)
+        self.interval = 1.0 / rate_hz if rate_hz and rate_hz > 0 else 0.0
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.snapshot_path = snapshot_path
+        self.dtype = record_dtype(len(self.classes))
+        self._header = build_header(self.classes)
+        self._lock = threading.Lock()
+        self._latest = None
+        self._stop_event = threading.Event()
+        self._file = None
+        self._day = None
+        self.path = None
+
+    def submit(self, ts: float, fps: float, counts: dict) -> None:
+        with self._lock:
+            self._latest = (ts, fps, dict(counts))
+
+    def _open_new(self, ts: float) -> None:
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.out_dir, exist_ok=True)
+        dt = datetime.fromtimestamp(ts)
+        # Số thứ tự cuối tên để các file xoay trong cùng 1 giây vẫn sắp xếp đúng theo tên
+        n = 0
+        path = os.path.join(self.out_dir, f"stats-{dt:%Y%m%d-%H%M%S}-{n:03d}.bin")
+        while os.path.exists(path):
+            n += 1
+            path = os.path.join(self.out_dir, f"stats-{dt:%Y%m%d-%H%M%S}-{n:03d}.bin")
+        self._file = open(path, "ab")
+        self._file.write(self._header)
+        self._file.flush()
+        self._day = dt.date()
+        self.path = path
+
+    def _need_rotate(self, ts: float) -> bool:
+        if self._file is None:
+            return True
+        if self.rotate_daily and datetime.fromtimestamp(ts).date() != self._day:
+            return True
+        return self.max_bytes > 0 and self._file.tell() + self.dtype.itemsize > self.max_bytes
+
+    def _write(self, sample) -> None:
+        ts, fps, counts = sample
+        if self._need_rotate(ts):
+            self._open_new(ts)
+        rec = np.zeros(1, dtype=self.dtype)
+        rec["ts"] = ts
+        rec["fps"] = fps
+        rec["total"] = sum(counts.values())
+        rec["counts"] = [counts.get(c, 0) for c in self.classes]
+        self._file.write(rec.tobytes())
+        self._file.flush()
+        if self.snapshot_path:
+            self._write_snapshot(ts, fps, counts)
+
+    def _write_snapshot(self, ts, fps, counts) -> None:
+        stats = {
+            "timestamp": ts,
+            "fps": round(float(fps), 1),
+            "counts": counts,
+            "total": int(sum(counts.values())),
+        }
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False)
+        os.replace(tmp, self.snapshot_path)
+
+    def _take(self):
+        with self._lock:
+            sample, self._latest = self._latest, None
+        return sample
+
+    def run(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                t0 = time.monotonic()
+                sample = self._take()
+                if sample is not None:
+                    try:
+                        self._write(sample)
+                    except Exception as e:
+                        print("Warning: không ghi được stats log:", e)
+                self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - t0)) or 0.001)
+            # Ghi nốt mẫu cuối trước khi thoát
+            sample = self._take()
+            if sample is not None:
+                self._write(sample)
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)